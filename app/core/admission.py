@@ -0,0 +1,227 @@
+"""
+Admission control: a token bucket per user, a cap on requests in flight, and early
+load shedding while the database pool is saturated.
+"""
+import logging
+import math
+import time
+from typing import Callable, Optional, Tuple
+
+from jose import JWTError
+
+from . import metrics
+from .cache import LRUCache
+from .config import settings
+from .security.tokens import request_claims
+from ..db.base import engine
+from ..db.pool import pool_status
+
+logger = logging.getLogger(__name__)
+
+EXEMPT_PREFIXES = ("/health", "/metrics", "/static")
+# Long-lived streams, capped by their own limit rather than MAX_IN_FLIGHT.
+STREAM_PATHS = ("/booking/events",)
+
+RATE_LIMITED = "rate_limit"
+IN_FLIGHT = "in_flight"
+POOL_WAIT = "pool_wait"
+
+REJECTED = metrics.Counter(
+    "http_requests_rejected_total", "Requests turned away by admission control.", ("reason",))
+
+
+class InMemoryTokenBuckets:
+    """
+    Token buckets held by this process. With several workers each one keeps its own
+    buckets, so a user may get up to one bucket per worker.
+    """
+
+    def __init__(self, maxsize: int, clock: Callable[[], float] = time.monotonic):
+        """
+        :param maxsize: Buckets kept; an evicted bucket starts over full.
+        :param clock: Seconds from a monotonic clock.
+        """
+        self._buckets = LRUCache(maxsize)
+        self._clock = clock
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take a token from the bucket of key.
+
+        :param key: Whose bucket.
+        :param rate: Tokens added per second.
+        :param burst: Bucket capacity.
+        :return: 0 if a token was taken, otherwise the seconds until one is available.
+        """
+        now = self._clock()
+        tokens, updated = self._buckets.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets.set(key, (tokens, now))
+        return wait
+
+
+# Refill, take and store in one step on the server, timed by the server clock so
+# workers on different hosts agree. The wait goes back as a string: Lua numbers
+# returned to Redis are truncated to integers.
+_REDIS_TAKE = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisTokenBuckets:
+    """
+    Token buckets shared by every worker through Redis. Needs the redis package.
+    """
+
+    KEY_PREFIX = "admission:bucket:"
+
+    def __init__(self, url: str):
+        """
+        :param url: Redis URL, e.g. redis://localhost:6379/0.
+        """
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError("ADMISSION_BACKEND_URL points at Redis, which requires the redis package")
+        self._client = redis.from_url(url)
+        self._take = self._client.register_script(_REDIS_TAKE)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return float(await self._take(keys=[self.KEY_PREFIX + key], args=[rate, burst]))
+
+
+def create_backend(url: str = settings.admission_backend_url):
+    """
+    Token bucket store for the configured backend.
+
+    :param url: Empty for in-process buckets, or a redis:// / rediss:// URL for shared ones.
+    :return:
+    """
+    if not url:
+        return InMemoryTokenBuckets(settings.rate_limit_cache_size)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisTokenBuckets(url)
+    raise ValueError(f"Unsupported ADMISSION_BACKEND_URL scheme: {url.split(':', 1)[0]}")
+
+
+def _client_key(scope) -> str:
+    """
+    Bucket key of a request: the user of a valid bearer token, else the client address.
+    The decoded claims stay in the scope state, so get_current_user does not decode again.
+    """
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    payload = request_claims(scope, token)
+                except JWTError:
+                    break
+                user = payload.get("uid") or payload.get("sub")
+                if user is not None:
+                    return f"user:{user}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def _pool_overloaded() -> Optional[float]:
+    """
+    Recent checkout wait of the primary pool if every connection is in use and requests
+    have recently been waiting longer than ADMISSION_POOL_WAIT_SECONDS, else None.
+    The wait average only moves on checkouts, so it is trusted only while the pool is full.
+    """
+    status = pool_status(engine.pool)
+    if status.get("saturation", 0.0) < 1.0:
+        return None
+    wait = status["wait_seconds_recent"]
+    return wait if wait >= settings.admission_pool_wait_seconds else None
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware that rejects requests before they reach a handler or take a
+    database connection. Checks run cheapest and most global first:
+
+    * 503 while the database pool is saturated and checkouts are waiting too long;
+    * 503 once MAX_IN_FLIGHT requests are being served by this worker;
+    * 429 once a user or anonymous client has spent its token bucket.
+
+    Rejections carry Retry-After. Health checks and metrics are never rejected.
+    """
+
+    def __init__(self, app, backend=None):
+        self.app = app
+        self.backend = backend if backend is not None else create_backend()
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        rejection = await self._check(scope)
+        if rejection is not None:
+            REJECTED.inc(reason=rejection[0])
+            await _reject(send, *rejection[1:])
+            return
+
+        if scope["path"] in STREAM_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _check(self, scope) -> Optional[Tuple[str, int, str, float]]:
+        wait = _pool_overloaded()
+        if wait is not None:
+            return POOL_WAIT, 503, "Database is overloaded, retry later", wait
+        # Event streams stay open as long as their client listens and are not counted,
+        # so they must not be refused because short requests filled the cap either.
+        if scope["path"] not in STREAM_PATHS and self.in_flight >= settings.max_in_flight:
+            return IN_FLIGHT, 503, "Too many requests in flight, retry later", 1.0
+        if settings.rate_limit_per_second > 0:
+            try:
+                wait = await self.backend.take(
+                    _client_key(scope), settings.rate_limit_per_second, settings.rate_limit_burst)
+            except Exception:
+                # A shared backend that is down must not take the API down with it.
+                logger.warning("Rate limit backend failed; admitting request", exc_info=True)
+                return None
+            if wait > 0:
+                return RATE_LIMITED, 429, "Rate limit exceeded", wait
+        return None
+
+
+async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+    body = b'{"detail":"' + detail.encode() + b'"}'
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
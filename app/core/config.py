@@ -1,9 +1,125 @@
 import os
+from dataclasses import dataclass, fields
+from typing import Optional, Union, get_args, get_origin, get_type_hints
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
-DATABASE_URL = os.getenv('DATABASE_URL')
-SECRET_KEY = os.getenv('SECRET_KEY')
-ALGORITHM = 'HS256'
-ACCESS_TOKEN_EXPIRE_MINUTES = 600
\ No newline at end of file
+_TRUE = {"1", "true", "yes", "on"}
+_FALSE = {"0", "false", "no", "off"}
+
+
+def _parse(name: str, raw: str, kind: type):
+    """
+    Convert an environment variable to the type of its settings field.
+    """
+    if kind is bool:
+        value = raw.strip().lower()
+        if value in _TRUE:
+            return True
+        if value in _FALSE:
+            return False
+        raise ValueError(f"{name} must be a boolean, got {raw!r}")
+    try:
+        return kind(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be {kind.__name__}, got {raw!r}")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Application settings. Every field can be overridden by the environment variable
+    of the same name in upper case, e.g. DB_POOL_SIZE.
+    """
+    database_url: Optional[str] = None
+    secret_key: Optional[str] = None
+    algorithm: str = 'HS256'
+    access_token_expire_minutes: int = 600
+
+    db_echo: bool = False
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_connect_timeout: float = 10.0
+    # asyncpg prepared-statement cache per connection; 0 behind pgbouncer in transaction mode.
+    db_statement_cache_size: int = 100
+    # Comma-separated URLs of read replicas; empty sends reads to the primary.
+    db_replica_urls: str = ""
+    db_replica_retry_after: float = 30.0
+    read_your_writes_window: float = 5.0
+
+    slow_request_seconds: float = 1.0
+    slow_request_max_statements: int = 50
+
+    admission_enabled: bool = True
+    # Per-user token bucket; 0 turns rate limiting off.
+    rate_limit_per_second: float = 50.0
+    rate_limit_burst: int = 100
+    rate_limit_cache_size: int = 100000
+    # Requests served at once by one worker.
+    max_in_flight: int = 512
+    # Shed load while the pool is full and checkouts recently waited this long.
+    admission_pool_wait_seconds: float = 0.5
+    # Empty keeps token buckets per worker; a redis:// URL shares them.
+    admission_backend_url: str = ""
+
+    # Background jobs run at once by each worker process; 0 leaves them to job workers.
+    job_workers: int = 2
+    # Queued and running jobs allowed per user.
+    job_max_pending: int = 10
+    job_timeout_seconds: float = 300.0
+    job_max_attempts: int = 3
+    job_poll_seconds: float = 2.0
+    job_result_ttl: float = 86400.0
+    # Largest result stored for a job; bigger exports fail and are left to the streaming endpoints.
+    job_max_result_bytes: int = 32 * 1024 * 1024
+
+    # Deleted tickets are reported to syncing clients this long; older cursors sync from scratch.
+    sync_tombstone_ttl: float = 30 * 86400.0
+
+    # Ticket change streams: events buffered per stream before a slow client is dropped.
+    event_queue_size: int = 100
+    event_max_subscribers: int = 1000
+    event_heartbeat_seconds: float = 15.0
+    # Relay change events between workers with LISTEN/NOTIFY when the database is Postgres.
+    event_relay: bool = True
+
+    map_cache_size: int = 256
+    password_hash_workers: int = min(4, os.cpu_count() or 1)
+    password_hash_max_queue: int = 64
+    principal_cache_size: int = 10000
+    principal_cache_ttl: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """
+        Build settings from the environment, falling back to the field defaults.
+        """
+        hints = get_type_hints(cls)
+        values = {}
+        for field in fields(cls):
+            raw = os.getenv(field.name.upper())
+            if raw is None:
+                continue
+            kind = hints[field.name]
+            if get_origin(kind) is Union:
+                kind = next(arg for arg in get_args(kind) if arg is not type(None))
+            values[field.name] = _parse(field.name.upper(), raw, kind)
+        return cls(**values)
+
+
+settings = Settings.from_env()
+
+DATABASE_URL = settings.database_url
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+MAP_CACHE_SIZE = settings.map_cache_size
+PASSWORD_HASH_WORKERS = settings.password_hash_workers
+PASSWORD_HASH_MAX_QUEUE = settings.password_hash_max_queue
+PRINCIPAL_CACHE_SIZE = settings.principal_cache_size
+PRINCIPAL_CACHE_TTL = settings.principal_cache_ttl
@@ -0,0 +1,170 @@
+"""
+Per-request latency, in-flight and SQL statement metrics, plus a slow-request log.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+UNMATCHED_ROUTE = "<unmatched>"
+SLOW_LOG_SQL_LENGTH = 500
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+REQUEST_DURATION = metrics.Histogram(
+    "http_request_duration_seconds", "Time from request start until the response body is sent.",
+    ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = metrics.Gauge(
+    "http_requests_in_flight", "Requests currently being served.", ("method",))
+REQUEST_STATEMENTS = metrics.Histogram(
+    "http_request_sql_statements", "SQL statements executed per request.", ("method", "route"),
+    buckets=STATEMENT_COUNT_BUCKETS)
+REQUEST_SQL_DURATION = metrics.Histogram(
+    "http_request_sql_duration_seconds", "Time spent executing SQL per request.", ("method", "route"))
+STATEMENT_DURATION = metrics.Histogram(
+    "sql_statement_duration_seconds", "Duration of single SQL statements.", ("engine",))
+SLOW_REQUESTS = metrics.Counter(
+    "http_slow_requests_total", "Requests slower than SLOW_REQUEST_SECONDS.", ("method", "route"))
+
+
+class RequestStats:
+    """
+    SQL executed on behalf of one request.
+    """
+
+    __slots__ = ("statements", "sql_seconds", "count")
+
+    def __init__(self):
+        self.statements: List[Tuple[str, float]] = []
+        self.sql_seconds = 0.0
+        self.count = 0
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.sql_seconds += seconds
+        if len(self.statements) < settings.slow_request_max_statements:
+            self.statements.append((statement, seconds))
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """
+    Time every statement the engine runs and charge it to the current request, if any.
+
+    :param engine: The engine to instrument.
+    :param name: Engine label in the exported metrics, e.g. primary or replica-0.
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["statement_started"].pop()
+        STATEMENT_DURATION.observe(seconds, engine=name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.record(statement, seconds)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(context):
+        # A failed statement never reaches after_cursor_execute; drop its start time so
+        # the next statement on the connection is not timed from it.
+        started = context.connection.info.get("statement_started") if context.connection is not None else None
+        if started and context.statement is not None:
+            started.pop()
+
+
+_route_labels: Dict[int, str] = {}
+
+
+def _route_label(scope) -> str:
+    """
+    Path template of the route that served the request, which keeps label cardinality
+    bounded. Routes of an included router may only know their path below the router's
+    prefix; the prefix is then the part of the request path the route's pattern did
+    not consume. It is the same on every request, so it is worked out once per route.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return UNMATCHED_ROUTE
+    label = _route_labels.get(id(route))
+    if label is None:
+        label = template
+        path, pattern = scope["path"], getattr(route, "path_regex", None)
+        if pattern is not None:
+            for index in (i for i, char in enumerate(path) if char == "/"):
+                if pattern.match(path[index:]):
+                    label = path[:index] + template
+                    break
+        _route_labels[id(route)] = label
+    return label
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware so streamed responses pass through unbuffered; the
+    recorded duration covers the whole body.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        event_stream = False
+
+        async def send_wrapper(message):
+            nonlocal status, event_stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                event_stream = any(name == b"content-type" and value.startswith(b"text/event-stream")
+                                   for name, value in message.get("headers", ()))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = _route_label(scope)
+            REQUESTS_IN_FLIGHT.dec(method=method)
+            REQUEST_DURATION.observe(duration, method=method, route=route, status=str(status))
+            REQUEST_STATEMENTS.observe(stats.count, method=method, route=route)
+            REQUEST_SQL_DURATION.observe(stats.sql_seconds, method=method, route=route)
+            # Event streams stay open by design; their duration says nothing about speed.
+            if duration >= settings.slow_request_seconds and not event_stream:
+                SLOW_REQUESTS.inc(method=method, route=route)
+                _log_slow_request(method, scope.get("path", ""), route, status, duration, stats)
+
+
+def _log_slow_request(method: str, path: str, route: str, status: int, duration: float,
+                      stats: RequestStats) -> None:
+    lines = [f"  {seconds * 1000:.1f}ms {' '.join(statement.split())[:SLOW_LOG_SQL_LENGTH]}"
+             for statement, seconds in stats.statements]
+    if stats.count > len(stats.statements):
+        lines.append(f"  ... {stats.count - len(stats.statements)} more statements")
+    logger.warning("Slow request %s %s (route %s) -> %s in %.1fms, %d SQL statements in %.1fms\n%s",
+                   method, path, route, status, duration * 1000, stats.count,
+                   stats.sql_seconds * 1000, "\n".join(lines))
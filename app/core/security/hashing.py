@@ -0,0 +1,93 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from ..config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE
+
+T = TypeVar("T")
+
+pdw_context = CryptContext(schemes=['bcrypt'], deprecated="auto")
+
+# bcrypt releases the GIL, so a small thread pool hashes in parallel while the event
+# loop keeps serving requests. The semaphore caps concurrent hashes at the pool size;
+# callers beyond that wait on it, and once PASSWORD_HASH_MAX_QUEUE callers are waiting
+# new ones are rejected instead of piling up.
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+_stats = {
+    "in_flight": 0,
+    "waiting": 0,
+    "max_waiting": 0,
+    "completed": 0,
+    "rejected": 0,
+    "wait_seconds_total": 0.0,
+    "hash_seconds_total": 0.0,
+}
+
+
+async def _run(func: Callable[..., T], *args) -> T:
+    """
+    Run a hashing function on the hashing pool, waiting for a free slot.
+
+    :param func: The blocking function to run.
+    :param args: Its arguments.
+    :return: The function result.
+    """
+    if _stats["waiting"] >= PASSWORD_HASH_MAX_QUEUE:
+        _stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent authentication requests",
+            headers={"Retry-After": "1"},
+        )
+
+    queued = time.perf_counter()
+    _stats["waiting"] += 1
+    _stats["max_waiting"] = max(_stats["max_waiting"], _stats["waiting"])
+    try:
+        await _slots.acquire()
+    finally:
+        _stats["waiting"] -= 1
+
+    started = time.perf_counter()
+    _stats["wait_seconds_total"] += started - queued
+    _stats["in_flight"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _slots.release()
+        _stats["in_flight"] -= 1
+        _stats["completed"] += 1
+        _stats["hash_seconds_total"] += time.perf_counter() - started
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hash a password on the hashing pool.
+
+    :param password: The plain password.
+    :return: The hash.
+    """
+    return await _run(pdw_context.hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify a password against a hash on the hashing pool.
+
+    :param plain_password: The plain password.
+    :param hashed_password: The stored hash.
+    :return: True if they match.
+    """
+    return await _run(pdw_context.verify, plain_password, hashed_password)
+
+
+def hash_pool_stats() -> Dict[str, float]:
+    """
+    Snapshot of the hashing pool: current queue depth and concurrency plus cumulative counters.
+    """
+    return {"workers": PASSWORD_HASH_WORKERS, "max_queue": PASSWORD_HASH_MAX_QUEUE, **_stats}
@@ -0,0 +1,43 @@
+"""
+Access token verification shared by admission control and get_current_user, so the
+bearer token of a request is decoded once however many layers look at it.
+"""
+from typing import Dict, MutableMapping
+
+from jose import jwt
+
+from ..config import SECRET_KEY, ALGORITHM
+
+# Key of the ASGI scope state, which backs request.state, holding the bearer token of
+# the request and its claims once decoded.
+CLAIMS_STATE_KEY = "token_claims"
+
+
+def decode_token(token: str) -> Dict:
+    """
+    Verify an access token.
+
+    :param token: The encoded JWT.
+    :return: Its claims.
+    :raises JWTError: If the token is malformed, forged or expired.
+    """
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def request_claims(scope: MutableMapping, token: str) -> Dict:
+    """
+    Claims of the request's bearer token, decoded on first use and then kept in the
+    scope state for the rest of the request.
+
+    :param scope: The ASGI scope of the request.
+    :param token: The bearer token sent with it.
+    :return: Its claims.
+    :raises JWTError: If the token is malformed, forged or expired.
+    """
+    state = scope.setdefault("state", {})
+    cached = state.get(CLAIMS_STATE_KEY)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    claims = decode_token(token)
+    state[CLAIMS_STATE_KEY] = (token, claims)
+    return claims
@@ -0,0 +1,117 @@
+"""
+Cold-start profile of the API: import time per module and time to the first response.
+
+Runs a fresh interpreter, so nothing is warm from the calling process:
+
+    python -m app.core.startup_profile [--top 25] [--path /] [--json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+# Runs in the child. The client library is imported after the measured import of the
+# app, so it does not count towards the app's import time.
+_CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+import httpx
+
+
+async def first_request():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get(sys.argv[1])
+    return ready, response.status_code
+
+
+request_started = time.perf_counter()
+ready, status = asyncio.run(first_request())
+done = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "startup_seconds": ready - request_started,
+    "first_request_seconds": done - request_started,
+    "status": status,
+}))
+"""
+
+
+def parse_importtime(output: str) -> List[Dict]:
+    """
+    Parse the stderr of `python -X importtime`.
+
+    :param output:
+    :return: One entry per module with its own and cumulative import time in seconds.
+    """
+    modules = []
+    for line in output.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules.append({"module": name, "self_seconds": int(own) / 1e6,
+                            "cumulative_seconds": int(cumulative) / 1e6, "depth": len(indent) // 2})
+    return modules
+
+
+def profile_startup(path: str = "/", python: str = sys.executable) -> Dict:
+    """
+    Start the app in a fresh interpreter, import it and serve one request.
+
+    :param path: The path of the first request.
+    :param python: Interpreter to run.
+    :return: Import, startup and first request times, and the per-module import times.
+    """
+    started = time.perf_counter()
+    child = subprocess.run([python, "-X", "importtime", "-c", _CHILD, path],
+                           capture_output=True, text=True, cwd=PROJECT_ROOT)
+    process_seconds = time.perf_counter() - started
+    if child.returncode != 0:
+        raise RuntimeError(f"Startup failed:\n{child.stderr[-4000:]}")
+
+    timings = json.loads(child.stdout.strip().splitlines()[-1])
+    return {**timings, "process_seconds": process_seconds, "modules": parse_importtime(child.stderr)}
+
+
+def _report(profile: Dict, top: int) -> str:
+    lines = [
+        f"app import         {profile['import_seconds'] * 1000:8.1f} ms",
+        f"startup (lifespan) {profile['startup_seconds'] * 1000:8.1f} ms",
+        f"first request      {profile['first_request_seconds'] * 1000:8.1f} ms  (status {profile['status']})",
+        f"whole process      {profile['process_seconds'] * 1000:8.1f} ms",
+        "",
+        f"Slowest {top} imports by cumulative time:",
+        f"{'cumulative':>12} {'self':>10}  module",
+    ]
+    slowest = sorted(profile["modules"], key=lambda module: module["cumulative_seconds"], reverse=True)[:top]
+    for module in slowest:
+        lines.append(f"{module['cumulative_seconds'] * 1000:9.1f} ms {module['self_seconds'] * 1000:7.1f} ms  "
+                     f"{'  ' * module['depth']}{module['module']}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=25, help="modules to list")
+    parser.add_argument("--path", default="/", help="path of the first request")
+    parser.add_argument("--json", action="store_true", help="print the full profile as JSON")
+    args = parser.parse_args()
+
+    profile = profile_startup(args.path)
+    print(json.dumps(profile, indent=2) if args.json else _report(profile, args.top))
+
+
+if __name__ == "__main__":
+    main()
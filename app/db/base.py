@@ -1,9 +1,57 @@
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from ..core.config import DATABASE_URL
+from ..core.config import settings, Settings
+from .pool import InstrumentedQueuePool
 
-engine = create_async_engine(DATABASE_URL, future=True, echo=True)
+
+def engine_options(database_url: str, config: Settings = settings) -> dict:
+    """
+    Keyword arguments for create_async_engine derived from the settings.
+
+    :param database_url: The database URL the engine connects to.
+    :param config: The settings to use.
+    :return: Engine options.
+    """
+    url = make_url(database_url)
+    options = {"future": True, "echo": config.db_echo}
+
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite is served by a single shared connection; there is no pool to size.
+        return options
+
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_timeout=config.db_pool_timeout,
+        pool_recycle=config.db_pool_recycle,
+        pool_pre_ping=config.db_pool_pre_ping,
+    )
+
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "statement_cache_size": config.db_statement_cache_size,
+            "timeout": config.db_connect_timeout,
+        }
+    elif url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"timeout": config.db_connect_timeout}
+
+    return options
+
+
+def connect_url(database_url: str, config: Settings = settings) -> str:
+    """
+    Add driver options that have to travel in the URL.
+    """
+    url = make_url(database_url)
+    if url.get_driver_name() == "asyncpg" and "prepared_statement_cache_size" not in url.query:
+        url = url.update_query_dict({"prepared_statement_cache_size": str(config.db_statement_cache_size)})
+    return url.render_as_string(hide_password=False)
+
+
+engine = create_async_engine(connect_url(settings.database_url), **engine_options(settings.database_url))
 AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 Base = declarative_base()
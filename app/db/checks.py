@@ -0,0 +1,81 @@
+"""
+Schema checks and maintenance that run against a live database.
+
+    python -m app.db.checks
+    python -m app.db.checks --recompute-stats
+"""
+import argparse
+import asyncio
+import sys
+from typing import List, Tuple
+
+from sqlalchemy import inspect, text
+
+from .base import engine
+from ..services.stats_service import SQLITE_STATS_BACKFILL, POSTGRES_STATS_BACKFILL
+
+
+def find_unindexed_foreign_keys(connection) -> List[Tuple[str, List[str]]]:
+    """
+    Find foreign keys whose columns are not the leading columns of any index,
+    primary key or unique constraint on their table.
+
+    :param connection: A synchronous connection.
+    :return: (table, constrained columns) for every uncovered foreign key.
+    """
+    inspector = inspect(connection)
+    missing = []
+
+    for table in inspector.get_table_names():
+        covering = [index["column_names"] for index in inspector.get_indexes(table)]
+        covering += [constraint["column_names"] for constraint in inspector.get_unique_constraints(table)]
+        covering.append(inspector.get_pk_constraint(table)["constrained_columns"])
+
+        for foreign_key in inspector.get_foreign_keys(table):
+            columns = foreign_key["constrained_columns"]
+            if not any(set(index[:len(columns)]) == set(columns) for index in covering):
+                missing.append((table, columns))
+
+    return missing
+
+
+def recompute_ticket_stats(connection) -> int:
+    """
+    Rebuild ticket_stats from the tickets. The triggers keep the coordinate sums by
+    adding and subtracting floats, which drifts from the exact totals over many writes;
+    run this periodically, e.g. nightly, to start them over. Ticket writes wait for it.
+
+    :param connection: A synchronous connection inside a transaction.
+    :return: The number of summary rows written.
+    """
+    backfill = {"sqlite": SQLITE_STATS_BACKFILL, "postgresql": POSTGRES_STATS_BACKFILL}.get(connection.dialect.name)
+    if backfill is None:
+        return 0
+    if connection.dialect.name == "postgresql":
+        # Readers go on; writers, whose triggers would update the summary, wait.
+        connection.execute(text("LOCK TABLE tickets IN SHARE MODE"))
+    connection.execute(text("DELETE FROM ticket_stats"))
+    return connection.execute(text(backfill)).rowcount
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recompute-stats", action="store_true",
+                        help="also rebuild the ticket_stats summary from the tickets")
+    args = parser.parse_args()
+
+    async with engine.connect() as connection:
+        missing = await connection.run_sync(find_unindexed_foreign_keys)
+    if args.recompute_stats:
+        async with engine.begin() as connection:
+            rows = await connection.run_sync(recompute_ticket_stats)
+        print(f"ticket_stats: recomputed {rows} rows")
+    await engine.dispose()
+
+    for table, columns in missing:
+        print(f"{table}: foreign key ({', '.join(columns)}) has no index")
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
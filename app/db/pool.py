@@ -0,0 +1,65 @@
+import time
+from typing import Dict
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Weight of the latest checkout in the moving average of checkout wait time.
+WAIT_EWMA_ALPHA = 0.2
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Async queue pool that records how long checkouts wait for a connection.
+    """
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        self.max_overflow = max_overflow
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_seconds_ewma = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            self.wait_seconds_ewma += WAIT_EWMA_ALPHA * (waited - self.wait_seconds_ewma)
+
+
+def pool_status(pool) -> Dict[str, float]:
+    """
+    Current occupancy of a pool and, for an InstrumentedQueuePool, its checkout wait statistics.
+
+    :param pool: The engine's pool.
+    :return: Pool size, checked-out connections, saturation and wait times.
+    """
+    if not isinstance(pool, InstrumentedQueuePool):
+        return {"pool": type(pool).__name__}
+
+    capacity = pool.size() + max(pool.max_overflow, 0)
+    checked_out = pool.checkedout()
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": pool.max_overflow,
+        "checked_out": checked_out,
+        "idle": pool.checkedin(),
+        "saturation": checked_out / capacity if capacity else 0.0,
+        "checkouts": pool.checkouts,
+        "checkout_timeouts": pool.checkout_timeouts,
+        "wait_seconds_total": pool.wait_seconds_total,
+        "wait_seconds_max": pool.wait_seconds_max,
+        "wait_seconds_avg": pool.wait_seconds_total / pool.checkouts if pool.checkouts else 0.0,
+        "wait_seconds_recent": pool.wait_seconds_ewma,
+    }
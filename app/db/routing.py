@@ -0,0 +1,134 @@
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+from fastapi import Depends
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..core.cache import LRUCache
+from ..core.config import settings
+from ..models.user import User
+from ..services.auth_service import get_current_user
+from .base import AsyncSessionLocal, engine_options, connect_url
+
+logger = logging.getLogger(__name__)
+
+PINNED_USERS_CACHE_SIZE = 100000
+
+
+class ReplicaRouter:
+    """
+    Round-robin over read replicas. A replica that fails to hand out a connection is
+    skipped for retry_after seconds; with no replica available reads go to the primary.
+    """
+
+    def __init__(self, urls: List[str], retry_after: float):
+        self.engines = [create_async_engine(connect_url(url), **engine_options(url)) for url in urls]
+        self.sessionmakers = [sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+                              for engine in self.engines]
+        self.retry_after = retry_after
+        self._down_until = [0.0] * len(self.engines)
+        self._turn = itertools.count()
+
+    def candidates(self) -> List[int]:
+        """
+        Indexes of the healthy replicas, starting with the one whose turn it is.
+        """
+        if not self.engines:
+            return []
+        start = next(self._turn) % len(self.engines)
+        now = time.monotonic()
+        order = [(start + offset) % len(self.engines) for offset in range(len(self.engines))]
+        return [index for index in order if self._down_until[index] <= now]
+
+    def mark_down(self, index: int) -> None:
+        self._down_until[index] = time.monotonic() + self.retry_after
+        logger.warning("Read replica %s is unavailable, skipping it for %ss",
+                       self.engines[index].url.render_as_string(), self.retry_after)
+
+    def status(self) -> List[dict]:
+        """
+        Health of each replica, identified by its position in DB_REPLICA_URLS only:
+        the status is served without authentication, so hosts stay out of it.
+        """
+        now = time.monotonic()
+        return [{"replica": index, "healthy": down_until <= now} for index, down_until in enumerate(self._down_until)]
+
+
+replicas = ReplicaRouter([url.strip() for url in settings.db_replica_urls.split(",") if url.strip()],
+                         settings.db_replica_retry_after)
+
+# Users who wrote recently read from the primary until their entry expires, so they
+# see their own writes despite replication lag. Tracked per worker process.
+_pinned_users = LRUCache(maxsize=PINNED_USERS_CACHE_SIZE, ttl=settings.read_your_writes_window)
+
+
+def mark_write(user_id: int) -> None:
+    """
+    Pin a user to the primary for the read-your-writes window. Call after a write commits.
+
+    :param user_id: The user who wrote.
+    """
+    if replicas.engines:
+        _pinned_users.set(user_id, True)
+
+
+def read_session_factory(user_id: int) -> sessionmaker:
+    """
+    Session factory for a user's reads, without a health check.
+    For readers that open their own sessions, such as streams.
+
+    :param user_id: The reading user.
+    :return: A replica session factory, or the primary one if the user is pinned or no replica is up.
+    """
+    if _pinned_users.get(user_id):
+        return AsyncSessionLocal
+    candidates = replicas.candidates()
+    return replicas.sessionmakers[candidates[0]] if candidates else AsyncSessionLocal
+
+
+async def _connected_replica_session() -> Optional[AsyncSession]:
+    for index in replicas.candidates():
+        session = replicas.sessionmakers[index]()
+        try:
+            await session.connection()
+        except (SQLAlchemyError, OSError):
+            await session.close()
+            replicas.mark_down(index)
+            continue
+        return session
+    return None
+
+
+@asynccontextmanager
+async def read_session(user_id: int) -> AsyncIterator[AsyncSession]:
+    """
+    Open a session for a user's reads.
+    Reads go to a healthy replica unless the user wrote within the read-your-writes window.
+
+    :param user_id: The reading user.
+    :return: session
+    """
+    session = None
+    if not _pinned_users.get(user_id):
+        session = await _connected_replica_session()
+    if session is None:
+        session = AsyncSessionLocal()
+
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def get_read_db(current_user: User = Depends(get_current_user)) -> AsyncIterator[AsyncSession]:
+    """
+    Get a database session for read-only endpoints, see read_session.
+    :return: session
+    """
+    async with read_session(current_user.id) as session:
+        yield session
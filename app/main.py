@@ -1,30 +1,48 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-import asyncio
 from fastapi.staticfiles import StaticFiles
 
-from .api.endpoints import *
-from .routers import auth, booking
-from .db.base import Base, engine
+from .core.admission import AdmissionMiddleware
+from .core.config import settings
+from .core.instrumentation import MetricsMiddleware, instrument_engine
+from .db.base import engine
+from .db.routing import replicas
+from .routers import auth, booking, health, jobs, metrics
+from .services import event_service, job_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_service.runner.start()
+    event_service.start_relay()
+    yield
+    await event_service.stop_relay()
+    await job_service.runner.stop()
+
 
-app = FastAPI(title="BookingAPI")
+app = FastAPI(title="BookingAPI", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 
-# async def init_db():
-#     async with engine.begin() as conn:
-#         await conn.run_sync(Base.metadata.drop_all)
-#         await conn.run_sync(Base.metadata.create_all)
-#
-#
-# @app.on_event("startup")
-# async def on_startup():
-#     await init_db()
+# The schema is managed by Alembic migrations: run `alembic upgrade head` before starting the app.
 
 
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(booking.router, prefix="/booking", tags=["booking"])
+app.include_router(health.router, prefix="/health", tags=["health"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+app.include_router(metrics.router, tags=["metrics"])
+
+instrument_engine(engine, "primary")
+for index, replica in enumerate(replicas.engines):
+    instrument_engine(replica, f"replica-{index}")
+# Added last runs first: metrics also see the requests admission control rejects.
+if settings.admission_enabled:
+    app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get('/')
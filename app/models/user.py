@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, String, Integer, ForeignKey, Date, DateTime, Float, Index, JSON, LargeBinary, Text
+from sqlalchemy.orm import deferred, relationship
 from ..db.base import Base
 from datetime import datetime
 from sqlalchemy.sql import func
@@ -9,7 +9,7 @@ class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, nullable=False)
+    username = Column(String, unique=True, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
 
@@ -27,6 +27,96 @@ class Ticket(Base):
     longitude = Column(Float, nullable=False)
     tm_created = Column(DateTime, default=datetime.utcnow)
     tm_updated = Column(DateTime, nullable=True, onupdate=datetime.utcnow)
+    geohash = Column(String(12), nullable=True)
+    # Set by triggers on every write, see services/sync_service.py.
+    change_seq = Column(BigInteger, nullable=True)
 
     customer_id = Column(Integer, ForeignKey("users.id"))
     customer = relationship("User", back_populates="tickets")
+
+    __table_args__ = (
+        Index("ix_tickets_customer_id_id", "customer_id", "id"),
+        Index("ix_tickets_customer_id_tm_created", "customer_id", "tm_created"),
+        Index("ix_tickets_customer_id_place", "customer_id", "place"),
+        Index("ix_tickets_customer_id_city", "customer_id", "city"),
+        Index("ix_tickets_customer_id_hotel", "customer_id", "hotel"),
+        Index("ix_tickets_customer_id_latitude_longitude", "customer_id", "latitude", "longitude"),
+        Index("ix_tickets_customer_id_geohash", "customer_id", "geohash"),
+        Index("ix_tickets_customer_id_change_seq", "customer_id", "change_seq"),
+    )
+
+
+class TicketStat(Base):
+    """
+    Ticket counts and coordinate sums per customer, city, hotel and creation day.
+    Maintained by triggers on tickets, see services/stats_service.py.
+    """
+    __tablename__ = "ticket_stats"
+
+    customer_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    city = Column(String, primary_key=True)
+    hotel = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    tickets = Column(Integer, nullable=False, default=0)
+    latitude_sum = Column(Float, nullable=False, default=0.0)
+    longitude_sum = Column(Float, nullable=False, default=0.0)
+
+
+class TicketChangeCounter(Base):
+    """
+    Last change sequence number handed out per customer, and the newest one whose
+    tombstone has been pruned.
+    """
+    __tablename__ = "ticket_change_counters"
+
+    customer_id = Column(Integer, ForeignKey("users.id"), primary_key=True, autoincrement=False)
+    seq = Column(BigInteger, nullable=False)
+    # Clients whose cursor is older may have missed a deletion and must sync from scratch.
+    pruned_seq = Column(BigInteger, nullable=False, server_default="0")
+
+
+class TicketTombstone(Base):
+    """
+    A deleted ticket, kept for SYNC_TOMBSTONE_TTL so clients syncing changes learn of
+    the deletion.
+    """
+    __tablename__ = "ticket_tombstones"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    customer_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    change_seq = Column(BigInteger, nullable=False)
+    tm_deleted = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_ticket_tombstones_customer_id_change_seq", "customer_id", "change_seq"),
+        Index("ix_ticket_tombstones_tm_deleted", "tm_deleted"),
+    )
+
+
+class Job(Base):
+    """
+    A background job and, once it has finished, its result or error.
+    Queued jobs are claimed by the job runners of every worker, see services/job_service.py.
+    """
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)
+    params = Column(JSON, nullable=False)
+    priority = Column(Integer, nullable=False)
+    status = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    media_type = Column(String, nullable=True)
+    # Only the result endpoint needs the body; polling the status leaves it unloaded.
+    result = deferred(Column(LargeBinary, nullable=True))
+    tm_created = Column(DateTime, nullable=False, default=datetime.utcnow)
+    tm_started = Column(DateTime, nullable=True)
+    tm_finished = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_priority_id", "status", "priority", "id"),
+        Index("ix_jobs_customer_id_id", "customer_id", "id"),
+    )
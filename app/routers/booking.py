@@ -1,18 +1,67 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from starlette.responses import HTMLResponse, JSONResponse
+import hashlib
 
+from fastapi import APIRouter, Depends, File, HTTPException, status, Query, Request, Response, UploadFile
+from starlette.responses import HTMLResponse, JSONResponse, StreamingResponse
+
+from ..core.responses import FastJSONResponse
 from ..db.base import get_db
-from ..schemas.booking import TicketCreate, TicketOut, TicketUpdate
+from ..db.routing import get_read_db, read_session_factory
+from ..schemas.stats import StatsSummary, CityStats, HotelStats, PeriodStats
+from ..schemas.booking import (
+    TicketCreate,
+    TicketOut,
+    TicketUpdate,
+    TicketDistanceOut,
+    TicketBatchUpdate,
+    TicketBatchResult,
+    TicketImportResult,
+    TicketChanges,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.auth_service import get_current_user
-from app.services import booking_service
+from app.services import (
+    booking_service, bulk_service, event_service, geo_service, job_service, map_service, search_service,
+    stats_service, sync_service, version_service,
+)
+from .jobs import accepted
 from ..models.user import *
 from ..models import user
+from datetime import date
 from typing import List
-import folium
 
 router = APIRouter()
 
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = 100
+MAX_NEAREST = 100
+MAX_BATCH_SIZE = 1000
+MAX_SEARCH_PAGE_SIZE = 100
+MAX_SEARCH_OFFSET = 10000
+MAX_STATS_GROUPS = 1000
+FIELDS_DESCRIPTION = "Comma-separated ticket fields to return, e.g. id,hotel,city; all fields by default."
+BACKGROUND = Query(False, description="Queue a background job and answer 202 with its location instead.")
+
+
+def _etag(version: str, request: Request) -> str:
+    """
+    Weak ETag for a representation of the given version; query parameters select the variant.
+    """
+    variant = hashlib.blake2s(request.url.query.encode(), digest_size=6).hexdigest()
+    return f'W/"{version}-{variant}"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """
+    Whether the request's If-None-Match already names the current ETag (weak comparison).
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    current = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == current for tag in header.split(","))
+
 
 @router.post('/', response_model=TicketOut, status_code=status.HTTP_201_CREATED)
 async def create_ticket(ticket: TicketCreate, db: AsyncSession = Depends(get_db),
@@ -29,35 +78,339 @@ async def create_ticket(ticket: TicketCreate, db: AsyncSession = Depends(get_db)
     return await booking_service.create_ticket(ticket, db, current_user)
 
 
+def _check_batch_size(size: int) -> None:
+    if size > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {MAX_BATCH_SIZE} items per batch")
+
+
+def _batch_results(ticket_ids: List[int], tickets: List, found_status: int) -> List[TicketBatchResult]:
+    return [
+        TicketBatchResult(index=index, id=ticket_id, status=found_status, ticket=ticket)
+        if ticket is not None else
+        TicketBatchResult(index=index, id=ticket_id, status=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
+        for index, (ticket_id, ticket) in enumerate(zip(ticket_ids, tickets))
+    ]
+
+
+@router.post('/batch', response_model=List[TicketBatchResult])
+async def create_tickets(tickets: List[TicketCreate], db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(get_current_user)):
+    """
+    Create many tickets in one transaction.
+
+    :param tickets:
+    :param db:
+    :param current_user:
+    :return: One result per input item, in input order.
+    """
+    _check_batch_size(len(tickets))
+    created = await booking_service.create_tickets(tickets, db, current_user)
+    return _batch_results([ticket.id for ticket in created], created, status.HTTP_201_CREATED)
+
+
+@router.put('/batch', response_model=List[TicketBatchResult])
+async def update_tickets(items: List[TicketBatchUpdate], db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(get_current_user)):
+    """
+    Update many tickets in one transaction. Each item carries the id of the ticket to update.
+
+    :param items:
+    :param db:
+    :param current_user:
+    :return: One result per input item, in input order; missing tickets are reported as 404.
+    """
+    _check_batch_size(len(items))
+    updated = await booking_service.update_tickets(items, db, current_user)
+    return _batch_results([item.id for item in items], updated, status.HTTP_200_OK)
+
+
+@router.delete('/batch', response_model=List[TicketBatchResult])
+async def delete_tickets(ids: List[int] = Query(...), db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(get_current_user)):
+    """
+    Delete many tickets in one statement.
+
+    :param ids:
+    :param db:
+    :param current_user:
+    :return: One result per input id, in input order; missing tickets are reported as 404.
+    """
+    _check_batch_size(len(ids))
+    deleted = await booking_service.delete_tickets(ids, db, current_user)
+    return _batch_results(ids, deleted, status.HTTP_200_OK)
+
+
 @router.get('/', response_model=List[TicketOut])
-async def get_all_tickets(db: AsyncSession = Depends(get_db),
-                          current_user: user.User = Depends(get_current_user)):
+async def get_all_tickets(request: Request,
+                          db: AsyncSession = Depends(get_read_db),
+                          current_user: user.User = Depends(get_current_user),
+                          limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          after: str = Query(None),
+                          stream: bool = Query(False),
+                          fields: str = Query(None, description=FIELDS_DESCRIPTION)):
     """
-    Get all tickets.
+    Get all tickets, ordered by creation time.
 
+    One page of `limit` tickets (DEFAULT_PAGE_SIZE if omitted) is returned and, if more
+    tickets may follow, the cursor of the next page is sent in the `X-Next-Cursor`
+    header; pass it back as `after`. With `stream=true` every ticket after `after` is
+    streamed as NDJSON instead.
+    `fields` limits each ticket to the listed fields.
+    Responses carry an ETag taken from the user's change sequence; a matching
+    `If-None-Match` gets a 304 after a single-row lookup instead of the listing.
+
+    :param request:
     :param db:
     :param current_user:
+    :param limit:
+    :param after:
+    :param stream:
+    :param fields:
     :return:
     """
-    return await booking_service.get_all_tickets(db, current_user)
+    selected = booking_service.parse_fields(fields)
+    etag = _etag(await version_service.user_version(db, current_user.id), request)
+    if _not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    if stream:
+        return StreamingResponse(booking_service.stream_tickets(current_user, after,
+                                                                read_session_factory(current_user.id),
+                                                                selected),
+                                 media_type="application/x-ndjson", headers={"ETag": etag})
+
+    tickets = await booking_service.get_all_tickets(db, current_user, limit=limit, after=after, fields=selected)
+
+    headers = {"ETag": etag}
+    if len(tickets) == limit:
+        headers["X-Next-Cursor"] = booking_service.encode_cursor(tickets[-1])
+
+    # Rows already have the TicketOut shape; encode them directly.
+    return FastJSONResponse(booking_service.project(tickets, selected), headers=headers)
+
+
+@router.get('/search', response_model=List[TicketOut])
+async def search_tickets(
+        q: str = Query(..., min_length=1, max_length=200),
+        mode: str = Query(search_service.PREFIX, pattern=f"^({search_service.PREFIX}|{search_service.FUZZY})$"),
+        limit: int = Query(20, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+        offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(get_current_user),
+):
+    """
+    Search tickets by place, city and hotel, best matches first.
+
+    :param q: The search text.
+    :param mode: 'prefix' matches word prefixes, 'fuzzy' tolerates typos.
+    :param limit:
+    :param offset:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return await search_service.search_tickets(db, current_user, q, mode, limit, offset)
+
+
+FILE_FORMAT = Query(bulk_service.CSV, alias="format", pattern=f"^({bulk_service.CSV}|{bulk_service.PARQUET})$")
+
+
+@router.get('/export', response_class=StreamingResponse)
+async def export_tickets(file_format: str = FILE_FORMAT,
+                         background: bool = BACKGROUND,
+                         db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(get_current_user)):
+    """
+    Download all tickets as CSV or Parquet, streamed in chunks.
+
+    :param file_format: 'csv' or 'parquet'; Parquet needs pyarrow on the server.
+    :param background: Export in a background job instead.
+    :param db:
+    :param current_user:
+    :return:
+    """
+    if background:
+        return accepted(await job_service.submit_job(
+            db, current_user, job_service.EXPORT, {"format": file_format}, job_service.LOW_PRIORITY))
+    return StreamingResponse(
+        bulk_service.export_tickets(current_user, file_format, read_session_factory(current_user.id)),
+        media_type=bulk_service.MEDIA_TYPES[file_format],
+        headers={"Content-Disposition": f'attachment; filename="tickets.{file_format}"'},
+    )
+
+
+@router.post('/import', response_model=TicketImportResult)
+async def import_tickets(file: UploadFile = File(...),
+                         file_format: str = FILE_FORMAT,
+                         db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(get_current_user)):
+    """
+    Upload a CSV or Parquet file of tickets, with the columns of the export.
+    Rows without an id are created, rows with an id update that ticket. All or nothing.
+
+    :param file:
+    :param file_format:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return await bulk_service.import_tickets(file.file, file_format, db, current_user)
+
+
+STATS_SCOPE = Query(stats_service.USER_SCOPE,
+                    pattern=f"^({stats_service.USER_SCOPE}|{stats_service.GLOBAL_SCOPE})$",
+                    description="'user' for your own tickets, 'global' for all tickets.")
+
+
+@router.get('/stats', response_model=StatsSummary)
+async def get_stats(scope: str = STATS_SCOPE,
+                    db: AsyncSession = Depends(get_read_db),
+                    current_user: User = Depends(get_current_user)):
+    """
+    Ticket count, distinct cities and hotels, mean position and first and last booking day.
+
+    :param scope:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return await stats_service.get_summary(db, current_user, scope)
+
+
+@router.get('/stats/cities', response_model=List[CityStats])
+async def get_city_stats(scope: str = STATS_SCOPE,
+                         limit: int = Query(100, ge=1, le=MAX_STATS_GROUPS),
+                         db: AsyncSession = Depends(get_read_db),
+                         current_user: User = Depends(get_current_user)):
+    """
+    Tickets per city, busiest first.
+
+    :param scope:
+    :param limit:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return await stats_service.get_city_stats(db, current_user, scope, limit)
+
+
+@router.get('/stats/hotels', response_model=List[HotelStats])
+async def get_hotel_stats(scope: str = STATS_SCOPE,
+                          city: str = Query(None),
+                          limit: int = Query(100, ge=1, le=MAX_STATS_GROUPS),
+                          db: AsyncSession = Depends(get_read_db),
+                          current_user: User = Depends(get_current_user)):
+    """
+    Tickets per hotel, busiest first.
+
+    :param scope:
+    :param city: Only hotels in this city.
+    :param limit:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return await stats_service.get_hotel_stats(db, current_user, scope, city, limit)
+
+
+@router.get('/stats/timeline', response_model=List[PeriodStats])
+async def get_timeline(scope: str = STATS_SCOPE,
+                       interval: str = Query(stats_service.DAY,
+                                             pattern=f"^({stats_service.DAY}|{stats_service.MONTH}|{stats_service.YEAR})$"),
+                       since: date = Query(None),
+                       until: date = Query(None),
+                       db: AsyncSession = Depends(get_read_db),
+                       current_user: User = Depends(get_current_user)):
+    """
+    Tickets created per day, month or year, oldest first.
+
+    :param scope:
+    :param interval:
+    :param since: First day to count, inclusive.
+    :param until: Last day to count, inclusive.
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return await stats_service.get_timeline(db, current_user, scope, interval, since, until)
+
+
+@router.get('/changes', response_model=TicketChanges)
+async def get_changes(since: int = Query(0, ge=0, description="Cursor returned by the previous call; 0 for everything."),
+                      limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                      db: AsyncSession = Depends(get_read_db),
+                      current_user: User = Depends(get_current_user)):
+    """
+    Tickets created or updated and ids of tickets deleted since a cursor, oldest change
+    first, so a client can catch up without downloading every ticket.
+    Pass the returned `cursor` as `since` next time; while `has_more` is true, call again
+    right away. A ticket changed several times is returned once, in its current state.
+    Deletions are kept for SYNC_TOMBSTONE_TTL; an older cursor gets a 410, after which
+    the client syncs again from 0 and replaces its copy.
+
+    :param since:
+    :param limit:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return FastJSONResponse(await sync_service.get_changes(db, current_user, since, limit))
+
+
+@router.get('/events', response_class=StreamingResponse)
+async def ticket_events(db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(get_current_user)):
+    """
+    Server-sent events for changes to your tickets: 'created' and 'updated' with the
+    tickets, 'deleted' with their ids, and 'resync' when you should fetch the tickets
+    again, after which the stream ends.
+
+    :param db:
+    :param current_user:
+    :return:
+    """
+    subscriber = event_service.subscribe(current_user.id)
+    # Authentication may have used a connection; the stream must not hold it open.
+    await db.close()
+    return StreamingResponse(
+        event_service.stream_events(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get('/{ticket_id}', response_model=TicketOut)
 async def get_ticket(
         ticket_id: int,
-        db: AsyncSession = Depends(get_db),
+        request: Request,
+        db: AsyncSession = Depends(get_read_db),
         current_user:
-        user.User = Depends(get_current_user)
+        user.User = Depends(get_current_user),
+        fields: str = Query(None, description=FIELDS_DESCRIPTION),
 ):
     """
     Get a ticket by ID.
+    The response carries an ETag taken from the ticket's change sequence; a matching
+    `If-None-Match` gets a 304 without reading the ticket.
 
     :param ticket_id: 
+    :param request:
     :param db:
     :param current_user:
+    :param fields:
     :return:
     """
-    return await booking_service.get_ticket(ticket_id, db, current_user)
+    selected = booking_service.parse_fields(fields)
+    version = await version_service.ticket_version(db, current_user.id, ticket_id)
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
+    etag = _etag(version, request)
+    if _not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    ticket = await booking_service.get_ticket_row(ticket_id, db, current_user, selected)
+    return FastJSONResponse(booking_service.project([ticket], selected)[0], headers={"ETag": etag})
 
 
 @router.put("/{ticket_id}", response_model=TicketOut)
@@ -90,13 +443,14 @@ async def delete_ticket(
 
 @router.get("/filter/filter", response_model=List[TicketOut])
 async def get_filtered_tickets(
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
         current_user: User = Depends(get_current_user),
         place: str = Query(None),
         city: str = Query(None),
         hotel: str = Query(None),
         latitude: float = Query(None),
         longitude: float = Query(None),
+        fields: str = Query(None, description=FIELDS_DESCRIPTION),
 ):
     """
     Get filtered tickets.
@@ -108,8 +462,10 @@ async def get_filtered_tickets(
     :param hotel:
     :param latitude:
     :param longitude:
+    :param fields:
     :return:
     """
+    selected = booking_service.parse_fields(fields)
     filters = {
         "place": place,
         "city": city,
@@ -120,38 +476,106 @@ async def get_filtered_tickets(
 
     filters = {key: value for key, value in filters.items() if value is not None}
 
-    tickets = await booking_service.filter_ticket(db, current_user, filters)
+    tickets = await booking_service.filter_ticket(db, current_user, filters, selected)
+
+    return FastJSONResponse(booking_service.project(tickets, selected))
+
 
-    if tickets is None:
-        return []
+def _with_distance(matches) -> List[TicketDistanceOut]:
+    return [
+        TicketDistanceOut(**TicketOut.model_validate(ticket).model_dump(), distance_km=distance)
+        for ticket, distance in matches
+    ]
 
-    return tickets
+
+@router.get("/geo/bbox", response_model=List[TicketOut])
+async def get_tickets_in_bbox(
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(get_current_user),
+        min_lat: float = Query(..., ge=-90, le=90),
+        min_lon: float = Query(..., ge=-180, le=180),
+        max_lat: float = Query(..., ge=-90, le=90),
+        max_lon: float = Query(..., ge=-180, le=180),
+):
+    """
+    Get tickets inside a bounding box.
+    A box with min_lon greater than max_lon wraps around the antimeridian.
+
+    :param db:
+    :param current_user:
+    :param min_lat:
+    :param min_lon:
+    :param max_lat:
+    :param max_lon:
+    :return:
+    """
+    if min_lat > max_lat:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_lat must not exceed max_lat")
+
+    return await geo_service.tickets_in_bbox(db, current_user, min_lat, min_lon, max_lat, max_lon)
+
+
+@router.get("/geo/radius", response_model=List[TicketDistanceOut])
+async def get_tickets_in_radius(
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(get_current_user),
+        latitude: float = Query(..., ge=-90, le=90),
+        longitude: float = Query(..., ge=-180, le=180),
+        radius_km: float = Query(..., gt=0, le=geo_service.NEAREST_MAX_RADIUS_KM),
+):
+    """
+    Get tickets within radius_km of a point, nearest first.
+
+    :param db:
+    :param current_user:
+    :param latitude:
+    :param longitude:
+    :param radius_km:
+    :return:
+    """
+    matches = await geo_service.tickets_in_radius(db, current_user, latitude, longitude, radius_km)
+    return _with_distance(matches)
+
+
+@router.get("/geo/nearest", response_model=List[TicketDistanceOut])
+async def get_nearest_tickets(
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(get_current_user),
+        latitude: float = Query(..., ge=-90, le=90),
+        longitude: float = Query(..., ge=-180, le=180),
+        k: int = Query(10, ge=1, le=MAX_NEAREST),
+):
+    """
+    Get the k tickets closest to a point, nearest first.
+
+    :param db:
+    :param current_user:
+    :param latitude:
+    :param longitude:
+    :param k:
+    :return:
+    """
+    matches = await geo_service.nearest_tickets(db, current_user, latitude, longitude, k)
+    return _with_distance(matches)
 
 
 @router.get('/visualize/map')
-async def visualize_map(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
-    data = await booking_service.get_coordinates(db, current_user)
+async def visualize_map(current_user: User = Depends(get_current_user), zoom: int = Query(12, ge=0, le=18),
+                        background: bool = BACKGROUND, db: AsyncSession = Depends(get_db)):
+    """
+    Render the user's tickets on a map, clustered for the given zoom level.
 
-    if not data:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No tickets found for the user.")
+    :param current_user:
+    :param zoom:
+    :param background: Render in a background job instead.
+    :param db:
+    :return:
+    """
+    if background:
+        return accepted(await job_service.submit_job(db, current_user, job_service.MAP, {"zoom": zoom}))
+    map_html = await map_service.get_map_html(current_user, zoom)
 
-    first_entry = data[0]
-    m = folium.Map(location=[first_entry['latitude'], first_entry['longitude']], zoom_start=12)
-    for entry in data:
-        lat = entry['latitude']
-        lon = entry['longitude']
-        ticket_id = entry['id']
-        hotel = entry['hotel']
-
-        folium.CircleMarker(
-            location=[lat, lon],
-            radius=5,
-            color='red',
-            fill=True,
-            fill_color='red',
-            popup=f"ID: {ticket_id}, Hotel: {hotel}"
-        ).add_to(m)
-
-    map_html = m._repr_html_()
+    if map_html is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No tickets found for the user.")
 
     return HTMLResponse(content=map_html)
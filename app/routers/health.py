@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+
+from ..db.base import engine
+from ..db.pool import pool_status
+from ..db.routing import replicas
+
+router = APIRouter()
+
+
+@router.get("/db")
+async def database_health():
+    """
+    Connection pool occupancy and checkout wait statistics of the primary and the read replicas.
+
+    :return:
+    """
+    return {
+        "pool": pool_status(engine.pool),
+        "replicas": [
+            {**status, "pool": pool_status(replica.pool)}
+            for status, replica in zip(replicas.status(), replicas.engines)
+        ],
+    }
@@ -0,0 +1,82 @@
+from fastapi import APIRouter, Depends, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.base import get_db
+from ..models.user import User
+from ..schemas.job import JobCreate, JobOut
+from ..services import job_service
+from ..services.auth_service import get_current_user
+from typing import List
+
+router = APIRouter()
+
+
+def accepted(job) -> Response:
+    """
+    202 response for a queued job, pointing at its status.
+    """
+    return Response(
+        content=JobOut.model_validate(job).model_dump_json(),
+        status_code=status.HTTP_202_ACCEPTED,
+        media_type="application/json",
+        headers={"Location": f"/jobs/{job.id}"},
+    )
+
+
+@router.post('/', response_model=JobOut, status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(job: JobCreate, db: AsyncSession = Depends(get_db),
+                     current_user: User = Depends(get_current_user)):
+    """
+    Queue a background job: 'map' (zoom), 'export' (format) or 'tickets' (fields).
+    Poll the job at the Location header and fetch its result once it has succeeded.
+
+    :param job:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return accepted(await job_service.submit_job(db, current_user, job.kind, job.params, job.priority))
+
+
+@router.get('/', response_model=List[JobOut])
+async def get_jobs(limit: int = Query(20, ge=1, le=job_service.MAX_LISTED_JOBS),
+                   db: AsyncSession = Depends(get_db),
+                   current_user: User = Depends(get_current_user)):
+    """
+    Your most recent jobs, newest first.
+
+    :param limit:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return await job_service.get_jobs(db, current_user, limit)
+
+
+@router.get('/{job_id}', response_model=JobOut)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_db),
+                  current_user: User = Depends(get_current_user)):
+    """
+    Status of a job.
+
+    :param job_id:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    return await job_service.get_job(job_id, db, current_user)
+
+
+@router.get('/{job_id}/result')
+async def get_job_result(job_id: int, db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(get_current_user)):
+    """
+    Result of a succeeded job, with the media type of its kind. 409 while it is pending or if it failed.
+
+    :param job_id:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    body, media_type = await job_service.get_job_result(job_id, db, current_user)
+    return Response(content=body, media_type=media_type)
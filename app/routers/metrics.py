@@ -0,0 +1,57 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..core import metrics
+from ..core.security.hashing import hash_pool_stats
+from ..db.base import engine
+from ..db.pool import pool_status
+from ..db.routing import replicas
+from ..services import auth_service, map_service
+
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+POOL_FIELDS = ("size", "checked_out", "idle", "saturation", "checkouts", "checkout_timeouts",
+               "wait_seconds_total", "wait_seconds_max", "wait_seconds_recent")
+
+_pool_gauges = {field: metrics.Gauge(f"db_pool_{field}", f"Connection pool {field.replace('_', ' ')}.",
+                                     ("engine",))
+                for field in POOL_FIELDS}
+_hash_gauges = {field: metrics.Gauge(f"password_hash_{field}", f"Password hashing pool {field.replace('_', ' ')}.")
+                for field in hash_pool_stats()}
+_cache_hits = metrics.Counter("cache_hits_total", "In-process cache hits.", ("cache",))
+_cache_misses = metrics.Counter("cache_misses_total", "In-process cache misses.", ("cache",))
+_cache_entries = metrics.Gauge("cache_entries", "In-process cache entries.", ("cache",))
+
+
+def _collect() -> None:
+    """
+    Copy state that other modules keep into gauges and counters just before a scrape.
+    """
+    engines = [("primary", engine)] + [(f"replica-{index}", replica)
+                                       for index, replica in enumerate(replicas.engines)]
+    for name, each in engines:
+        status = pool_status(each.pool)
+        for field, gauge in _pool_gauges.items():
+            if field in status:
+                gauge.set(status[field], engine=name)
+
+    for field, value in hash_pool_stats().items():
+        _hash_gauges[field].set(value)
+
+    for name, cache in (("principal", auth_service._principal_cache), ("map", map_service._map_cache)):
+        _cache_hits.set_total(cache.hits, cache=name)
+        _cache_misses.set_total(cache.misses, cache=name)
+        _cache_entries.set(len(cache), cache=name)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    Request, SQL, pool and cache metrics of this worker in the Prometheus text format.
+
+    :return:
+    """
+    _collect()
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 
 class TicketBase(BaseModel):
@@ -30,3 +30,32 @@ class TicketOut(TicketBase):
 
     class Config:
         from_attributes = True
+
+
+class TicketDistanceOut(TicketOut):
+    distance_km: float
+
+
+class TicketBatchUpdate(TicketUpdate):
+    id: int
+
+
+class TicketBatchResult(BaseModel):
+    index: int
+    id: Optional[int]
+    status: int
+    detail: Optional[str] = None
+    ticket: Optional[TicketOut] = None
+
+
+class TicketImportResult(BaseModel):
+    created: int
+    updated: int
+    not_found: int
+
+
+class TicketChanges(BaseModel):
+    tickets: List[TicketOut]
+    deleted: List[int]
+    cursor: int
+    has_more: bool
@@ -0,0 +1,38 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+class JobCreate(BaseModel):
+    kind: str = Field(..., example="map")
+    params: Dict[str, Any] = Field(default_factory=dict, example={"zoom": 12})
+    priority: int = Field(5, ge=0, le=9, description="0 runs first, 9 last.")
+
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    params: Dict[str, Any]
+    priority: int
+    status: str
+    attempts: int
+    error: Optional[str]
+    media_type: Optional[str]
+    tm_created: datetime
+    tm_started: Optional[datetime]
+    tm_finished: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+
+class MapJobParams(BaseModel):
+    zoom: int = Field(12, ge=0, le=18)
+
+
+class ExportJobParams(BaseModel):
+    format: str = Field("csv", pattern="^(csv|parquet)$")
+
+
+class TicketsJobParams(BaseModel):
+    fields: Optional[str] = None
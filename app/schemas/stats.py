@@ -0,0 +1,29 @@
+from pydantic import BaseModel
+from datetime import date
+from typing import Optional
+
+
+class StatsSummary(BaseModel):
+    tickets: int
+    cities: int
+    hotels: int
+    centroid_latitude: Optional[float]
+    centroid_longitude: Optional[float]
+    first_day: Optional[date]
+    last_day: Optional[date]
+
+
+class CityStats(BaseModel):
+    city: str
+    tickets: int
+    centroid_latitude: float
+    centroid_longitude: float
+
+
+class HotelStats(CityStats):
+    hotel: str
+
+
+class PeriodStats(BaseModel):
+    period: str
+    tickets: int
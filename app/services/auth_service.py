@@ -1,22 +1,35 @@
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from sqlalchemy.future import select
 
 from ..models.user import *
 from ..schemas.user import UserCreate, Token
-from ..core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from ..core.cache import LRUCache
+from ..core.config import (
+    SECRET_KEY,
+    ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+)
+from ..core.security import hashing
+from ..core.security.tokens import request_claims
 from ..db.base import get_db
 
-pdw_context = CryptContext(schemes=['bcrypt'], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+# Users resolved by get_current_user, keyed by token subject. Entries are detached
+# from their session and are only read, never flushed.
+_principal_cache = LRUCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
@@ -26,7 +39,7 @@ async def verify_password(plain_password: str, hashed_password: str) -> bool:
     :param hashed_password: The hashed password to compare against.
     :return: True if the passwords match, False otherwise.
     """
-    return pdw_context.verify(plain_password, hashed_password)
+    return await hashing.verify_password(plain_password, hashed_password)
 
 
 async def get_password_hash(password: str) -> str:
@@ -36,7 +49,7 @@ async def get_password_hash(password: str) -> str:
     :param password: The password to hash.
     :return: The hashed password.
     """
-    return pdw_context.hash(password)
+    return await hashing.hash_password(password)
 
 
 async def get_user(db: AsyncSession, username: str) -> Optional[User]:
@@ -50,6 +63,25 @@ async def get_user(db: AsyncSession, username: str) -> Optional[User]:
     result = await db.execute(select(User).filter(User.username == username))
     return result.scalars().first()
 
+
+def invalidate_principal(username: str) -> None:
+    """
+    Drop a user from the principal cache.
+    ORM updates and deletes of users do this automatically; call it after changing
+    users with bulk or raw SQL.
+
+    :param username: The username (token subject) of the user.
+    """
+    _principal_cache.pop(username)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_principal_on_change(mapper, connection, target: User) -> None:
+    history = inspect(target).attrs.username.history
+    for username in {target.username, *(history.deleted or ())}:
+        invalidate_principal(username)
+
 async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
     """
     Authenticate a user by their username and password.
@@ -97,17 +129,23 @@ async def register_user(db: AsyncSession, user_create: UserCreate) -> User:
         hashed_password=await get_password_hash(user_create.password),
     )
 
-    async with db.begin() as session:
-        async_session = session.session
-        async_session.add(user)
-        await async_session.commit()
+    try:
+        async with db.begin() as session:
+            async_session = session.session
+            async_session.add(user)
+            await async_session.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username or email already registered")
 
     return user
 
-async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_db),
+                           token: str = Depends(oauth2_scheme)) -> User:
     """
     Retrieve the current user from the access token.
+    Claims already decoded for the request, e.g. by admission control, are reused.
 
+    :param request: The request the token came with.
     :param db: The database session.
     :param token: The access token.
     :return: The current user.
@@ -119,14 +157,28 @@ async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depe
     )
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = request_claims(request.scope, token)
         username: str = payload.get("sub")
+        user_id: Optional[int] = payload.get("uid")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = await get_user(db, username)
+    user = _principal_cache.get(username)
+    if user is not None:
+        return user
+
+    if user_id is not None:
+        user = await db.get(User, user_id)
+        if user is not None and user.username != username:
+            user = None
+    else:
+        user = await get_user(db, username)
+
     if user is None:
         raise credentials_exception
+
+    db.expunge(user)
+    _principal_cache.set(username, user)
     return user
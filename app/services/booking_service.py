@@ -1,11 +1,37 @@
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import Row, and_, or_, bindparam, delete, insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from ..core.responses import dumps
+from ..db.base import AsyncSessionLocal
 from ..models.user import *
 from ..models.user import Ticket
-from ..schemas.booking import TicketCreate, TicketUpdate
-from typing import List, Sequence, Dict, Tuple
+from ..schemas.booking import TicketCreate, TicketUpdate, TicketOut, TicketBatchUpdate
+from .geo_service import encode_geohash
+from . import event_service
+from ..db import routing
+from typing import List, Sequence, Dict, Tuple, Optional, AsyncIterator
 from fastapi import HTTPException, status
 
+STREAM_CHUNK_SIZE = 500
+
+# Columns of TicketOut, for reads that return rows in the response shape instead of
+# hydrating Ticket objects and validating them again.
+TICKET_OUT_FIELDS = tuple(TicketOut.model_fields)
+KEYSET_FIELDS = ("tm_created", "id")
+
+
+def after_write(current_user: User) -> None:
+    """
+    Bookkeeping after a customer's tickets changed. Call once the change is committed.
+    :param current_user:
+    :return:
+    """
+    routing.mark_write(current_user.id)
+
 
 async def create_ticket(ticket: TicketCreate, db: AsyncSession, current_user: User) -> Ticket:
     """
@@ -15,24 +41,137 @@ async def create_ticket(ticket: TicketCreate, db: AsyncSession, current_user: Us
     :param current_user:
     :return:
     """
-    new_ticket = Ticket(**ticket.dict(), customer_id=current_user.id)
+    new_ticket = Ticket(**ticket.model_dump(), customer_id=current_user.id,
+                        geohash=encode_geohash(ticket.latitude, ticket.longitude))
 
     db.add(new_ticket)
     await db.commit()
+    after_write(current_user)
+    event_service.publish(current_user.id, event_service.CREATED, [new_ticket])
 
     return new_ticket
 
 
-async def get_all_tickets(db: AsyncSession, current_user: User) -> Sequence[Ticket]:  # List[Ticket]
+def encode_cursor(ticket: Ticket) -> str:
+    """
+    Encodes the keyset position of a ticket into an opaque cursor.
+    :param ticket:
+    :return:
+    """
+    raw = f"{ticket.tm_created.isoformat()}|{ticket.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decodes a cursor produced by encode_cursor back into (tm_created, id).
+    :param cursor:
+    :return:
+    """
+    try:
+        tm_created, ticket_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(tm_created), int(ticket_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    Validates a comma-separated sparse fieldset against TicketOut.
+    :param fields: e.g. "id,hotel,city"; None selects every field.
+    :return: The requested field names in order, without duplicates.
+    """
+    if fields is None:
+        return TICKET_OUT_FIELDS
+
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in TicketOut.model_fields]
+    if not names or unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown fields: {', '.join(unknown) or 'none given'}; "
+                                   f"choose from {', '.join(TICKET_OUT_FIELDS)}")
+    return names
+
+
+def _columns(fields: Sequence[str], *required: str) -> List:
+    """
+    Ticket columns for the requested fields plus any the query itself needs.
+    """
+    return [getattr(Ticket, name) for name in dict.fromkeys((*fields, *required))]
+
+
+def project(rows: Sequence[Row], fields: Sequence[str]) -> List[Dict]:
+    """
+    Response dicts holding only the requested fields of each row.
+    :param rows: Rows selected with at least the requested fields.
+    :param fields:
+    :return:
+    """
+    return [{name: row._mapping[name] for name in fields} for row in rows]
+
+
+def _tickets_page_query(current_user: User, after: Optional[str] = None,
+                        fields: Sequence[str] = TICKET_OUT_FIELDS, *required: str):
     """
-    Gets all tickets for a customer.
+    Builds the keyset-ordered query for a customer's ticket rows, starting after the given cursor.
+    :param current_user:
+    :param after:
+    :param fields: The TicketOut fields to select.
+    :param required: Further fields to select, e.g. to build a cursor.
+    :return:
+    """
+    query = select(*_columns(fields, *required)).where(current_user.id == Ticket.customer_id)
+
+    if after is not None:
+        tm_created, ticket_id = decode_cursor(after)
+        query = query.where(or_(Ticket.tm_created > tm_created,
+                                and_(Ticket.tm_created == tm_created, Ticket.id > ticket_id)))
+
+    return query.order_by(Ticket.tm_created, Ticket.id)
+
+
+async def get_all_tickets(db: AsyncSession, current_user: User, limit: int,
+                          after: Optional[str] = None, fields: Sequence[str] = TICKET_OUT_FIELDS) -> Sequence[Row]:
+    """
+    Gets one page of ticket rows for a customer ordered by (tm_created, id), starting
+    after the `after` cursor. The rows also carry the cursor columns; every ticket is
+    only available through stream_tickets.
     :param db:
     :param current_user:
+    :param limit:
+    :param after:
+    :param fields: The TicketOut fields to select.
     :return:
     """
-    result = await db.execute(select(Ticket).where(current_user.id == Ticket.customer_id))
-    tickets = result.scalars().all()
-    return tickets
+    query = _tickets_page_query(current_user, after, fields, *KEYSET_FIELDS).limit(limit)
+    result = await db.execute(query)
+    return result.all()
+
+
+def stream_tickets(current_user: User, after: Optional[str] = None,
+                   session_factory=AsyncSessionLocal,
+                   fields: Sequence[str] = TICKET_OUT_FIELDS) -> AsyncIterator[bytes]:
+    """
+    Streams all tickets for a customer as NDJSON.
+    Rows are read through a server-side cursor in chunks of STREAM_CHUNK_SIZE, so memory
+    stays flat regardless of how many tickets the customer has. The generator owns its
+    session because it outlives the request handler. The query is built before streaming
+    starts, so an invalid cursor raises here and is still answered with a 400.
+    :param current_user:
+    :param after:
+    :param session_factory:
+    :param fields: The TicketOut fields to select.
+    :return:
+    """
+    query = _tickets_page_query(current_user, after, fields).execution_options(yield_per=STREAM_CHUNK_SIZE)
+    return _stream_rows(query, session_factory)
+
+
+async def _stream_rows(query, session_factory) -> AsyncIterator[bytes]:
+    async with session_factory() as session:
+        result = await session.stream(query)
+        async for partition in result.partitions():
+            yield b"".join(dumps(row._asdict()) + b"\n" for row in partition)
 
 
 async def get_ticket(ticket_id: int, db: AsyncSession, current_user: User) -> Ticket:
@@ -50,6 +189,24 @@ async def get_ticket(ticket_id: int, db: AsyncSession, current_user: User) -> Ti
     return ticket
 
 
+async def get_ticket_row(ticket_id: int, db: AsyncSession, current_user: User,
+                         fields: Sequence[str] = TICKET_OUT_FIELDS) -> Row:
+    """
+    Gets the requested fields of a single ticket for a customer by its ID.
+    :param ticket_id:
+    :param db:
+    :param current_user:
+    :param fields: The TicketOut fields to select.
+    :return:
+    """
+    result = await db.execute(select(*_columns(fields))
+                              .where(ticket_id == Ticket.id, current_user.id == Ticket.customer_id))
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
+    return row
+
+
 async def update_ticket(
         ticket_id: int,
         ticket_update:
@@ -59,56 +216,275 @@ async def update_ticket(
     -> Ticket:
 
     """
-    Updates an existing ticket for a customer.
+    Updates an existing ticket for a customer with a single UPDATE ... RETURNING statement.
+    Changing only one coordinate needs the stored other one to recompute the geohash,
+    so that case reads the ticket first.
     :param ticket_id:
     :param ticket_update:
     :param db:
     :param current_user:
     :return:
     """
-    result = await db.execute(select(Ticket).where(Ticket.id == ticket_id, Ticket.customer_id == current_user.id))
-    ticket = result.scalars().first()
+    values = ticket_update.model_dump(exclude_unset=True)
+    if not values:
+        return await get_ticket(ticket_id, db, current_user)
+
+    if ("latitude" in values) != ("longitude" in values):
+        return await _update_loaded_ticket(ticket_id, values, db, current_user)
+    if "latitude" in values:
+        values["geohash"] = encode_geohash(values["latitude"], values["longitude"])
+
+    statement = update(Ticket).where(Ticket.id == ticket_id, Ticket.customer_id == current_user.id).values(**values)
+
+    if _supports_returning(db, "update"):
+        result = await db.scalars(statement.returning(Ticket),
+                                  execution_options={"synchronize_session": False, "populate_existing": True})
+        ticket = result.first()
+    else:
+        result = await db.execute(statement, execution_options={"synchronize_session": False})
+        ticket = None
+        if result.rowcount:
+            result = await db.execute(select(Ticket).where(Ticket.id == ticket_id)
+                                      .execution_options(populate_existing=True))
+            ticket = result.scalars().first()
+
     if ticket is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
 
-    for key, value in ticket_update.dict(exclude_unset=True).items():
+    await db.commit()
+    after_write(current_user)
+    event_service.publish(current_user.id, event_service.UPDATED, [ticket])
+
+    return ticket
+
+
+async def _update_loaded_ticket(ticket_id: int, values: Dict, db: AsyncSession, current_user: User) -> Ticket:
+    """
+    Updates a ticket by loading it, applying the values and flushing.
+    :param ticket_id:
+    :param values:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    ticket = await get_ticket(ticket_id, db, current_user)
+
+    for key, value in values.items():
         setattr(ticket, key, value)
+    ticket.geohash = encode_geohash(ticket.latitude, ticket.longitude)
 
     await db.commit()
+    after_write(current_user)
+    event_service.publish(current_user.id, event_service.UPDATED, [ticket])
 
     return ticket
 
 
 async def delete_ticket(ticket_id: int, db: AsyncSession, current_user: User):
     """
-    Deletes a ticket for a customer by its ID.
+    Deletes a ticket for a customer by its ID with a single DELETE ... RETURNING statement.
     :param ticket_id:
     :param db:
     :param current_user:
     :return:
     """
-    result = await db.execute(select(Ticket).where(ticket_id == Ticket.id, current_user.id == Ticket.customer_id))
-    ticket = result.scalars().first()
+    condition = and_(Ticket.id == ticket_id, Ticket.customer_id == current_user.id)
+
+    if _supports_returning(db, "delete"):
+        result = await db.scalars(delete(Ticket).where(condition).returning(Ticket),
+                                  execution_options={"synchronize_session": False})
+        ticket = result.first()
+    else:
+        result = await db.execute(select(Ticket).where(condition))
+        ticket = result.scalars().first()
+        if ticket is not None:
+            result = await db.execute(delete(Ticket).where(condition),
+                                      execution_options={"synchronize_session": False})
+            if not result.rowcount:
+                ticket = None
+
     if ticket is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ticket not found")
 
-    await db.delete(ticket)
     await db.commit()
+    after_write(current_user)
+    event_service.publish(current_user.id, event_service.DELETED, [ticket.id])
 
     return ticket
 
 
-async def filter_ticket(db: AsyncSession, current_user: User, filters: Dict[str, str]) -> List[Ticket]:
+def _supports_returning(db: AsyncSession, statement: str) -> bool:
+    """
+    Whether the session's backend supports RETURNING for the given kind of statement.
+    :param db:
+    :param statement: 'insert_executemany', 'update' or 'delete'.
+    :return:
+    """
+    return bool(getattr(db.bind.dialect, f"{statement}_returning", False))
+
+
+def _check_unique_ids(ticket_ids: List[int]) -> None:
+    if len(set(ticket_ids)) != len(ticket_ids):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Duplicate ticket ids in batch")
+
+
+async def create_tickets(tickets: List[TicketCreate], db: AsyncSession, current_user: User) -> List[Ticket]:
+    """
+    Creates many tickets for a customer in one transaction.
+    Rows go out as a single multi-row INSERT ... RETURNING where the backend supports it.
+    :param tickets:
+    :param db:
+    :param current_user:
+    :return: The created tickets, in input order.
+    """
+    if not tickets:
+        return []
+
+    rows = [
+        dict(**ticket.model_dump(), customer_id=current_user.id, geohash=encode_geohash(ticket.latitude, ticket.longitude))
+        for ticket in tickets
+    ]
+
+    if _supports_returning(db, "insert_executemany"):
+        # RETURNING rows of a multi-row INSERT come back in no guaranteed order; SQLAlchemy
+        # correlates them with the parameter rows, batching where the backend allows it.
+        result = await db.scalars(insert(Ticket).returning(Ticket, sort_by_parameter_order=True), rows)
+        created = result.all()
+    else:
+        created = [Ticket(**row) for row in rows]
+        db.add_all(created)
+        await db.flush()
+
+    await db.commit()
+    after_write(current_user)
+    event_service.publish(current_user.id, event_service.CREATED, created)
+
+    return created
+
+
+async def apply_updates(items: List[TicketBatchUpdate], db: AsyncSession, current_user: User) -> List[int]:
+    """
+    Updates many tickets of a customer without committing.
+    Items setting the same fields share one executemany UPDATE keyed by id; items
+    setting no fields issue none.
+    :param items:
+    :param db:
+    :param current_user:
+    :return: The ids of the customer's tickets among the items; the others were skipped.
+    """
+    ticket_ids = [item.id for item in items]
+    _check_unique_ids(ticket_ids)
+    if not ticket_ids:
+        return []
+
+    result = await db.execute(
+        select(Ticket.id, Ticket.latitude, Ticket.longitude)
+        .where(Ticket.id.in_(ticket_ids), Ticket.customer_id == current_user.id)
+    )
+    current = {row.id: row for row in result}
+
+    groups: Dict[Tuple[str, ...], List[Dict]] = {}
+    for item in items:
+        if item.id not in current:
+            continue
+        values = item.model_dump(exclude_unset=True, exclude={"id"})
+        if not values:
+            continue
+        if "latitude" in values or "longitude" in values:
+            values["geohash"] = encode_geohash(values.get("latitude", current[item.id].latitude),
+                                               values.get("longitude", current[item.id].longitude))
+        params = {f"v_{key}": value for key, value in values.items()}
+        params["b_id"] = item.id
+        groups.setdefault(tuple(sorted(values)), []).append(params)
+
+    table = Ticket.__table__
+    for keys, params in groups.items():
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"), table.c.customer_id == current_user.id)
+            .values({key: bindparam(f"v_{key}") for key in keys})
+        )
+        await db.execute(statement, params)
+
+    return list(current)
+
+
+async def update_tickets(items: List[TicketBatchUpdate], db: AsyncSession,
+                         current_user: User) -> List[Optional[Ticket]]:
+    """
+    Updates many tickets of a customer in one transaction.
+    :param items:
+    :param db:
+    :param current_user:
+    :return: The updated tickets in input order, None where the ticket was not found.
+    """
+    ticket_ids = [item.id for item in items]
+    if not ticket_ids:
+        return []
+
+    current = await apply_updates(items, db, current_user)
+
+    result = await db.execute(
+        select(Ticket).where(Ticket.id.in_(current)).execution_options(populate_existing=True)
+    )
+    updated = {ticket.id: ticket for ticket in result.scalars()}
+    changed = [updated[item.id] for item in items
+               if item.id in updated and item.model_dump(exclude_unset=True, exclude={"id"})]
+
+    await db.commit()
+    if changed:
+        after_write(current_user)
+        event_service.publish(current_user.id, event_service.UPDATED, changed)
+
+    return [updated.get(ticket_id) for ticket_id in ticket_ids]
+
+
+async def delete_tickets(ticket_ids: List[int], db: AsyncSession, current_user: User) -> List[Optional[Ticket]]:
+    """
+    Deletes many tickets of a customer with one DELETE ... RETURNING statement.
+    :param ticket_ids:
+    :param db:
+    :param current_user:
+    :return: The deleted tickets in input order, None where the ticket was not found.
+    """
+    _check_unique_ids(ticket_ids)
+    if not ticket_ids:
+        return []
+
+    condition = and_(Ticket.id.in_(ticket_ids), Ticket.customer_id == current_user.id)
+
+    if _supports_returning(db, "delete"):
+        result = await db.scalars(delete(Ticket).where(condition).returning(Ticket),
+                                  execution_options={"synchronize_session": False})
+        deleted = {ticket.id: ticket for ticket in result}
+    else:
+        result = await db.execute(select(Ticket).where(condition))
+        deleted = {ticket.id: ticket for ticket in result.scalars()}
+        if deleted:
+            await db.execute(delete(Ticket).where(Ticket.id.in_(list(deleted))),
+                             execution_options={"synchronize_session": False})
+
+    await db.commit()
+    if deleted:
+        after_write(current_user)
+        event_service.publish(current_user.id, event_service.DELETED, list(deleted))
+
+    return [deleted.get(ticket_id) for ticket_id in ticket_ids]
+
+
+async def filter_ticket(db: AsyncSession, current_user: User, filters: Dict[str, str],
+                        fields: Sequence[str] = TICKET_OUT_FIELDS) -> Sequence[Row]:
     """
-    Filters tickets based on provided filters.
+    Filters tickets based on provided filters and returns rows of the requested fields.
 
     :param db:
     :param current_user:
     :param filters:
+    :param fields: The TicketOut fields to select.
     :return:
     """
 
-    query = select(Ticket).where(current_user.id == Ticket.customer_id)
+    query = select(*_columns(fields)).where(current_user.id == Ticket.customer_id)
 
     if filters: # Can be used ilike //Ticket.city.ilike(f"%{value}%")) elif key == 'hotel'// for finds all values containing the specified string anywhere
         for key, value in filters.items():
@@ -124,7 +500,7 @@ async def filter_ticket(db: AsyncSession, current_user: User, filters: Dict[str,
                 query = query.where(Ticket.longitude == float(value))
 
     result = await db.execute(query)
-    return result.scalars().all()
+    return result.all()
 
 async def get_coordinates(db: AsyncSession, current_user: User) -> List[Tuple[int, str, float, float]]:
     """
@@ -137,5 +513,4 @@ async def get_coordinates(db: AsyncSession, current_user: User) -> List[Tuple[in
         select(Ticket.id, Ticket.hotel, Ticket.latitude, Ticket.longitude).where(current_user.id == Ticket.customer_id)
     )
     coordinates = result.mappings().all()
-    print(coordinates)
-    return coordinates
\ No newline at end of file
+    return coordinates
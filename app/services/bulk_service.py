@@ -0,0 +1,238 @@
+import csv
+import io
+import itertools
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from starlette.concurrency import run_in_threadpool
+
+from ..db.base import AsyncSessionLocal
+from ..models.user import User, Ticket
+from ..schemas.booking import TicketCreate, TicketBatchUpdate
+from . import booking_service, event_service
+from .geo_service import encode_geohash
+
+CSV = "csv"
+PARQUET = "parquet"
+
+MEDIA_TYPES = {CSV: "text/csv; charset=utf-8", PARQUET: "application/vnd.apache.parquet"}
+
+EXPORT_CHUNK_SIZE = 10000
+IMPORT_BATCH_SIZE = 5000
+
+EXPORT_FIELDS = ("id", "place", "city", "hotel", "latitude", "longitude", "tm_created", "tm_updated")
+INSERT_FIELDS = ("place", "city", "hotel", "latitude", "longitude", "tm_created", "geohash", "customer_id")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail="Parquet support requires the pyarrow package")
+    return pyarrow
+
+
+def _export_query(current_user: User):
+    return (
+        select(*(getattr(Ticket, name) for name in EXPORT_FIELDS))
+        .where(Ticket.customer_id == current_user.id)
+        .order_by(Ticket.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+
+
+def export_tickets(current_user: User, file_format: str = CSV,
+                   session_factory=AsyncSessionLocal) -> AsyncIterator[bytes]:
+    """
+    Streams every ticket of a customer as CSV or Parquet, ordered by id.
+    Rows are read through a server-side cursor in chunks of EXPORT_CHUNK_SIZE and each
+    chunk is encoded and sent before the next is read, so memory stays flat.
+    :param current_user:
+    :param file_format: 'csv' or 'parquet'.
+    :param session_factory: Sessions for the stream, which outlives the request handler.
+    :return:
+    """
+    if file_format == PARQUET:
+        return _export_parquet(_pyarrow(), current_user, session_factory)
+    return _export_csv(current_user, session_factory)
+
+
+async def _export_csv(current_user: User, session_factory) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+
+    async with session_factory() as session:
+        result = await session.stream(_export_query(current_user))
+        async for partition in result.partitions():
+            writer.writerows(
+                tuple(value.isoformat() if isinstance(value, datetime) else value for value in row)
+                for row in partition
+            )
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Drain(io.RawIOBase):
+    """
+    Write-only file that hands out what was written since the last drain.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _export_parquet(pa, current_user: User, session_factory) -> AsyncIterator[bytes]:
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("place", pa.string()),
+        ("city", pa.string()),
+        ("hotel", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("tm_created", pa.timestamp("us")),
+        ("tm_updated", pa.timestamp("us")),
+    ])
+    sink = _Drain()
+    # One row group per chunk; the footer follows the last one.
+    writer = pa.parquet.ParquetWriter(sink, schema)
+    try:
+        async with session_factory() as session:
+            result = await session.stream(_export_query(current_user))
+            async for partition in result.partitions():
+                columns = zip(*partition)
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                    schema=schema,
+                ))
+                yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _csv_records(file) -> Iterator[Dict[str, Any]]:
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    for record in reader:
+        yield {key: value for key, value in record.items() if key is not None and value not in ("", None)}
+
+
+def _parquet_records(pa, file) -> Iterator[Dict[str, Any]]:
+    parquet_file = pa.parquet.ParquetFile(file)
+    wanted = [name for name in parquet_file.schema_arrow.names if name in EXPORT_FIELDS]
+    for batch in parquet_file.iter_batches(batch_size=IMPORT_BATCH_SIZE, columns=wanted):
+        for record in batch.to_pylist():
+            yield {key: value for key, value in record.items() if value is not None}
+
+
+def _read_batch(records: Iterator[Tuple[int, Dict[str, Any]]]) -> Tuple[List[Dict], List[TicketBatchUpdate]]:
+    """
+    Parses the next IMPORT_BATCH_SIZE records into rows to insert and updates to apply.
+    Records with an id update that ticket; only the fields they carry change.
+    """
+    inserts, updates = [], []
+    for number, record in itertools.islice(records, IMPORT_BATCH_SIZE):
+        try:
+            if "id" in record:
+                updates.append(TicketBatchUpdate.model_validate(record))
+                continue
+            ticket = TicketCreate.model_validate(record)
+        except ValidationError as exc:
+            error = exc.errors()[0]
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Record {number}: {'.'.join(map(str, error['loc']))}: {error['msg']}")
+        missing = [name for name, value in ticket if value is None]
+        if missing:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Record {number}: missing {', '.join(missing)}")
+        inserts.append(ticket.model_dump())
+    return inserts, updates
+
+
+async def _insert_rows(db: AsyncSession, current_user: User, tickets: List[Dict]) -> None:
+    now = datetime.utcnow()
+    rows = [
+        dict(**ticket, tm_created=now, customer_id=current_user.id,
+             geohash=encode_geohash(ticket["latitude"], ticket["longitude"]))
+        for ticket in tickets
+    ]
+    connection = await db.connection()
+    if connection.dialect.driver == "asyncpg":
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            Ticket.__tablename__, columns=INSERT_FIELDS,
+            records=[tuple(row[name] for name in INSERT_FIELDS) for row in rows],
+        )
+    else:
+        await db.execute(insert(Ticket.__table__), rows)
+
+
+async def import_tickets(file, file_format: str, db: AsyncSession, current_user: User) -> Dict[str, int]:
+    """
+    Loads an uploaded CSV or Parquet file of tickets in one transaction.
+    Records without an id become new tickets, loaded with COPY on Postgres and batched
+    INSERTs elsewhere. Records with an id update that ticket if the customer owns it.
+    The file is parsed IMPORT_BATCH_SIZE records at a time off the event loop, so memory
+    stays bounded by the batch size, not the file size.
+    :param file: The uploaded file, opened in binary mode.
+    :param file_format: 'csv' or 'parquet'; the columns are those of the export.
+    :param db:
+    :param current_user:
+    :return: Counts of created, updated and not found tickets.
+    """
+    records = _parquet_records(_pyarrow(), file) if file_format == PARQUET else _csv_records(file)
+    numbered = enumerate(records, start=1)
+    counts = {"created": 0, "updated": 0, "not_found": 0}
+    updated_ids: List[int] = []
+
+    while True:
+        try:
+            inserts, updates = await run_in_threadpool(_read_batch, numbered)
+        except (csv.Error, ValueError) as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unreadable file: {exc}")
+        if not inserts and not updates:
+            break
+        if inserts:
+            await _insert_rows(db, current_user, inserts)
+            counts["created"] += len(inserts)
+        if updates:
+            owned = await booking_service.apply_updates(updates, db, current_user)
+            updated_ids.extend(owned)
+            counts["updated"] += len(owned)
+            counts["not_found"] += len(updates) - len(owned)
+
+    await db.commit()
+    if counts["created"] or updated_ids:
+        booking_service.after_write(current_user)
+        event_service.publish(current_user.id, event_service.RESYNC)
+
+    return counts
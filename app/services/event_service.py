@@ -0,0 +1,312 @@
+"""
+Change feed of a user's tickets: booking_service publishes created, updated and
+deleted events after each commit, and every open stream of that user receives them.
+
+Streams are fanned out in process through bounded queues. On Postgres, events are
+also relayed to the other worker processes with LISTEN/NOTIFY.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+
+from fastapi import HTTPException, status
+from sqlalchemy.engine import make_url
+
+from ..core import metrics
+from ..core.config import settings
+from ..core.responses import dumps
+from ..db import routing
+from ..models.user import Ticket
+from ..schemas.booking import TicketOut
+
+logger = logging.getLogger(__name__)
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+# Too much changed to describe, or events were lost: refetch the tickets.
+RESYNC = "resync"
+
+RELAY_CHANNEL = "ticket_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+NOTIFY_MAX_BYTES = 7900
+RELAY_QUEUE_SIZE = 10000
+RELAY_RETRY_SECONDS = 5.0
+SQLALCHEMY_URL_OPTIONS = ("prepared_statement_cache_size", "prepared_statement_name_func")
+
+# Tells processes apart on the relay, so a worker skips its own events.
+ORIGIN = uuid.uuid4().hex
+
+EVENTS_PUBLISHED = metrics.Counter(
+    "ticket_events_published_total", "Ticket change events published by this worker.", ("type",))
+SUBSCRIBERS = metrics.Gauge("ticket_event_subscribers", "Open ticket change streams in this worker.")
+SUBSCRIBERS_DROPPED = metrics.Counter(
+    "ticket_event_subscribers_dropped_total", "Streams closed because their client fell behind.")
+
+
+class Subscriber:
+    """
+    One open stream. Its queue is bounded: a client that stops reading is sent a
+    resync event and disconnected instead of holding events in memory without limit.
+    """
+
+    __slots__ = ("user_id", "queue", "overflowed")
+
+    def __init__(self, user_id: int, size: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def offer(self, event: Dict) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            SUBSCRIBERS_DROPPED.inc()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": RESYNC})
+
+
+_subscribers: Dict[int, Set[Subscriber]] = {}
+_subscriber_count = 0
+
+
+def subscribe(user_id: int) -> Subscriber:
+    """
+    Register a stream of the user's events.
+
+    :param user_id:
+    :return: The subscriber; pass it to unsubscribe when the stream ends.
+    """
+    global _subscriber_count
+    if _subscriber_count >= settings.event_max_subscribers:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Too many open event streams, retry later", headers={"Retry-After": "5"})
+    subscriber = Subscriber(user_id, settings.event_queue_size)
+    _subscribers.setdefault(user_id, set()).add(subscriber)
+    _subscriber_count += 1
+    SUBSCRIBERS.set(_subscriber_count)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber) -> None:
+    global _subscriber_count
+    subscribers = _subscribers.get(subscriber.user_id)
+    if subscribers is None or subscriber not in subscribers:
+        return
+    subscribers.discard(subscriber)
+    if not subscribers:
+        del _subscribers[subscriber.user_id]
+    _subscriber_count -= 1
+    SUBSCRIBERS.set(_subscriber_count)
+
+
+def _deliver(user_id: int, event: Dict) -> None:
+    for subscriber in _subscribers.get(user_id, ()):
+        subscriber.offer(event)
+
+
+def publish(user_id: int, event_type: str, tickets: Iterable = ()) -> None:
+    """
+    Send a change to the user's streams in every worker. Call after the change is committed.
+    The event is only built if someone may receive it.
+
+    :param user_id: The ticket owner.
+    :param event_type: CREATED, UPDATED, DELETED or RESYNC.
+    :param tickets: The changed Ticket objects, or ticket ids for DELETED.
+    """
+    EVENTS_PUBLISHED.inc(type=event_type)
+    if user_id not in _subscribers and relay is None:
+        return
+
+    event: Dict = {"type": event_type}
+    if event_type in (CREATED, UPDATED):
+        tickets = list(tickets)
+        event["ids"] = [ticket.id for ticket in tickets]
+        event["tickets"] = [TicketOut.model_validate(ticket).model_dump(mode="json") for ticket in tickets]
+    elif event_type == DELETED:
+        event["ids"] = [ticket.id if isinstance(ticket, Ticket) else ticket for ticket in tickets]
+
+    _deliver(user_id, event)
+    if relay is not None:
+        relay.send(user_id, event)
+
+
+def _format(event: Dict) -> bytes:
+    return b"event: " + event["type"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+
+
+async def stream_events(subscriber: Subscriber) -> AsyncIterator[bytes]:
+    """
+    Server-sent events for a subscriber, with a comment every EVENT_HEARTBEAT_SECONDS so
+    proxies keep the connection open. Ends after a resync caused by overflow.
+    The stream needs no database connection.
+
+    :param subscriber: From subscribe; unsubscribed when the stream ends.
+    :return:
+    """
+    try:
+        yield b"retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), settings.event_heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            yield _format(event)
+            if subscriber.overflowed and event["type"] == RESYNC:
+                return
+    finally:
+        unsubscribe(subscriber)
+
+
+def _apply_remote(user_id: int, event: Dict) -> None:
+    """
+    A change committed by another worker: pin the user to the primary as the writing
+    worker did, and pass the event on.
+    """
+    routing.mark_write(user_id)
+    _deliver(user_id, event)
+
+
+def _resync_all() -> None:
+    """
+    Events of other workers may have been lost: tell every open stream to refetch.
+    """
+    for user_id in list(_subscribers):
+        _apply_remote(user_id, {"type": RESYNC})
+
+
+class PostgresRelay:
+    """
+    Relays events between worker processes over one dedicated asyncpg connection per
+    process, outside the pool. Events are sent in order by a single task. An event too
+    large for NOTIFY goes out without ticket data, or failing that as a resync.
+    While the connection is down events wait in a queue of RELAY_QUEUE_SIZE, and
+    reconnection is retried.
+
+    Events that cannot be relayed, because the queue is full or the connection failed
+    while sending them, are replaced by one resync of every stream in the other
+    workers, sent once the queue has drained. Likewise, after reconnecting this
+    worker resyncs its own streams, since it missed the events sent meanwhile.
+    """
+
+    def __init__(self, database_url: str):
+        url = make_url(database_url)
+        # Options of SQLAlchemy's asyncpg dialect would reach Postgres as server settings.
+        url = url.difference_update_query(SQLALCHEMY_URL_OPTIONS).set(drivername=url.get_backend_name())
+        self.dsn = url.render_as_string(hide_password=False)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=RELAY_QUEUE_SIZE)
+        self._task: Optional[asyncio.Task] = None
+        self._resync_pending = False
+        self._listened = False
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def send(self, user_id: int, event: Dict) -> None:
+        if self._resync_pending:
+            # Covered by the resync sent once the queue has drained.
+            return
+        try:
+            self._queue.put_nowait((user_id, event))
+        except asyncio.QueueFull:
+            logger.warning("Event relay queue is full; other workers will be told to resync")
+            self._resync_pending = True
+
+    @staticmethod
+    def _payload(user_id: Optional[int], event: Dict) -> str:
+        """
+        The NOTIFY payload of an event; a user of None addresses every stream.
+        """
+        for candidate in (event, {"type": event["type"], "ids": event.get("ids", [])}, {"type": RESYNC}):
+            payload = json.dumps({"origin": ORIGIN, "user": user_id, "event": candidate}, separators=(",", ":"))
+            if len(payload.encode()) < NOTIFY_MAX_BYTES:
+                return payload
+        return payload
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        message = json.loads(payload)
+        if message["origin"] == ORIGIN:
+            return
+        if message["user"] is None:
+            _resync_all()
+        else:
+            _apply_remote(message["user"], message["event"])
+
+    async def _forward(self, connection, lost: asyncio.Event) -> None:
+        """
+        Send queued events until the connection is lost, and the pending resync, if any,
+        once the events queued before it have gone out.
+        """
+        while not lost.is_set():
+            if self._resync_pending and self._queue.empty():
+                user_id, event = None, {"type": RESYNC}
+            else:
+                try:
+                    user_id, event = await asyncio.wait_for(self._queue.get(), RELAY_RETRY_SECONDS)
+                except asyncio.TimeoutError:
+                    continue
+            try:
+                await connection.execute("SELECT pg_notify($1, $2)", RELAY_CHANNEL, self._payload(user_id, event))
+            except Exception:
+                self._resync_pending = True
+                raise
+            if user_id is None:
+                self._resync_pending = False
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn, timeout=settings.db_connect_timeout)
+            except (OSError, asyncpg.PostgresError) as exc:
+                logger.warning("Event relay cannot connect: %s", exc)
+                await asyncio.sleep(RELAY_RETRY_SECONDS)
+                continue
+
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            try:
+                await connection.add_listener(RELAY_CHANNEL, self._on_notify)
+                if self._listened:
+                    _resync_all()
+                self._listened = True
+                await self._forward(connection, lost)
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as exc:
+                logger.warning("Event relay connection lost: %s", exc)
+            finally:
+                await connection.close(timeout=settings.db_connect_timeout)
+            await asyncio.sleep(RELAY_RETRY_SECONDS)
+
+
+relay: Optional[PostgresRelay] = None
+
+
+def start_relay() -> None:
+    """
+    Start relaying events between workers if enabled and the database is Postgres.
+    """
+    global relay
+    if settings.event_relay and make_url(settings.database_url).get_backend_name() == "postgresql":
+        relay = PostgresRelay(settings.database_url)
+        relay.start()
+
+
+async def stop_relay() -> None:
+    global relay
+    if relay is not None:
+        await relay.stop()
+        relay = None
@@ -0,0 +1,224 @@
+import math
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..models.user import User, Ticket
+
+GEOHASH_PRECISION = 9
+MAX_COVER_CELLS = 32
+EARTH_RADIUS_KM = 6371.0088
+NEAREST_START_RADIUS_KM = 1.0
+NEAREST_MAX_RADIUS_KM = math.pi * EARTH_RADIUS_KM
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+BBox = Tuple[float, float, float, float]
+
+
+def encode_geohash(latitude: Optional[float], longitude: Optional[float],
+                   precision: int = GEOHASH_PRECISION) -> Optional[str]:
+    """
+    Encode a coordinate pair as a geohash string.
+
+    :param latitude: Latitude in degrees.
+    :param longitude: Longitude in degrees.
+    :param precision: Number of geohash characters.
+    :return: The geohash, or None if a coordinate is missing.
+    """
+    if latitude is None or longitude is None:
+        return None
+
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars = []
+    bits = bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if longitude >= mid:
+                bits, lon_lo = bits * 2 + 1, mid
+            else:
+                bits, lon_hi = bits * 2, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                bits, lat_lo = bits * 2 + 1, mid
+            else:
+                bits, lat_hi = bits * 2, mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = bit_count = 0
+
+    return "".join(chars)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle distance between two points.
+
+    :return: The distance in kilometres.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    """
+    Size of a geohash cell of the given precision as (lat_step, lon_step) in degrees.
+    """
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def cover_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+               max_cells: int = MAX_COVER_CELLS) -> List[str]:
+    """
+    Geohash cells that together cover a bounding box.
+    The finest precision whose cover fits in max_cells is used.
+
+    :return: Geohash prefixes of the covering cells.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = _cell_size(precision)
+        lat_cells, lon_cells = round(180.0 / lat_step), round(360.0 / lon_step)
+        row_lo = min(int((min_lat + 90.0) // lat_step), lat_cells - 1)
+        row_hi = min(int((max_lat + 90.0) // lat_step), lat_cells - 1)
+        col_lo = min(int((min_lon + 180.0) // lon_step), lon_cells - 1)
+        col_hi = min(int((max_lon + 180.0) // lon_step), lon_cells - 1)
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) <= max_cells:
+            break
+
+    return [
+        encode_geohash(-90.0 + (row + 0.5) * lat_step, -180.0 + (col + 0.5) * lon_step, precision)
+        for row in range(row_lo, row_hi + 1)
+        for col in range(col_lo, col_hi + 1)
+    ]
+
+
+def _next_prefix(prefix: str) -> Optional[str]:
+    """
+    Smallest geohash prefix sorting after every string that starts with `prefix`.
+    """
+    while prefix:
+        position = _BASE32.index(prefix[-1])
+        if position + 1 < len(_BASE32):
+            return prefix[:-1] + _BASE32[position + 1]
+        prefix = prefix[:-1]
+    return None
+
+
+def _cell_condition(prefix: str):
+    """
+    Index-friendly range predicate matching every geohash inside a cell.
+    """
+    upper = _next_prefix(prefix)
+    if upper is None:
+        return Ticket.geohash >= prefix
+    return and_(Ticket.geohash >= prefix, Ticket.geohash < upper)
+
+
+def split_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[BBox]:
+    """
+    Normalise a bounding box into boxes that do not cross the antimeridian.
+    A box with min_lon > max_lon is taken to wrap around longitude 180.
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    if max_lon - min_lon >= 360.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+
+    min_lon = (min_lon + 180.0) % 360.0 - 180.0
+    max_lon = (max_lon + 180.0) % 360.0 - 180.0
+    if min_lon <= max_lon:
+        return [(min_lat, min_lon, max_lat, max_lon)]
+    return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+
+
+def _bbox_query(current_user: User, boxes: List[BBox]):
+    """
+    Tickets of a customer inside any of the boxes.
+    Geohash ranges narrow the candidates through the index, the coordinate check is exact.
+    """
+    conditions = []
+    for min_lat, min_lon, max_lat, max_lon in boxes:
+        cells = or_(*(_cell_condition(cell) for cell in cover_bbox(min_lat, min_lon, max_lat, max_lon)))
+        conditions.append(and_(cells,
+                               Ticket.latitude.between(min_lat, max_lat),
+                               Ticket.longitude.between(min_lon, max_lon)))
+
+    return select(Ticket).where(current_user.id == Ticket.customer_id, or_(*conditions))
+
+
+def _radius_bbox(latitude: float, longitude: float, radius_km: float) -> List[BBox]:
+    """
+    Bounding boxes that contain the circle of radius_km around a point.
+    """
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = latitude - d_lat, latitude + d_lat
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return split_bbox(min_lat, -180.0, max_lat, 180.0)
+
+    cos_lat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+    d_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    if d_lon >= 180.0:
+        return split_bbox(min_lat, -180.0, max_lat, 180.0)
+    return split_bbox(min_lat, longitude - d_lon, max_lat, longitude + d_lon)
+
+
+async def tickets_in_bbox(db: AsyncSession, current_user: User, min_lat: float, min_lon: float,
+                          max_lat: float, max_lon: float) -> List[Ticket]:
+    """
+    Tickets of a customer inside a bounding box.
+
+    :param db: The database session.
+    :param current_user: The ticket owner.
+    :return: The matching tickets.
+    """
+    result = await db.execute(_bbox_query(current_user, split_bbox(min_lat, min_lon, max_lat, max_lon)))
+    return result.scalars().all()
+
+
+async def tickets_in_radius(db: AsyncSession, current_user: User, latitude: float, longitude: float,
+                            radius_km: float) -> List[Tuple[Ticket, float]]:
+    """
+    Tickets of a customer within radius_km of a point, nearest first.
+
+    :param db: The database session.
+    :param current_user: The ticket owner.
+    :return: (ticket, distance in km) pairs.
+    """
+    result = await db.execute(_bbox_query(current_user, _radius_bbox(latitude, longitude, radius_km)))
+
+    matches = []
+    for ticket in result.scalars():
+        distance = haversine_km(latitude, longitude, ticket.latitude, ticket.longitude)
+        if distance <= radius_km:
+            matches.append((ticket, distance))
+
+    matches.sort(key=lambda match: match[1])
+    return matches
+
+
+async def nearest_tickets(db: AsyncSession, current_user: User, latitude: float, longitude: float,
+                          k: int) -> List[Tuple[Ticket, float]]:
+    """
+    The k tickets of a customer closest to a point.
+    The search radius grows until k tickets are found or the whole globe is covered.
+
+    :param db: The database session.
+    :param current_user: The ticket owner.
+    :return: (ticket, distance in km) pairs, nearest first.
+    """
+    radius_km = NEAREST_START_RADIUS_KM
+    while True:
+        matches = await tickets_in_radius(db, current_user, latitude, longitude, radius_km)
+        if len(matches) >= k or radius_km >= NEAREST_MAX_RADIUS_KM:
+            return matches[:k]
+        radius_km = min(radius_km * 4, NEAREST_MAX_RADIUS_KM)
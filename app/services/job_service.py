@@ -0,0 +1,399 @@
+"""
+Background jobs for work too heavy for a request: map rendering, exports and full
+ticket lists. Jobs are rows in the jobs table; every worker process runs a JobRunner
+that claims queued jobs, lowest priority number first, and stores their result.
+
+Run a worker without the API, e.g. next to API processes started with JOB_WORKERS=0:
+
+    python -m app.services.job_service [--workers 4]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import and_, delete, func, or_, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..core import metrics
+from ..core.config import settings
+from ..db.base import AsyncSessionLocal
+from ..db.routing import read_session_factory
+from ..models.user import Job, User
+from ..schemas.job import ExportJobParams, MapJobParams, TicketsJobParams
+from . import booking_service, bulk_service, map_service, sync_service
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+PENDING = (QUEUED, RUNNING)
+FINISHED = (SUCCEEDED, FAILED)
+
+HIGH_PRIORITY = 0
+NORMAL_PRIORITY = 5
+LOW_PRIORITY = 9
+
+MAP = "map"
+EXPORT = "export"
+TICKETS = "tickets"
+
+MAX_LISTED_JOBS = 100
+CLAIM_CANDIDATES = 8
+# A running job whose worker has not finished it this long after JOB_TIMEOUT_SECONDS
+# is taken to be abandoned, e.g. by a crashed process, and queued again.
+LEASE_GRACE_SECONDS = 60
+CLEANUP_INTERVAL_SECONDS = 300
+
+JOBS_FINISHED = metrics.Counter(
+    "jobs_finished_total", "Background jobs finished in this worker.", ("kind", "status"))
+JOB_DURATION = metrics.Histogram(
+    "job_duration_seconds", "Time background jobs ran.", ("kind",),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+JOBS_RUNNING = metrics.Gauge("jobs_running", "Background jobs running in this worker.")
+
+
+class JobKind(NamedTuple):
+    params: Type[BaseModel]
+    run: Callable[[User, Any], Awaitable[Tuple[bytes, str]]]
+    check: Optional[Callable[[Any], None]] = None
+
+
+async def _render_map(current_user: User, params: MapJobParams) -> Tuple[bytes, str]:
+    html = await map_service.get_map_html(current_user, params.zoom)
+    if html is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No tickets found for the user.")
+    return html.encode(), "text/html; charset=utf-8"
+
+
+async def _collect(chunks: AsyncIterator[bytes], streamed_by: str) -> bytes:
+    """
+    Gather a streamed result for the jobs table, giving up as soon as it outgrows
+    JOB_MAX_RESULT_BYTES rather than holding an unbounded body in memory and in a row.
+    :param chunks:
+    :param streamed_by: Endpoint that streams the same body without a size limit.
+    :return:
+    """
+    body = bytearray()
+    try:
+        async for chunk in chunks:
+            body += chunk
+            if len(body) > settings.job_max_result_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Result is larger than {settings.job_max_result_bytes} bytes; use {streamed_by}")
+    finally:
+        await chunks.aclose()
+    return bytes(body)
+
+
+async def _export(current_user: User, params: ExportJobParams) -> Tuple[bytes, str]:
+    chunks = bulk_service.export_tickets(current_user, params.format, read_session_factory(current_user.id))
+    return await _collect(chunks, "GET /booking/export"), bulk_service.MEDIA_TYPES[params.format]
+
+
+async def _list_tickets(current_user: User, params: TicketsJobParams) -> Tuple[bytes, str]:
+    chunks = booking_service.stream_tickets(current_user, None, read_session_factory(current_user.id),
+                                            booking_service.parse_fields(params.fields))
+    return await _collect(chunks, "GET /booking/?stream=true"), "application/x-ndjson"
+
+
+JOB_KINDS: Dict[str, JobKind] = {
+    MAP: JobKind(MapJobParams, _render_map),
+    EXPORT: JobKind(ExportJobParams, _export),
+    TICKETS: JobKind(TicketsJobParams, _list_tickets,
+                     check=lambda params: booking_service.parse_fields(params.fields)),
+}
+
+
+async def submit_job(db: AsyncSession, current_user: User, kind: str, params: Dict[str, Any],
+                     priority: int = NORMAL_PRIORITY) -> Job:
+    """
+    Queues a job for the customer and wakes this worker's runner.
+    :param db:
+    :param current_user:
+    :param kind: One of JOB_KINDS.
+    :param params: Parameters of the kind, validated now rather than when the job runs.
+    :param priority: 0 runs first, 9 last.
+    :return: The queued job.
+    """
+    spec = JOB_KINDS.get(kind)
+    if spec is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown job kind {kind}; choose from {', '.join(JOB_KINDS)}")
+    try:
+        checked = spec.params.model_validate(params)
+    except ValidationError as exc:
+        error = exc.errors()[0]
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"params.{'.'.join(map(str, error['loc']))}: {error['msg']}")
+    if spec.check is not None:
+        spec.check(checked)
+
+    pending = await db.scalar(
+        select(func.count()).select_from(Job)
+        .where(Job.customer_id == current_user.id, Job.status.in_(PENDING))
+    )
+    if pending >= settings.job_max_pending:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail=f"{pending} jobs are still pending; wait for one to finish",
+                            headers={"Retry-After": str(int(settings.job_poll_seconds) or 1)})
+
+    job = Job(customer_id=current_user.id, kind=kind, params=checked.model_dump(), priority=priority,
+              status=QUEUED, attempts=0, tm_created=datetime.utcnow())
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    runner.notify()
+    return job
+
+
+async def get_job(job_id: int, db: AsyncSession, current_user: User) -> Job:
+    """
+    Gets a job of the customer, without its result.
+    :param job_id:
+    :param db:
+    :param current_user:
+    :return:
+    """
+    job = await db.scalar(select(Job).where(Job.id == job_id, Job.customer_id == current_user.id))
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+async def get_jobs(db: AsyncSession, current_user: User, limit: int = MAX_LISTED_JOBS) -> List[Job]:
+    """
+    Gets the customer's most recent jobs, newest first.
+    :param db:
+    :param current_user:
+    :param limit:
+    :return:
+    """
+    result = await db.execute(
+        select(Job).where(Job.customer_id == current_user.id).order_by(Job.id.desc()).limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def get_job_result(job_id: int, db: AsyncSession, current_user: User) -> Tuple[bytes, str]:
+    """
+    Gets the result of a finished job.
+    :param job_id:
+    :param db:
+    :param current_user:
+    :return: The result body and its media type.
+    """
+    row = (await db.execute(
+        select(Job.status, Job.error, Job.media_type, Job.result)
+        .where(Job.id == job_id, Job.customer_id == current_user.id)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    if row.status == FAILED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job failed: {row.error}")
+    if row.status != SUCCEEDED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {row.status}",
+                            headers={"Retry-After": str(int(settings.job_poll_seconds) or 1)})
+    return row.result, row.media_type
+
+
+def _claimable(now: datetime):
+    abandoned = now - timedelta(seconds=settings.job_timeout_seconds + LEASE_GRACE_SECONDS)
+    return or_(Job.status == QUEUED, and_(Job.status == RUNNING, Job.tm_started < abandoned))
+
+
+class JobRunner:
+    """
+    Runs jobs in a fixed number of asyncio tasks. Runners claim jobs through the table,
+    so the runners of all worker processes share one queue and a job runs once.
+    An idle runner waits for a job submitted in its own process, or polls the table
+    every JOB_POLL_SECONDS for jobs submitted elsewhere.
+    """
+
+    def __init__(self, workers: int, session_factory=AsyncSessionLocal):
+        """
+        :param workers: Jobs run at once by this runner.
+        :param session_factory: Sessions on the primary for the jobs table.
+        """
+        self.workers = workers
+        self.session_factory = session_factory
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """
+        Start the worker tasks on the running event loop.
+        """
+        if self._tasks or self.workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._clean_up()))
+
+    async def stop(self) -> None:
+        """
+        Stop the worker tasks. Jobs they were running are queued again.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+
+    def notify(self) -> None:
+        """
+        Wake idle worker tasks to look for a new job.
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _work(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await self._claim()
+            except SQLAlchemyError as exc:
+                # Repeats every poll while the database is unreachable; keep it to one line.
+                logger.warning("Could not claim a job: %s", exc.__class__.__name__)
+                job = None
+            if job is not None:
+                await self._run(job)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.job_poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self):
+        """
+        Mark the most urgent claimable job as running by this runner. Another runner may
+        claim a candidate first; the conditional update then matches nothing and the
+        next candidate is tried.
+        """
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            candidates = (await db.execute(
+                select(Job.id).where(_claimable(now)).order_by(Job.priority, Job.id).limit(CLAIM_CANDIDATES)
+            )).scalars().all()
+            for job_id in candidates:
+                claimed = (await db.execute(
+                    update(Job)
+                    .where(Job.id == job_id, _claimable(now))
+                    .values(status=RUNNING, worker=self.name, tm_started=now, attempts=Job.attempts + 1)
+                    .returning(Job.id, Job.customer_id, Job.kind, Job.params, Job.attempts)
+                    .execution_options(synchronize_session=False)
+                )).first()
+                if claimed is not None:
+                    await db.commit()
+                    return claimed
+        return None
+
+    async def _run(self, job) -> None:
+        spec = JOB_KINDS.get(job.kind)
+        started = time.perf_counter()
+        JOBS_RUNNING.inc()
+        outcome = {"status": FAILED}
+        try:
+            if spec is None:
+                raise ValueError(f"Unknown job kind {job.kind}")
+            if job.attempts > settings.job_max_attempts:
+                raise RuntimeError(f"Abandoned by its worker {job.attempts - 1} times")
+            async with self.session_factory() as db:
+                customer = await db.get(User, job.customer_id)
+            if customer is None:
+                raise RuntimeError("Customer no longer exists")
+            body, media_type = await asyncio.wait_for(
+                spec.run(customer, spec.params.model_validate(job.params)), settings.job_timeout_seconds)
+            outcome = {"status": SUCCEEDED, "result": body, "media_type": media_type}
+        except asyncio.CancelledError:
+            await self._finish(job.id, status=QUEUED, worker=None, tm_started=None, attempts=Job.attempts - 1)
+            raise
+        except asyncio.TimeoutError:
+            outcome["error"] = f"Timed out after {settings.job_timeout_seconds:g}s"
+        except HTTPException as exc:
+            outcome["error"] = exc.detail
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed", job.id, job.kind)
+            outcome["error"] = str(exc) or type(exc).__name__
+        finally:
+            JOBS_RUNNING.dec()
+
+        JOB_DURATION.observe(time.perf_counter() - started, kind=job.kind)
+        JOBS_FINISHED.inc(kind=job.kind, status=outcome["status"])
+        await self._finish(job.id, tm_finished=datetime.utcnow(), **outcome)
+
+    async def _finish(self, job_id: int, **values) -> None:
+        """
+        Record the outcome of a job, unless it was taken over since this runner claimed it.
+        """
+        try:
+            async with self.session_factory() as db:
+                await db.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == RUNNING, Job.worker == self.name)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except SQLAlchemyError:
+            logger.warning("Could not record the outcome of job %s", job_id, exc_info=True)
+
+    async def _clean_up(self) -> None:
+        """
+        Delete finished jobs once their results are older than JOB_RESULT_TTL, and ticket
+        tombstones older than SYNC_TOMBSTONE_TTL.
+        """
+        while True:
+            await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+            now = datetime.utcnow()
+            expired = now - timedelta(seconds=settings.job_result_ttl)
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(delete(Job).where(Job.status.in_(FINISHED), Job.tm_finished < expired))
+                    await db.commit()
+            except SQLAlchemyError:
+                logger.warning("Could not delete expired jobs", exc_info=True)
+            try:
+                async with self.session_factory() as db:
+                    await sync_service.prune_tombstones(db, now - timedelta(seconds=settings.sync_tombstone_ttl))
+            except SQLAlchemyError:
+                logger.warning("Could not prune ticket tombstones", exc_info=True)
+
+
+runner = JobRunner(settings.job_workers)
+
+
+async def _serve(workers: int) -> None:
+    worker = JobRunner(workers)
+    worker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=max(settings.job_workers, 1), help="jobs run at once")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve(args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
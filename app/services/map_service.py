@@ -0,0 +1,108 @@
+import math
+from typing import Dict, List, Optional, Sequence
+
+from starlette.concurrency import run_in_threadpool
+
+from ..core.cache import LRUCache
+from ..core.config import MAP_CACHE_SIZE
+from ..db.routing import read_session
+from ..models.user import User
+from . import booking_service, version_service
+
+CLUSTER_RADIUS_PX = 40
+TILE_SIZE_PX = 256
+
+_map_cache = LRUCache(maxsize=MAP_CACHE_SIZE)
+
+
+def cluster_points(points: Sequence[Dict], zoom: int) -> List[Dict]:
+    """
+    Group points into clusters on a grid whose cells span CLUSTER_RADIUS_PX at the given zoom level.
+
+    :param points: Mappings with id, hotel, latitude and longitude.
+    :param zoom: Map zoom level.
+    :return: Clusters with their count, centroid and, for single points, the ticket id and hotel.
+    """
+    cell_deg = 360.0 / (TILE_SIZE_PX * 2 ** zoom) * CLUSTER_RADIUS_PX
+    cells: Dict[tuple, Dict] = {}
+
+    for point in points:
+        key = (math.floor(point['latitude'] / cell_deg), math.floor(point['longitude'] / cell_deg))
+        cluster = cells.get(key)
+        if cluster is None:
+            cells[key] = {'count': 1, 'lat_sum': point['latitude'], 'lon_sum': point['longitude'],
+                          'id': point['id'], 'hotel': point['hotel']}
+        else:
+            cluster['count'] += 1
+            cluster['lat_sum'] += point['latitude']
+            cluster['lon_sum'] += point['longitude']
+
+    return [
+        {'count': cluster['count'],
+         'latitude': cluster['lat_sum'] / cluster['count'],
+         'longitude': cluster['lon_sum'] / cluster['count'],
+         'id': cluster['id'],
+         'hotel': cluster['hotel']}
+        for cluster in cells.values()
+    ]
+
+
+def render_map(location: Sequence[float], clusters: Sequence[Dict], zoom: int) -> str:
+    """
+    Render clusters as folium map HTML. CPU-bound, run it off the event loop.
+
+    :param location: Initial map centre as [latitude, longitude].
+    :param clusters: Clusters produced by cluster_points.
+    :param zoom: Initial zoom level.
+    :return: The map HTML.
+    """
+    # folium pulls in branca, jinja2 and requests; load it with the first map, not at startup.
+    import folium
+
+    m = folium.Map(location=list(location), zoom_start=zoom)
+
+    for cluster in clusters:
+        if cluster['count'] == 1:
+            radius = 5
+            popup = f"ID: {cluster['id']}, Hotel: {cluster['hotel']}"
+        else:
+            radius = 5 + 3 * math.log2(cluster['count'])
+            popup = f"{cluster['count']} tickets"
+
+        folium.CircleMarker(
+            location=[cluster['latitude'], cluster['longitude']],
+            radius=radius,
+            color='red',
+            fill=True,
+            fill_color='red',
+            popup=popup
+        ).add_to(m)
+
+    return m._repr_html_()
+
+
+async def get_map_html(current_user: User, zoom: int) -> Optional[str]:
+    """
+    Get the rendered ticket map of a user.
+    The HTML is cached per user and zoom level under the user's ticket version, which is
+    stored in the database, so a cached map is never served after a change made through
+    any worker. A repeat view costs one single-row lookup; only a miss reads the tickets.
+
+    :param current_user: The ticket owner.
+    :param zoom: Initial zoom level; also the clustering level.
+    :return: The map HTML, or None if the user has no tickets.
+    """
+    async with read_session(current_user.id) as db:
+        key = (current_user.id, await version_service.user_version(db, current_user.id), zoom)
+        html = _map_cache.get(key)
+        if html is not None:
+            return html
+        data = await booking_service.get_coordinates(db, current_user)
+    if not data:
+        return None
+
+    first_entry = data[0]
+    location = [first_entry['latitude'], first_entry['longitude']]
+    html = await run_in_threadpool(lambda: render_map(location, cluster_points(data, zoom), zoom))
+    _map_cache.set(key, html)
+    return html
@@ -0,0 +1,160 @@
+import re
+from typing import List
+
+from sqlalchemy import DDL, column, event, literal_column, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..models.user import User, Ticket
+
+PREFIX = "prefix"
+FUZZY = "fuzzy"
+
+# The searchable document. Kept as literal SQL so that Postgres matches it against
+# the expression indexes below.
+_DOCUMENT = "tickets.place || ' ' || tickets.city || ' ' || tickets.hotel"
+
+# Both FTS5 tables carry the owner: tickets_fts indexes it, so a prefix search matches
+# customer_id : N inside the index. The trigram tokenizer cannot index short numbers,
+# so tickets_fts_trigram keeps customer_id UNINDEXED and fuzzy searches filter on it
+# inside the FTS5 scan, before ranking.
+SQLITE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+        place, city, hotel, customer_id,
+        content='tickets', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts_trigram USING fts5(
+        place, city, hotel, customer_id UNINDEXED,
+        content='tickets', content_rowid='id',
+        tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_ai AFTER INSERT ON tickets BEGIN
+        INSERT INTO tickets_fts(rowid, place, city, hotel, customer_id)
+        VALUES (new.id, new.place, new.city, new.hotel, new.customer_id);
+        INSERT INTO tickets_fts_trigram(rowid, place, city, hotel, customer_id)
+        VALUES (new.id, new.place, new.city, new.hotel, new.customer_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_ad AFTER DELETE ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, place, city, hotel, customer_id)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel, old.customer_id);
+        INSERT INTO tickets_fts_trigram(tickets_fts_trigram, rowid, place, city, hotel, customer_id)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel, old.customer_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_au AFTER UPDATE OF place, city, hotel, customer_id ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, place, city, hotel, customer_id)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel, old.customer_id);
+        INSERT INTO tickets_fts_trigram(tickets_fts_trigram, rowid, place, city, hotel, customer_id)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel, old.customer_id);
+        INSERT INTO tickets_fts(rowid, place, city, hotel, customer_id)
+        VALUES (new.id, new.place, new.city, new.hotel, new.customer_id);
+        INSERT INTO tickets_fts_trigram(rowid, place, city, hotel, customer_id)
+        VALUES (new.id, new.place, new.city, new.hotel, new.customer_id);
+    END""",
+    "INSERT INTO tickets_fts(tickets_fts) VALUES ('rebuild')",
+    "INSERT INTO tickets_fts_trigram(tickets_fts_trigram) VALUES ('rebuild')",
+]
+
+# btree_gin lets customer_id lead both GIN indexes, so a search only visits the
+# entries of the searching customer.
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    f"""CREATE INDEX IF NOT EXISTS ix_tickets_search_tsv ON tickets
+    USING gin (customer_id, to_tsvector('simple', {_DOCUMENT}))""",
+    f"""CREATE INDEX IF NOT EXISTS ix_tickets_search_trgm ON tickets
+    USING gin (customer_id, ({_DOCUMENT}) gin_trgm_ops)""",
+]
+
+# Keep the text index in step with Base.metadata.create_all; migrations carry their own copy.
+for _statement in SQLITE_SEARCH_DDL:
+    event.listen(Ticket.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in POSTGRES_SEARCH_DDL:
+    event.listen(Ticket.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
+
+def _terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def _fts5_string(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _sqlite_query(current_user: User, terms: List[str], mode: str):
+    if mode == PREFIX:
+        match = f"customer_id : {current_user.id} AND {{place city hotel}} : (" + \
+                " AND ".join(_fts5_string(term) + "*" for term in terms) + ")"
+        name, weights = "tickets_fts", "10.0, 5.0, 5.0, 0.0"
+    else:
+        trigrams = {term[i:i + 3] for term in terms for i in range(max(len(term) - 2, 1))}
+        match = " OR ".join(_fts5_string(trigram) for trigram in sorted(trigrams))
+        name, weights = "tickets_fts_trigram", "10.0, 5.0, 5.0, 0.0"
+
+    fts = table(name, column("rowid"), column("customer_id"))
+    return (
+        select(Ticket)
+        .join(fts, fts.c.rowid == Ticket.id)
+        .where(text(f"{name} MATCH :match").bindparams(match=match),
+               fts.c.customer_id == current_user.id,
+               Ticket.customer_id == current_user.id)
+        .order_by(literal_column(f"bm25({name}, {weights})"), Ticket.id)
+    )
+
+
+def _postgres_query(current_user: User, terms: List[str], mode: str):
+    if mode == PREFIX:
+        vector = f"to_tsvector('simple', {_DOCUMENT})"
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        condition = text(f"{vector} @@ to_tsquery('simple', :match_query)").bindparams(match_query=tsquery)
+        rank = text(f"ts_rank({vector}, to_tsquery('simple', :rank_query)) DESC").bindparams(rank_query=tsquery)
+    else:
+        phrase = " ".join(terms)
+        condition = text(f":match_query <% ({_DOCUMENT})").bindparams(match_query=phrase)
+        rank = text(f"word_similarity(:rank_query, {_DOCUMENT}) DESC").bindparams(rank_query=phrase)
+
+    return select(Ticket).where(Ticket.customer_id == current_user.id, condition).order_by(rank, Ticket.id)
+
+
+def _generic_query(current_user: User, terms: List[str]):
+    query = select(Ticket).where(Ticket.customer_id == current_user.id)
+    for term in terms:
+        pattern = f"{term}%"
+        query = query.where(Ticket.place.ilike(pattern) | Ticket.city.ilike(pattern) | Ticket.hotel.ilike(pattern))
+    return query.order_by(Ticket.id)
+
+
+async def search_tickets(db: AsyncSession, current_user: User, query: str, mode: str = PREFIX,
+                         limit: int = 20, offset: int = 0) -> List[Ticket]:
+    """
+    Search a customer's tickets by place, city and hotel, best matches first.
+
+    Prefix mode matches tickets where every query word starts a word of the ticket.
+    Fuzzy mode ranks tickets by trigram overlap with the query, so typos still match.
+    SQLite uses FTS5 tables, Postgres tsvector and pg_trgm expression indexes.
+
+    :param db: The database session.
+    :param current_user: The ticket owner.
+    :param query: The search text.
+    :param mode: PREFIX or FUZZY.
+    :param limit: Page size.
+    :param offset: Number of matches to skip.
+    :return: The matching tickets.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+    if mode == FUZZY and all(len(term) < 3 for term in terms):
+        # Trigram matching needs at least three characters.
+        mode = PREFIX
+
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        statement = _sqlite_query(current_user, terms, mode)
+    elif dialect == "postgresql":
+        statement = _postgres_query(current_user, terms, mode)
+    else:
+        statement = _generic_query(current_user, terms)
+
+    result = await db.execute(statement.limit(limit).offset(offset))
+    return result.scalars().all()
@@ -0,0 +1,225 @@
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import DDL, distinct, event, extract, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..db.base import Base
+from ..models.user import User, TicketStat
+
+USER_SCOPE = "user"
+GLOBAL_SCOPE = "global"
+
+DAY = "day"
+MONTH = "month"
+YEAR = "year"
+
+# ticket_stats holds one row per (customer, city, hotel, creation day). Triggers on
+# tickets keep it in step inside the writing transaction, so every write path, batch
+# endpoints included, maintains it, and reads aggregate groups instead of tickets.
+# Tickets without an owner or creation time are not counted. The backfill only runs
+# into an empty summary, so repeating the DDL is harmless. The coordinate sums are
+# floats added to and subtracted from on every write, so they drift slowly;
+# `python -m app.db.checks --recompute-stats` rebuilds the summary from the tickets.
+_SQLITE_ADD_NEW = """INSERT INTO ticket_stats (customer_id, city, hotel, day, tickets, latitude_sum, longitude_sum)
+        SELECT new.customer_id, new.city, new.hotel, date(new.tm_created), 1, new.latitude, new.longitude
+        WHERE new.customer_id IS NOT NULL AND new.tm_created IS NOT NULL
+        ON CONFLICT (customer_id, city, hotel, day) DO UPDATE SET
+            tickets = tickets + 1,
+            latitude_sum = latitude_sum + excluded.latitude_sum,
+            longitude_sum = longitude_sum + excluded.longitude_sum;"""
+
+_SQLITE_REMOVE_OLD = """UPDATE ticket_stats SET
+            tickets = tickets - 1,
+            latitude_sum = latitude_sum - old.latitude,
+            longitude_sum = longitude_sum - old.longitude
+        WHERE customer_id = old.customer_id AND city = old.city AND hotel = old.hotel
+            AND day = date(old.tm_created);
+        DELETE FROM ticket_stats
+        WHERE customer_id = old.customer_id AND city = old.city AND hotel = old.hotel
+            AND day = date(old.tm_created) AND tickets <= 0;"""
+
+SQLITE_STATS_BACKFILL = """INSERT INTO ticket_stats (customer_id, city, hotel, day, tickets, latitude_sum, longitude_sum)
+    SELECT customer_id, city, hotel, date(tm_created), count(*), sum(latitude), sum(longitude)
+    FROM tickets WHERE customer_id IS NOT NULL AND tm_created IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM ticket_stats)
+    GROUP BY customer_id, city, hotel, date(tm_created)"""
+
+SQLITE_STATS_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_ai AFTER INSERT ON tickets BEGIN
+        {_SQLITE_ADD_NEW}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_ad AFTER DELETE ON tickets BEGIN
+        {_SQLITE_REMOVE_OLD}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_au
+    AFTER UPDATE OF customer_id, city, hotel, latitude, longitude, tm_created ON tickets BEGIN
+        {_SQLITE_REMOVE_OLD}
+        {_SQLITE_ADD_NEW}
+    END""",
+    SQLITE_STATS_BACKFILL,
+]
+
+POSTGRES_STATS_BACKFILL = """INSERT INTO ticket_stats (customer_id, city, hotel, day, tickets, latitude_sum, longitude_sum)
+    SELECT customer_id, city, hotel, tm_created::date, count(*), sum(latitude), sum(longitude)
+    FROM tickets WHERE customer_id IS NOT NULL AND tm_created IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM ticket_stats)
+    GROUP BY customer_id, city, hotel, tm_created::date"""
+
+POSTGRES_STATS_DDL = [
+    """CREATE OR REPLACE FUNCTION ticket_stats_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE ticket_stats SET
+                tickets = tickets - 1,
+                latitude_sum = latitude_sum - OLD.latitude,
+                longitude_sum = longitude_sum - OLD.longitude
+            WHERE customer_id = OLD.customer_id AND city = OLD.city AND hotel = OLD.hotel
+                AND day = OLD.tm_created::date;
+            DELETE FROM ticket_stats
+            WHERE customer_id = OLD.customer_id AND city = OLD.city AND hotel = OLD.hotel
+                AND day = OLD.tm_created::date AND tickets <= 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.customer_id IS NOT NULL AND NEW.tm_created IS NOT NULL THEN
+            INSERT INTO ticket_stats (customer_id, city, hotel, day, tickets, latitude_sum, longitude_sum)
+            VALUES (NEW.customer_id, NEW.city, NEW.hotel, NEW.tm_created::date, 1, NEW.latitude, NEW.longitude)
+            ON CONFLICT (customer_id, city, hotel, day) DO UPDATE SET
+                tickets = ticket_stats.tickets + 1,
+                latitude_sum = ticket_stats.latitude_sum + EXCLUDED.latitude_sum,
+                longitude_sum = ticket_stats.longitude_sum + EXCLUDED.longitude_sum;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS ticket_stats_maintain ON tickets",
+    """CREATE TRIGGER ticket_stats_maintain
+    AFTER INSERT OR DELETE OR UPDATE OF customer_id, city, hotel, latitude, longitude, tm_created ON tickets
+    FOR EACH ROW EXECUTE FUNCTION ticket_stats_apply()""",
+    POSTGRES_STATS_BACKFILL,
+]
+
+# The triggers need both tables, so they follow Base.metadata.create_all as a whole;
+# migrations carry their own copy.
+for _statement in SQLITE_STATS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in POSTGRES_STATS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
+
+def _scoped(query, current_user: User, scope: str):
+    if scope == USER_SCOPE:
+        return query.where(TicketStat.customer_id == current_user.id)
+    return query
+
+
+def _centroid():
+    total = func.sum(TicketStat.tickets)
+    return (
+        (func.sum(TicketStat.latitude_sum) / total).label("centroid_latitude"),
+        (func.sum(TicketStat.longitude_sum) / total).label("centroid_longitude"),
+    )
+
+
+async def get_summary(db: AsyncSession, current_user: User, scope: str = USER_SCOPE) -> dict:
+    """
+    Ticket count, distinct cities and hotels, the mean position and the first and last booking day.
+
+    :param db:
+    :param current_user:
+    :param scope: 'user' for the current user's tickets, 'global' for everyone's.
+    :return:
+    """
+    hotels = _scoped(select(TicketStat.city, TicketStat.hotel).distinct(), current_user, scope).subquery()
+    query = select(
+        func.coalesce(func.sum(TicketStat.tickets), 0).label("tickets"),
+        func.count(distinct(TicketStat.city)).label("cities"),
+        select(func.count()).select_from(hotels).scalar_subquery().label("hotels"),
+        *_centroid(),
+        func.min(TicketStat.day).label("first_day"),
+        func.max(TicketStat.day).label("last_day"),
+    )
+    result = await db.execute(_scoped(query, current_user, scope))
+    return result.one()._asdict()
+
+
+async def get_city_stats(db: AsyncSession, current_user: User, scope: str = USER_SCOPE,
+                         limit: int = 100) -> List[dict]:
+    """
+    Tickets and mean position per city, busiest first.
+
+    :param db:
+    :param current_user:
+    :param scope: 'user' or 'global'.
+    :param limit:
+    :return:
+    """
+    tickets = func.sum(TicketStat.tickets).label("tickets")
+    query = (
+        select(TicketStat.city, tickets, *_centroid())
+        .group_by(TicketStat.city)
+        .order_by(tickets.desc(), TicketStat.city)
+        .limit(limit)
+    )
+    result = await db.execute(_scoped(query, current_user, scope))
+    return [row._asdict() for row in result]
+
+
+async def get_hotel_stats(db: AsyncSession, current_user: User, scope: str = USER_SCOPE,
+                          city: Optional[str] = None, limit: int = 100) -> List[dict]:
+    """
+    Tickets and mean position per hotel, busiest first.
+
+    :param db:
+    :param current_user:
+    :param scope: 'user' or 'global'.
+    :param city: Only hotels in this city.
+    :param limit:
+    :return:
+    """
+    tickets = func.sum(TicketStat.tickets).label("tickets")
+    query = (
+        select(TicketStat.city, TicketStat.hotel, tickets, *_centroid())
+        .group_by(TicketStat.city, TicketStat.hotel)
+        .order_by(tickets.desc(), TicketStat.city, TicketStat.hotel)
+        .limit(limit)
+    )
+    if city is not None:
+        query = query.where(TicketStat.city == city)
+    result = await db.execute(_scoped(query, current_user, scope))
+    return [row._asdict() for row in result]
+
+
+async def get_timeline(db: AsyncSession, current_user: User, scope: str = USER_SCOPE, interval: str = DAY,
+                       since: Optional[date] = None, until: Optional[date] = None) -> List[dict]:
+    """
+    Tickets created per day, month or year, oldest first.
+
+    :param db:
+    :param current_user:
+    :param scope: 'user' or 'global'.
+    :param interval: 'day', 'month' or 'year'.
+    :param since: First day to count, inclusive.
+    :param until: Last day to count, inclusive.
+    :return:
+    """
+    tickets = func.sum(TicketStat.tickets).label("tickets")
+    if interval == DAY:
+        keys = [TicketStat.day]
+    else:
+        keys = [extract("year", TicketStat.day).label("year")]
+        if interval == MONTH:
+            keys.append(extract("month", TicketStat.day).label("month"))
+
+    query = select(*keys, tickets).group_by(*keys).order_by(*keys)
+    if since is not None:
+        query = query.where(TicketStat.day >= since)
+    if until is not None:
+        query = query.where(TicketStat.day <= until)
+
+    result = await db.execute(_scoped(query, current_user, scope))
+    if interval == DAY:
+        return [{"period": row.day.isoformat(), "tickets": row.tickets} for row in result]
+    if interval == MONTH:
+        return [{"period": f"{int(row.year):04d}-{int(row.month):02d}", "tickets": row.tickets} for row in result]
+    return [{"period": f"{int(row.year):04d}", "tickets": row.tickets} for row in result]
@@ -0,0 +1,177 @@
+from datetime import datetime
+from typing import Dict
+
+from fastapi import HTTPException, status
+from sqlalchemy import DDL, and_, delete, event, exists, func, literal, null, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..db.base import Base
+from ..models.user import User, Ticket, TicketChangeCounter, TicketTombstone
+from .booking_service import TICKET_OUT_FIELDS
+
+# Every insert, update and delete of a ticket takes the next number of its customer's
+# counter in ticket_change_counters: inserts and updates store it in tickets.change_seq,
+# deletes in a tombstone. Bumping the counter row locks it until commit, so a customer's
+# numbers become visible in order and a client that has seen everything up to N only
+# ever needs the rows above N. tm_updated could not serve as the cursor: it is unset
+# for tickets never updated and, taken at write time, not in commit order.
+# Existing tickets are numbered by id; repeating the DDL is harmless.
+_SQLITE_NEXT_SEQ = """INSERT INTO ticket_change_counters (customer_id, seq)
+        SELECT {row}.customer_id, 1 WHERE {row}.customer_id IS NOT NULL
+        ON CONFLICT (customer_id) DO UPDATE SET seq = seq + 1;"""
+
+_SQLITE_STAMP_NEW = """UPDATE tickets SET change_seq =
+            (SELECT seq FROM ticket_change_counters WHERE customer_id = new.customer_id)
+        WHERE id = new.id;"""
+
+_BACKFILL = [
+    "UPDATE tickets SET change_seq = id WHERE change_seq IS NULL",
+    """INSERT INTO ticket_change_counters (customer_id, seq)
+    SELECT customer_id, max(id) FROM tickets WHERE customer_id IS NOT NULL GROUP BY customer_id
+    ON CONFLICT (customer_id) DO NOTHING""",
+]
+
+SQLITE_SYNC_DDL = _BACKFILL + [
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_changes_ai AFTER INSERT ON tickets BEGIN
+        {_SQLITE_NEXT_SEQ.format(row="new")}
+        {_SQLITE_STAMP_NEW}
+        DELETE FROM ticket_tombstones WHERE id = new.id;
+    END""",
+    # Leaves change_seq out of the column list, so stamping a row does not fire it again.
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_changes_au
+    AFTER UPDATE OF place, city, hotel, latitude, longitude, tm_created, tm_updated, geohash, customer_id
+    ON tickets BEGIN
+        {_SQLITE_NEXT_SEQ.format(row="new")}
+        {_SQLITE_STAMP_NEW}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_changes_ad AFTER DELETE ON tickets BEGIN
+        {_SQLITE_NEXT_SEQ.format(row="old")}
+        INSERT OR REPLACE INTO ticket_tombstones (id, customer_id, change_seq, tm_deleted)
+        SELECT old.id, old.customer_id, seq, datetime('now')
+        FROM ticket_change_counters WHERE customer_id = old.customer_id;
+    END""",
+]
+
+POSTGRES_SYNC_DDL = [
+    """CREATE OR REPLACE FUNCTION ticket_changes_apply() RETURNS trigger AS $$
+    DECLARE
+        owner integer;
+        next_seq bigint;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            owner := OLD.customer_id;
+        ELSE
+            owner := NEW.customer_id;
+        END IF;
+        IF owner IS NOT NULL THEN
+            INSERT INTO ticket_change_counters AS counter (customer_id, seq) VALUES (owner, 1)
+            ON CONFLICT (customer_id) DO UPDATE SET seq = counter.seq + 1
+            RETURNING seq INTO next_seq;
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            IF owner IS NOT NULL THEN
+                INSERT INTO ticket_tombstones (id, customer_id, change_seq, tm_deleted)
+                VALUES (OLD.id, owner, next_seq, now() AT TIME ZONE 'utc')
+                ON CONFLICT (id) DO UPDATE SET
+                    customer_id = EXCLUDED.customer_id,
+                    change_seq = EXCLUDED.change_seq,
+                    tm_deleted = EXCLUDED.tm_deleted;
+            END IF;
+            RETURN OLD;
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+            DELETE FROM ticket_tombstones WHERE id = NEW.id;
+        END IF;
+        NEW.change_seq := next_seq;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS ticket_changes_seq ON tickets",
+] + _BACKFILL + [
+    """CREATE TRIGGER ticket_changes_seq BEFORE INSERT OR UPDATE OR DELETE ON tickets
+    FOR EACH ROW EXECUTE FUNCTION ticket_changes_apply()""",
+]
+
+for _statement in SQLITE_SYNC_DDL:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in POSTGRES_SYNC_DDL:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
+
+async def get_changes(db: AsyncSession, current_user: User, since: int = 0, limit: int = 1000) -> Dict:
+    """
+    Tickets changed and tickets deleted after a change sequence number, oldest change first.
+    :param db:
+    :param current_user:
+    :param since: The cursor of the previous call; 0 returns every ticket.
+    :param limit: Most changes to return.
+    :return: The changed tickets, the deleted ids, the cursor to pass next time and
+        whether more changes follow it.
+    :raises HTTPException: 410 if deletions after `since` have been pruned; the client
+        must sync again from 0 and replace its copy.
+    """
+    # One statement, so tickets and tombstones come from the same snapshot: read apart,
+    # a ticket deleted in between could be missed by both. Each branch takes its first
+    # limit + 1 changes through its (customer_id, change_seq) index.
+    tickets = (
+        select(*(getattr(Ticket, name) for name in TICKET_OUT_FIELDS), Ticket.change_seq,
+               literal(False).label("deleted"))
+        .where(Ticket.customer_id == current_user.id, Ticket.change_seq > since)
+        .order_by(Ticket.change_seq)
+        .limit(limit + 1)
+        .subquery()
+    )
+    tombstones = (
+        select(*(TicketTombstone.id if name == "id" else null().label(name) for name in TICKET_OUT_FIELDS),
+               TicketTombstone.change_seq, literal(True).label("deleted"))
+        .where(TicketTombstone.customer_id == current_user.id, TicketTombstone.change_seq > since)
+        .order_by(TicketTombstone.change_seq)
+        .limit(limit + 1)
+        .subquery()
+    )
+    changes = union_all(select(tickets), select(tombstones)).subquery()
+    rows = (await db.execute(select(changes).order_by(changes.c.change_seq).limit(limit + 1))).all()
+
+    if since > 0:
+        # Read after the changes: a prune that ran in between is then noticed here.
+        pruned_seq = await db.scalar(
+            select(TicketChangeCounter.pruned_seq).where(TicketChangeCounter.customer_id == current_user.id))
+        if pruned_seq is not None and since < pruned_seq:
+            raise HTTPException(status_code=status.HTTP_410_GONE,
+                                detail="Deletions since this cursor are no longer kept; sync again from 0")
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "tickets": [{name: row._mapping[name] for name in TICKET_OUT_FIELDS} for row in rows if not row.deleted],
+        "deleted": [row.id for row in rows if row.deleted],
+        "cursor": rows[-1].change_seq if rows else since,
+        "has_more": has_more,
+    }
+
+
+async def prune_tombstones(db: AsyncSession, before: datetime) -> None:
+    """
+    Delete tombstones of tickets deleted before a time, first raising each customer's
+    pruned_seq to the newest of them so get_changes refuses cursors that could have
+    missed one.
+    :param db:
+    :param before:
+    :return:
+    """
+    newest_pruned = (
+        select(func.max(TicketTombstone.change_seq))
+        .where(TicketTombstone.customer_id == TicketChangeCounter.customer_id, TicketTombstone.tm_deleted < before)
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(TicketChangeCounter)
+        .where(exists().where(and_(TicketTombstone.customer_id == TicketChangeCounter.customer_id,
+                                   TicketTombstone.tm_deleted < before,
+                                   TicketTombstone.change_seq > TicketChangeCounter.pruned_seq)))
+        .values(pruned_seq=newest_pruned)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(delete(TicketTombstone).where(TicketTombstone.tm_deleted < before))
+    await db.commit()
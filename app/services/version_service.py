@@ -0,0 +1,40 @@
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..models.user import Ticket, TicketChangeCounter
+
+# Versions are read from the change sequence that the database triggers of
+# sync_service keep: every insert, update and delete of a ticket advances its
+# customer's counter and stamps the ticket with the new number. The versions are
+# therefore the same in every worker process and cover writes made by any of them,
+# or outside the API. Read a version in the session that reads the data it versions,
+# and before the data: on a lagging replica the version is then never newer than the
+# data sent with it.
+
+
+async def user_version(db: AsyncSession, user_id: int) -> str:
+    """
+    Current version of a user's tickets.
+
+    :param db:
+    :param user_id: The ticket owner.
+    :return: An opaque version string that changes whenever the user's tickets change.
+    """
+    seq = await db.scalar(select(TicketChangeCounter.seq).where(TicketChangeCounter.customer_id == user_id))
+    return str(seq or 0)
+
+
+async def ticket_version(db: AsyncSession, user_id: int, ticket_id: int) -> Optional[str]:
+    """
+    Current version of a single ticket.
+
+    :param db:
+    :param user_id: The ticket owner.
+    :param ticket_id: The ticket.
+    :return: An opaque version string that changes whenever the ticket changes, or None
+        if the user has no such ticket.
+    """
+    seq = await db.scalar(select(Ticket.change_seq).where(Ticket.id == ticket_id, Ticket.customer_id == user_id))
+    return None if seq is None else str(seq)
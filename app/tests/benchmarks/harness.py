@@ -0,0 +1,147 @@
+"""
+Shared plumbing for the in-process benchmarks: database setup, seeding, an ASGI
+client for app.main:app and per-request SQL statement counting.
+"""
+import contextvars
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+PASSWORD = "password"
+DROP_TABLES_FLAG = "--i-know-this-drops-tables"
+
+_statements: contextvars.ContextVar = contextvars.ContextVar("benchmark_statements", default=None)
+# Set by configure once the database may be wiped: a scratch file, or a URL given with DROP_TABLES_FLAG.
+_may_drop_tables = False
+
+
+def configure(database_url: Optional[str] = None, drop_tables: bool = False) -> str:
+    """
+    Point the application at the benchmark database. Must run before app modules are imported.
+    The benchmarks start by dropping every table, so a database other than the default
+    scratch file is refused unless drop_tables confirms that it may be wiped.
+
+    :param database_url: Database URL; defaults to BENCHMARK_DATABASE_URL, then a throwaway SQLite file.
+    :param drop_tables: Whether the tables of a given database may be dropped.
+    :return: The URL in use.
+    """
+    global _may_drop_tables
+    url = database_url or os.getenv("BENCHMARK_DATABASE_URL")
+    if url is None:
+        url = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db"
+    elif not drop_tables:
+        from sqlalchemy.engine import make_url
+
+        raise SystemExit(f"The benchmark drops every table of {make_url(url).render_as_string()}; "
+                         f"pass {DROP_TABLES_FLAG} if that database is disposable.")
+    _may_drop_tables = True
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    # A handful of simulated users send far more than any real one; measure the API, not the limiter.
+    os.environ.setdefault("RATE_LIMIT_PER_SECOND", "0")
+    return url
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """
+    p50/p95/p99/max of latency samples in milliseconds.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99), "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+def _count_statement(*args) -> None:
+    counter = _statements.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def install_statement_counter() -> None:
+    """
+    Count SQL statements per task; see count_statements.
+    """
+    from sqlalchemy import event
+    from app.db.base import engine
+
+    if not event.contains(engine.sync_engine, "before_cursor_execute", _count_statement):
+        event.listen(engine.sync_engine, "before_cursor_execute", _count_statement)
+
+
+def count_statements() -> List[int]:
+    """
+    Start counting the statements run on behalf of the current task.
+    The in-process client runs the app inside the calling task, so everything a request
+    executes lands in the returned counter.
+
+    :return: A one-element list holding the running count.
+    """
+    counter = [0]
+    _statements.set(counter)
+    return counter
+
+
+async def reset_schema() -> None:
+    """
+    Drop and recreate every table. Refused unless configure accepted the database.
+    """
+    if not _may_drop_tables:
+        raise RuntimeError("reset_schema drops every table; call configure first")
+    import app.main  # noqa: F401  registers every model and DDL hook on the metadata
+    from app.db.base import Base, engine
+
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+def client():
+    """
+    An httpx client that calls app.main:app in-process.
+    """
+    import httpx
+    from app.main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+async def register(client, username: str) -> None:
+    response = await client.post("/auth/register", json={
+        "username": username, "email": f"{username}@example.com", "password": PASSWORD})
+    response.raise_for_status()
+
+
+async def login(client, username: str) -> Dict[str, str]:
+    """
+    Log in and return the authorization headers.
+    """
+    response = await client.post("/auth/token", data={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def ticket_payload(index: int) -> Dict:
+    """
+    A deterministic ticket spread over a handful of cities and hotels.
+    """
+    return {
+        "place": f"place {index % 50}",
+        "city": f"city {index % 10}",
+        "hotel": f"hotel {index % 25}",
+        "latitude": 40.0 + (index % 1000) / 100.0,
+        "longitude": 20.0 + (index % 700) / 100.0,
+    }
+
+
+async def seed_tickets(client, headers: Dict[str, str], count: int, batch_size: int = 500) -> None:
+    for start in range(0, count, batch_size):
+        response = await client.post("/booking/batch", headers=headers,
+                                     json=[ticket_payload(i) for i in range(start, min(count, start + batch_size))])
+        response.raise_for_status()
@@ -0,0 +1,90 @@
+"""
+Latency of booking requests while logins run at the same time.
+
+Runs app.main:app in-process against a throwaway SQLite database, measures GET /booking/
+latency on an idle worker and again while concurrent clients keep logging in, and prints
+both as JSON. --inline-hashing hashes on the event loop, as before the hashing pool.
+
+    python -m app.tests.benchmarks.login_contention --logins 8 --duration 5
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+from . import harness
+
+
+async def _booking_loop(client, headers, deadline: float) -> List[float]:
+    latencies = []
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get("/booking/", headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def _login_loop(client, username: str, deadline: float) -> int:
+    logins = 0
+    while time.perf_counter() < deadline:
+        await harness.login(client, username)
+        logins += 1
+    return logins
+
+
+async def run(logins: int, duration: float, inline_hashing: bool) -> Dict:
+    from app.core.security import hashing
+
+    if inline_hashing:
+        async def _inline(func, *args):
+            return func(*args)
+        hashing._run = _inline
+
+    await harness.reset_schema()
+
+    async with harness.client() as client:
+        usernames = [f"bench{i}" for i in range(logins + 1)]
+        for username in usernames:
+            await harness.register(client, username)
+
+        headers = await harness.login(client, usernames[0])
+        await harness.seed_tickets(client, headers, 20)
+
+        idle = await _booking_loop(client, headers, time.perf_counter() + duration)
+
+        deadline = time.perf_counter() + duration
+        results = await asyncio.gather(
+            _booking_loop(client, headers, deadline),
+            *(_login_loop(client, username, deadline) for username in usernames[1:]),
+        )
+
+    return {
+        "inline_hashing": inline_hashing,
+        "concurrent_logins": logins,
+        "duration_s": duration,
+        "booking_idle": harness.percentiles(idle),
+        "booking_during_logins": harness.percentiles(results[0]),
+        "logins_completed": sum(results[1:]),
+        "hash_pool": hashing.hash_pool_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=8, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per phase")
+    parser.add_argument("--inline-hashing", action="store_true", help="hash on the event loop")
+    parser.add_argument(harness.DROP_TABLES_FLAG, dest="drop_tables", action="store_true",
+                        help="allow dropping every table of BENCHMARK_DATABASE_URL")
+    args = parser.parse_args()
+
+    harness.configure(drop_tables=args.drop_tables)
+
+    report = asyncio.run(run(args.logins, args.duration, args.inline_hashing))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
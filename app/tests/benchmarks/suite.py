@@ -0,0 +1,208 @@
+"""
+Mixed-workload latency benchmark for app.main:app.
+
+Runs the app in-process against a freshly seeded database (a throwaway SQLite file by
+default, any DATABASE_URL with --database-url, e.g. postgresql+asyncpg://...), drives
+concurrent clients through login, create, list, filter and map requests, and writes
+p50/p95/p99 latency, throughput and SQL statements per request as JSON. Seeding starts
+by dropping every table, so a given database also needs --i-know-this-drops-tables.
+
+    python -m app.tests.benchmarks.suite run --out current.json
+    python -m app.tests.benchmarks.suite compare baseline.json current.json
+
+compare exits with status 1 when an operation regressed beyond --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from typing import Dict, List
+
+from . import harness
+
+DEFAULT_MIX = "login=1,create=3,list=8,filter=5,map=3"
+
+
+def _parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+async def _op_login(client, username, headers, rng):
+    return await client.post("/auth/token", data={"username": username, "password": harness.PASSWORD})
+
+
+async def _op_create(client, username, headers, rng):
+    return await client.post("/booking/", headers=headers, json=harness.ticket_payload(rng.randrange(10 ** 6)))
+
+
+async def _op_list(client, username, headers, rng):
+    return await client.get("/booking/", headers=headers, params={"limit": 100})
+
+
+async def _op_filter(client, username, headers, rng):
+    return await client.get("/booking/filter/filter", headers=headers, params={"city": f"city {rng.randrange(10)}"})
+
+
+async def _op_map(client, username, headers, rng):
+    return await client.get("/booking/visualize/map", headers=headers)
+
+
+OPERATIONS = {
+    "login": _op_login,
+    "create": _op_create,
+    "list": _op_list,
+    "filter": _op_filter,
+    "map": _op_map,
+}
+
+
+async def _virtual_client(client, users, weights, deadline, seed, samples) -> None:
+    rng = random.Random(seed)
+    names, cumulative = list(weights), list(weights.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights=cumulative)[0]
+        username, headers = rng.choice(users)
+        statements = harness.count_statements()
+        started = time.perf_counter()
+        response = await OPERATIONS[name](client, username, headers, rng)
+        elapsed = time.perf_counter() - started
+        samples[name].append((elapsed, statements[0], response.status_code < 400))
+
+
+async def run(args, database_url: str) -> Dict:
+    harness.install_statement_counter()
+    await harness.reset_schema()
+
+    weights = _parse_mix(args.mix)
+    samples: Dict[str, List] = {name: [] for name in weights}
+
+    async with harness.client() as client:
+        users = []
+        for index in range(args.users):
+            username = f"bench{index}"
+            await harness.register(client, username)
+            headers = await harness.login(client, username)
+            await harness.seed_tickets(client, headers, args.tickets)
+            users.append((username, headers))
+
+        if args.warmup:
+            warmup = {name: [] for name in weights}
+            deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(*(_virtual_client(client, users, weights, deadline, -i - 1, warmup)
+                                   for i in range(args.concurrency)))
+
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(_virtual_client(client, users, weights, deadline, args.seed + i, samples)
+                               for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    operations = {}
+    for name, results in samples.items():
+        latencies = [latency for latency, _, ok in results if ok]
+        operations[name] = {
+            **harness.percentiles(latencies),
+            "errors": sum(1 for _, _, ok in results if not ok),
+            "throughput_rps": round(len(results) / elapsed, 2),
+            "queries_per_request": round(sum(count for _, count, _ in results) / len(results), 3) if results else 0,
+        }
+
+    all_results = [result for results in samples.values() for result in results]
+    return {
+        "meta": {
+            "database": database_url.split(":", 1)[0],
+            "python": platform.python_version(),
+            "users": args.users,
+            "tickets_per_user": args.tickets,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "mix": weights,
+            "seed": args.seed,
+        },
+        "total": {
+            **harness.percentiles([latency for latency, _, ok in all_results if ok]),
+            "errors": sum(1 for _, _, ok in all_results if not ok),
+            "throughput_rps": round(len(all_results) / elapsed, 2),
+        },
+        "operations": operations,
+    }
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float) -> List[Dict]:
+    """
+    Operations whose p95 latency or throughput got worse by more than tolerance, or that
+    run more SQL statements per request than in the baseline.
+
+    :param baseline: A report produced by run.
+    :param current: A report produced by run.
+    :param tolerance: Allowed relative slowdown, e.g. 0.15 for 15%.
+    :return: One entry per regressed metric.
+    """
+    regressions = []
+    for name, base in baseline["operations"].items():
+        now = current["operations"].get(name)
+        if not now or not base.get("count") or not now.get("count"):
+            continue
+        checks = [
+            ("p95_ms", now["p95_ms"] > base["p95_ms"] * (1 + tolerance)),
+            ("throughput_rps", now["throughput_rps"] < base["throughput_rps"] * (1 - tolerance)),
+            ("queries_per_request", now["queries_per_request"] > base["queries_per_request"] + 0.01),
+        ]
+        for metric, regressed in checks:
+            if regressed:
+                regressions.append({"operation": name, "metric": metric,
+                                    "baseline": base[metric], "current": now[metric]})
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmark")
+    run_parser.add_argument("--database-url", help="database to benchmark against (default: temporary SQLite)")
+    run_parser.add_argument(harness.DROP_TABLES_FLAG, dest="drop_tables", action="store_true",
+                            help="allow dropping every table of --database-url or BENCHMARK_DATABASE_URL")
+    run_parser.add_argument("--users", type=int, default=5)
+    run_parser.add_argument("--tickets", type=int, default=1000, help="tickets seeded per user")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before the run")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default: {DEFAULT_MIX})")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--out", help="write the report here instead of stdout")
+
+    compare_parser = commands.add_parser("compare", help="compare a report against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as baseline, open(args.current) as current:
+            regressions = compare(json.load(baseline), json.load(current), args.tolerance)
+        print(json.dumps({"regressions": regressions}, indent=2))
+        return 1 if regressions else 0
+
+    database_url = harness.configure(args.database_url, args.drop_tables)
+    report = json.dumps(asyncio.run(run(args, database_url)), indent=2)
+    if args.out:
+        with open(args.out, "w") as out:
+            out.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Shared fixtures. The settings are read when app is first imported, so the test
+database is configured here, before any test module imports the application.
+"""
+import os
+import tempfile
+
+import pytest
+
+_DATABASE_FILE = os.path.join(tempfile.mkdtemp(prefix="app-tests-"), "test.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_DATABASE_FILE}")
+os.environ.setdefault("SECRET_KEY", "tests")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    """
+    Empty tables for one test.
+    """
+    import app.main  # noqa: F401 - registers every model and its DDL on the metadata
+    from app.db.base import Base, engine
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    yield engine
+
+
+@pytest.fixture
+async def client(database):
+    import httpx
+    from app.main import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+async def login(client, username: str = "alice") -> dict:
+    """
+    Register a user and return the headers that authenticate as them.
+    """
+    response = await client.post("/auth/register",
+                                 json={"username": username, "email": f"{username}@example.com", "password": "pw"})
+    assert response.status_code == 200, response.text
+    response = await client.post("/auth/token", data={"username": username, "password": "pw"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,170 @@
+"""
+Admission control with an injected clock and stubbed pool statistics: token bucket
+refill, the in-flight cap, load shedding on pool waits, and decoding each request's
+token once.
+"""
+import asyncio
+import dataclasses
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _scope(path="/booking/", token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return {"type": "http", "path": path, "headers": headers, "client": ("10.0.0.1", 1234)}
+
+
+async def _call(middleware, scope):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    start = messages[0] if messages else None
+    return start["status"] if start else None, dict(start["headers"]) if start else {}
+
+
+async def _ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    from app.core import admission
+
+    def configure(**changes):
+        monkeypatch.setattr(admission, "settings", dataclasses.replace(admission.settings, **changes))
+
+    monkeypatch.setattr(admission, "pool_status", lambda pool: {"saturation": 0.0, "wait_seconds_recent": 0.0})
+    return configure
+
+
+async def test_bucket_spends_burst_then_refills_at_rate():
+    from app.core.admission import InMemoryTokenBuckets
+
+    clock = FakeClock()
+    buckets = InMemoryTokenBuckets(maxsize=10, clock=clock)
+
+    assert [await buckets.take("user:1", rate=2.0, burst=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert await buckets.take("user:1", rate=2.0, burst=3) == pytest.approx(0.5)
+    # Other keys have their own bucket.
+    assert await buckets.take("user:2", rate=2.0, burst=3) == 0.0
+
+    # A refused take spends nothing: half a token has refilled, half is missing.
+    clock.now += 0.25
+    assert await buckets.take("user:1", rate=2.0, burst=3) == pytest.approx(0.25)
+    clock.now += 0.5
+    assert await buckets.take("user:1", rate=2.0, burst=3) == 0.0
+
+    # Refill stops at the burst.
+    clock.now += 60
+    assert [await buckets.take("user:1", rate=2.0, burst=3) for _ in range(4)][-1] > 0
+
+
+async def test_rate_limited_request_gets_429_with_retry_after(configure):
+    from app.core.admission import AdmissionMiddleware, InMemoryTokenBuckets
+
+    configure(rate_limit_per_second=1.0, rate_limit_burst=1)
+    clock = FakeClock()
+    middleware = AdmissionMiddleware(_ok, backend=InMemoryTokenBuckets(10, clock=clock))
+
+    assert (await _call(middleware, _scope()))[0] == 200
+    status, headers = await _call(middleware, _scope())
+    assert status == 429
+    assert headers[b"retry-after"] == b"1"
+    # Health checks are never limited.
+    assert (await _call(middleware, _scope("/health/db")))[0] == 200
+
+    clock.now += 1
+    assert (await _call(middleware, _scope()))[0] == 200
+
+
+async def test_in_flight_cap(configure):
+    from app.core.admission import AdmissionMiddleware, InMemoryTokenBuckets
+
+    configure(max_in_flight=1, rate_limit_per_second=0)
+    release = asyncio.Event()
+
+    async def slow(scope, receive, send):
+        await release.wait()
+        await _ok(scope, receive, send)
+
+    middleware = AdmissionMiddleware(slow, backend=InMemoryTokenBuckets(10))
+    first = asyncio.ensure_future(_call(middleware, _scope()))
+    await asyncio.sleep(0)
+    assert middleware.in_flight == 1
+
+    status, headers = await _call(middleware, _scope())
+    assert status == 503
+    assert headers[b"retry-after"] == b"1"
+
+    # Event streams neither count against nor are refused by MAX_IN_FLIGHT.
+    stream = asyncio.ensure_future(_call(middleware, _scope("/booking/events")))
+    await asyncio.sleep(0)
+    assert not stream.done()
+
+    release.set()
+    assert (await first)[0] == 200
+    assert (await stream)[0] == 200
+    assert middleware.in_flight == 0
+    assert (await _call(middleware, _scope()))[0] == 200
+
+
+async def test_sheds_load_while_pool_checkouts_wait(configure, monkeypatch):
+    from app.core import admission
+
+    configure(admission_pool_wait_seconds=0.5, rate_limit_per_second=0)
+    middleware = admission.AdmissionMiddleware(_ok, backend=admission.InMemoryTokenBuckets(10))
+
+    monkeypatch.setattr(admission, "pool_status", lambda pool: {"saturation": 1.0, "wait_seconds_recent": 2.2})
+    status, headers = await _call(middleware, _scope())
+    assert status == 503
+    assert headers[b"retry-after"] == b"3"
+
+    # Waits below the threshold, or a pool with free connections, are admitted.
+    monkeypatch.setattr(admission, "pool_status", lambda pool: {"saturation": 1.0, "wait_seconds_recent": 0.1})
+    assert (await _call(middleware, _scope()))[0] == 200
+    monkeypatch.setattr(admission, "pool_status", lambda pool: {"saturation": 0.5, "wait_seconds_recent": 2.2})
+    assert (await _call(middleware, _scope()))[0] == 200
+
+
+async def test_token_is_decoded_once_per_request(configure, monkeypatch):
+    from app.core import admission
+    from app.core.security import tokens
+    from app.services.auth_service import create_access_token
+
+    configure(rate_limit_per_second=100.0)
+    token = await create_access_token({"sub": "alice", "uid": 7})
+    decoded = []
+    monkeypatch.setattr(tokens, "decode_token", lambda value, real=tokens.decode_token: decoded.append(value)
+                        or real(value))
+
+    seen = {}
+
+    async def handler(scope, receive, send):
+        seen["claims"] = tokens.request_claims(scope, token)
+        await _ok(scope, receive, send)
+
+    assert admission._client_key(_scope(token=token)) == "user:7"
+    decoded.clear()
+    assert (await _call(admission.AdmissionMiddleware(handler, backend=admission.InMemoryTokenBuckets(10)),
+                        _scope(token=token)))[0] == 200
+    assert seen["claims"]["sub"] == "alice"
+    assert decoded == [token]
+
+    assert admission._client_key(_scope(token="not-a-token")) == "ip:10.0.0.1"
@@ -0,0 +1,136 @@
+"""
+The desktop API client against httpx.MockTransport: retries and Retry-After, no retry
+of a request that may have reached the server, re-login on 401 and error bodies.
+"""
+import httpx
+import pytest
+
+from appuiclient import api_client
+from appuiclient.api_client import ApiClient, ApiError, AsyncApiClient
+
+pytestmark = pytest.mark.anyio
+
+
+class Server:
+    """
+    Answers requests from a list of responses per path and records what was sent.
+    A response may be an exception, which is raised instead, or a callable of the request.
+    """
+
+    def __init__(self, **routes):
+        self.routes = {path.replace("_", "/"): list(responses) for path, responses in routes.items()}
+        self.requests = []
+        self.tokens = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path == "/auth/token":
+            self.tokens += 1
+            return httpx.Response(200, json={"access_token": f"t{self.tokens}", "token_type": "bearer"})
+        responses = self.routes[request.url.path]
+        response = responses.pop(0) if len(responses) > 1 else responses[0]
+        if isinstance(response, Exception):
+            raise response
+        return response(request) if callable(response) else response
+
+    def sent(self, path: str) -> list:
+        return [request for request in self.requests if request.url.path == path]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(api_client.time, "sleep", delays.append)
+    monkeypatch.setattr(api_client.asyncio, "sleep", sleep)
+    return delays
+
+
+def _client(server: Server) -> ApiClient:
+    return ApiClient("http://api", transport=httpx.MockTransport(server), backoff_base=0.001)
+
+
+def test_retries_503_and_429_honoring_retry_after(sleeps):
+    server = Server(_booking_7=[httpx.Response(503, headers={"Retry-After": "2"}),
+                                httpx.Response(429, headers={"Retry-After": "1"}),
+                                httpx.Response(200, json={"id": 7})])
+    with _client(server) as client:
+        assert client.get_ticket(7) == {"id": 7}
+    assert len(server.sent("/booking/7")) == 3
+    assert sleeps == [2.0, 1.0]
+
+
+def test_gives_up_after_max_retries(sleeps):
+    server = Server(_booking_7=[httpx.Response(502, json={"detail": "Bad gateway"})])
+    with _client(server) as client:
+        with pytest.raises(ApiError) as raised:
+            client.get_ticket(7)
+    assert raised.value.status_code == 502
+    assert len(server.sent("/booking/7")) == api_client.MAX_RETRIES + 1
+
+
+def test_post_is_not_retried_after_a_read_timeout(sleeps):
+    server = Server(_booking_=[httpx.ReadTimeout("timed out"), httpx.Response(201, json={"id": 1})])
+    with _client(server) as client:
+        with pytest.raises(ApiError):
+            client.create_ticket({"place": "p"})
+    assert len(server.sent("/booking/")) == 1
+
+    # The server may have created the ticket, but reading it again is safe.
+    server = Server(_booking_7=[httpx.ReadTimeout("timed out"), httpx.Response(200, json={"id": 7})])
+    with _client(server) as client:
+        assert client.get_ticket(7) == {"id": 7}
+
+
+def test_logs_in_again_once_after_a_401(sleeps):
+    def authorized(request):
+        if request.headers["Authorization"] == "Bearer t1":
+            return httpx.Response(401, json={"detail": "Could not validate credentials"})
+        return httpx.Response(200, json={"id": 7})
+
+    server = Server(_booking_7=[authorized])
+    with _client(server) as client:
+        client.login("alice", "pw")
+        assert client.get_ticket(7) == {"id": 7}
+    assert server.tokens == 2
+
+    server = Server(_booking_7=[httpx.Response(401, json={"detail": "Could not validate credentials"})])
+    with _client(server) as client:
+        client.login("alice", "pw")
+        with pytest.raises(ApiError) as raised:
+            client.get_ticket(7)
+    assert raised.value.status_code == 401
+    assert server.tokens == 2
+    assert len(server.sent("/booking/7")) == 2
+
+
+@pytest.mark.parametrize("body", [["not", "a", "dict"], "just a string"])
+def test_error_body_that_is_not_an_object(body, sleeps):
+    response = httpx.Response(400, json=body)
+    with _client(Server(_booking_7=[response])) as client:
+        with pytest.raises(ApiError) as raised:
+            client.get_ticket(7)
+    assert raised.value.status_code == 400
+    assert raised.value.detail == response.text
+
+
+async def test_async_client_retries_and_logs_in_again(sleeps):
+    def authorized(request):
+        if request.headers["Authorization"] == "Bearer t1":
+            return httpx.Response(401)
+        return httpx.Response(200, json={"id": 7})
+
+    server = Server(_booking_7=[httpx.Response(503, headers={"Retry-After": "3"}), authorized],
+                    _booking_=[httpx.ReadTimeout("timed out")])
+    async with AsyncApiClient("http://api", transport=httpx.MockTransport(server), backoff_base=0.001) as client:
+        await client.login("alice", "pw")
+        assert await client.get_ticket(7) == {"id": 7}
+        with pytest.raises(ApiError):
+            await client.create_ticket({"place": "p"})
+    assert sleeps == [3.0]
+    assert server.tokens == 2
+    assert len(server.sent("/booking/7")) == 3
+    assert len(server.sent("/booking/")) == 1
@@ -0,0 +1,136 @@
+"""
+Ticket listing and the batch writes: creation order, updates grouped by the fields they
+set, no-op updates skipped, and per-item 404s for tickets of other users.
+"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from .conftest import login
+
+pytestmark = pytest.mark.anyio
+
+
+def _ticket(hotel: str, **changes) -> dict:
+    return {"place": "Old Town", "city": "Riga", "hotel": hotel, "latitude": 56.95, "longitude": 24.1, **changes}
+
+
+async def test_listing_is_paged_by_default(client):
+    from app.routers.booking import DEFAULT_PAGE_SIZE
+
+    headers = await login(client)
+    tickets = [_ticket(f"h{i}") for i in range(DEFAULT_PAGE_SIZE + 1)]
+    ids = [ticket["id"] for ticket in (await client.post("/booking/batch", headers=headers, json=tickets)).json()]
+
+    response = await client.get("/booking/", headers=headers)
+    assert [ticket["id"] for ticket in response.json()] == ids[:DEFAULT_PAGE_SIZE]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = await client.get("/booking/", headers=headers, params={"after": cursor})
+    assert [ticket["id"] for ticket in response.json()] == ids[DEFAULT_PAGE_SIZE:]
+    assert "X-Next-Cursor" not in response.headers
+
+    # Every ticket at once is only available as a stream.
+    response = await client.get("/booking/", headers=headers, params={"stream": "true"})
+    assert len(response.text.splitlines()) == DEFAULT_PAGE_SIZE + 1
+
+
+@contextmanager
+def _ticket_updates(engine):
+    """
+    Collect the UPDATE tickets statements sent, with the number of parameter sets of each.
+    """
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE tickets"):
+            statements.append((statement, len(parameters) if executemany else 1))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+async def _user(username: str):
+    from sqlalchemy.future import select
+
+    from app.db.base import AsyncSessionLocal
+    from app.models.user import User
+
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(User).where(User.username == username))
+
+
+async def test_created_tickets_come_back_in_input_order(client):
+    from app.db.base import AsyncSessionLocal
+    from app.schemas.booking import TicketCreate
+    from app.services import booking_service
+
+    await login(client)
+    hotels = ["Zeta", "Alpha", "Mu", "Beta", "Omega"]
+    async with AsyncSessionLocal() as db:
+        created = await booking_service.create_tickets([TicketCreate(**_ticket(hotel)) for hotel in hotels], db,
+                                                       await _user("alice"))
+    assert [ticket.hotel for ticket in created] == hotels
+    assert [ticket.id for ticket in created] == sorted(ticket.id for ticket in created)
+    assert all(ticket.geohash for ticket in created)
+
+
+async def test_mixed_batch_update_groups_items_by_the_fields_they_set(client, database):
+    from app.db.base import AsyncSessionLocal
+    from app.schemas.booking import TicketBatchUpdate
+    from app.services import booking_service
+    from app.services.geo_service import encode_geohash
+
+    headers = await login(client)
+    ids = [ticket["id"] for ticket in
+           (await client.post("/booking/batch", headers=headers, json=[_ticket(f"h{i}") for i in range(4)])).json()]
+    items = [TicketBatchUpdate(id=ids[0], hotel="renamed"),
+             TicketBatchUpdate(id=ids[1], city="Tallinn", latitude=59.44),
+             TicketBatchUpdate(id=ids[2], hotel="renamed too"),
+             TicketBatchUpdate(id=ids[3], latitude=59.44, city="Tallinn")]
+
+    with _ticket_updates(database) as statements:
+        async with AsyncSessionLocal() as db:
+            updated = await booking_service.update_tickets(items, db, await _user("alice"))
+    # One executemany per set of fields, whatever order the fields were given in.
+    assert sorted(count for _, count in statements) == [2, 2]
+
+    assert [(ticket.hotel, ticket.city, ticket.latitude) for ticket in updated] == [
+        ("renamed", "Riga", 56.95), ("h1", "Tallinn", 59.44), ("renamed too", "Riga", 56.95), ("h3", "Tallinn", 59.44)]
+    assert updated[1].geohash == encode_geohash(59.44, 24.1)
+    assert updated[0].geohash == encode_geohash(56.95, 24.1)
+
+
+async def test_no_op_updates_are_skipped(client, database):
+    headers = await login(client)
+    ticket = (await client.post("/booking/batch", headers=headers, json=[_ticket("h")])).json()[0]["ticket"]
+    cursor = (await client.get("/booking/changes", headers=headers)).json()["cursor"]
+
+    with _ticket_updates(database) as statements:
+        response = await client.put("/booking/batch", headers=headers, json=[{"id": ticket["id"]}])
+    assert statements == []
+    assert response.json()[0]["status"] == 200
+    assert response.json()[0]["ticket"] == ticket
+    # Nothing changed, so syncing clients have nothing to fetch.
+    assert (await client.get(f"/booking/changes?since={cursor}", headers=headers)).json()["tickets"] == []
+
+
+async def test_tickets_of_other_users_are_reported_missing(client):
+    alice, bob = await login(client), await login(client, "bob")
+    mine = (await client.post("/booking/batch", headers=alice, json=[_ticket("mine")])).json()[0]["id"]
+    theirs = (await client.post("/booking/batch", headers=bob, json=[_ticket("theirs")])).json()[0]["id"]
+
+    results = (await client.put("/booking/batch", headers=alice,
+                                json=[{"id": theirs, "hotel": "stolen"}, {"id": mine, "hotel": "kept"}])).json()
+    assert [(result["id"], result["status"]) for result in results] == [(theirs, 404), (mine, 200)]
+    assert results[1]["ticket"]["hotel"] == "kept"
+
+    results = (await client.delete("/booking/batch", headers=alice, params={"ids": [theirs, mine]})).json()
+    assert [(result["index"], result["status"]) for result in results] == [(0, 404), (1, 200)]
+
+    assert (await client.get(f"/booking/{theirs}", headers=bob)).json()["hotel"] == "theirs"
+    assert (await client.get(f"/booking/{mine}", headers=alice)).status_code == 404
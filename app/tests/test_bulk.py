@@ -0,0 +1,110 @@
+"""
+Export and import: a CSV export loads into another user, rows with an id update only
+tickets of the importing user, and malformed files are refused with a 400 and no
+partial import. Parquet needs pyarrow and is skipped without it.
+"""
+import csv
+import io
+
+import pytest
+
+from .conftest import login
+
+pytestmark = pytest.mark.anyio
+
+FIELDS = ("place", "city", "hotel", "latitude", "longitude")
+
+TICKETS = [
+    {"place": "Old Town", "city": "Riga", "hotel": "Neiburgs", "latitude": 56.95, "longitude": 24.11},
+    {"place": "Kalamaja, \"north\"", "city": "Tallinn", "hotel": "Telegraaf", "latitude": 59.44, "longitude": 24.74},
+    {"place": "Užupis", "city": "Vilnius", "hotel": "Kempinski", "latitude": 54.68, "longitude": 25.28},
+]
+
+
+async def _export(client, headers, file_format="csv") -> bytes:
+    response = await client.get("/booking/export", headers=headers, params={"format": file_format})
+    assert response.status_code == 200, response.text
+    return response.content
+
+
+async def _import(client, headers, content: bytes, file_format="csv"):
+    return await client.post("/booking/import", headers=headers, params={"format": file_format},
+                             files={"file": (f"tickets.{file_format}", content)})
+
+
+def _records(content: bytes) -> list:
+    return list(csv.DictReader(io.StringIO(content.decode("utf-8-sig"))))
+
+
+def _without(records: list, *columns) -> bytes:
+    buffer = io.StringIO()
+    names = [name for name in records[0] if name not in columns]
+    writer = csv.DictWriter(buffer, names, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(records)
+    return buffer.getvalue().encode()
+
+
+def _tickets(records: list) -> list:
+    return sorted((record["place"], record["city"], record["hotel"], float(record["latitude"]),
+                   float(record["longitude"])) for record in records)
+
+
+async def test_csv_export_imports_into_another_user(client):
+    alice, bob = await login(client), await login(client, "bob")
+    await client.post("/booking/batch", headers=alice, json=TICKETS)
+
+    exported = _records(await _export(client, alice))
+    assert list(exported[0]) == ["id", "place", "city", "hotel", "latitude", "longitude", "tm_created", "tm_updated"]
+    assert _tickets(exported) == _tickets([{name: str(value) for name, value in ticket.items()} for ticket in TICKETS])
+
+    response = await _import(client, bob, _without(exported, "id"))
+    assert response.json() == {"created": 3, "updated": 0, "not_found": 0}
+    assert _tickets(_records(await _export(client, bob))) == _tickets(exported)
+
+
+async def test_rows_with_an_id_update_only_the_importers_tickets(client):
+    alice, bob = await login(client), await login(client, "bob")
+    await client.post("/booking/batch", headers=alice, json=TICKETS)
+    exported = _records(await _export(client, alice))
+
+    # Bob cannot reach Alice's tickets through their ids.
+    response = await _import(client, bob, _without(exported))
+    assert response.json() == {"created": 0, "updated": 0, "not_found": 3}
+    assert _records(await _export(client, bob)) == []
+
+    exported[0]["hotel"] = "Bergs"
+    response = await _import(client, alice, _without(exported[:1], "tm_created", "tm_updated"))
+    assert response.json() == {"created": 0, "updated": 1, "not_found": 0}
+    hotels = [record["hotel"] for record in _records(await _export(client, alice))]
+    assert hotels == ["Bergs", "Telegraaf", "Kempinski"]
+
+
+@pytest.mark.parametrize("content", [
+    b"place,city,hotel,latitude,longitude\nOld Town,Riga,Neiburgs,56.95,24.11\nOld Town,Riga,Neiburgs,north,24.11\n",
+    b"place,city,hotel,latitude,longitude\nOld Town,Riga,Neiburgs,56.95,24.11\nOld Town,Riga,,56.95,24.11\n",
+    b"place,city\nOld Town,Riga\n",
+    b"id,hotel\nseven,Bergs\n",
+    b"place,city,hotel,latitude,longitude\n\xff\xfe\x00broken,Riga,Neiburgs,56.95,24.11\n",
+])
+async def test_malformed_rows_are_refused_without_a_partial_import(client, content):
+    headers = await login(client)
+    response = await _import(client, headers, content)
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"]
+    assert _records(await _export(client, headers)) == []
+
+
+async def test_parquet_export_imports_into_another_user(client):
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    alice, bob = await login(client), await login(client, "bob")
+    await client.post("/booking/batch", headers=alice, json=TICKETS)
+
+    table = pyarrow.parquet.read_table(io.BytesIO(await _export(client, alice, "parquet")), columns=list(FIELDS))
+    content = io.BytesIO()
+    pyarrow.parquet.write_table(table, content)
+    response = await _import(client, bob, content.getvalue(), "parquet")
+    assert response.json() == {"created": 3, "updated": 0, "not_found": 0}
+    assert _tickets(_records(await _export(client, bob))) == _tickets(_records(await _export(client, alice)))
@@ -0,0 +1,134 @@
+"""
+Ticket change streams: delivery to the subscribed user, the resync and disconnect of
+a stream that falls behind, and the relay replacing events it cannot send with a
+resync of the other workers' streams.
+"""
+import asyncio
+import dataclasses
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def events(monkeypatch):
+    from app.services import event_service
+
+    monkeypatch.setattr(event_service, "settings", dataclasses.replace(
+        event_service.settings, event_queue_size=2, event_heartbeat_seconds=60))
+    monkeypatch.setattr(event_service, "_subscribers", {})
+    monkeypatch.setattr(event_service, "_subscriber_count", 0)
+    monkeypatch.setattr(event_service, "relay", None)
+    return event_service
+
+
+class FakeConnection:
+    def __init__(self, fail=False):
+        self.payloads = []
+        self.fail = fail
+
+    async def execute(self, query, channel, payload):
+        if self.fail:
+            raise OSError("connection reset")
+        self.payloads.append(json.loads(payload))
+
+
+async def _forward_queued(relay, connection):
+    task = asyncio.ensure_future(relay._forward(connection, asyncio.Event()))
+    while not relay._queue.empty() or relay._resync_pending:
+        await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_events_reach_the_streams_of_their_user(events):
+    alice, bob = events.subscribe(1), events.subscribe(2)
+
+    events.publish(1, events.DELETED, [5, 6])
+    assert alice.queue.get_nowait() == {"type": events.DELETED, "ids": [5, 6]}
+    assert bob.queue.empty()
+
+    events.unsubscribe(alice)
+    events.unsubscribe(alice)
+    assert events._subscriber_count == 1
+    assert 1 not in events._subscribers
+
+
+async def test_stream_that_falls_behind_is_resynced_and_closed(events):
+    subscriber = events.subscribe(1)
+    stream = events.stream_events(subscriber)
+    assert await stream.__anext__() == b"retry: 5000\n\n"
+
+    for ticket_id in range(3):
+        events.publish(1, events.DELETED, [ticket_id])
+    assert subscriber.overflowed
+    assert await stream.__anext__() == b'event: resync\ndata: {"type":"resync"}\n\n'
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+    assert events._subscriber_count == 0
+
+
+async def test_subscribers_are_capped(events, monkeypatch):
+    from fastapi import HTTPException
+
+    monkeypatch.setattr(events, "settings", dataclasses.replace(events.settings, event_max_subscribers=1))
+    events.subscribe(1)
+    with pytest.raises(HTTPException) as raised:
+        events.subscribe(2)
+    assert raised.value.status_code == 503
+
+
+async def test_relay_overflow_is_replaced_by_a_resync(events, monkeypatch):
+    monkeypatch.setattr(events, "RELAY_QUEUE_SIZE", 2)
+    relay = events.PostgresRelay("postgresql+asyncpg://app@db/app")
+    monkeypatch.setattr(events, "relay", relay)
+
+    for ticket_id in range(4):
+        events.publish(1, events.DELETED, [ticket_id])
+    assert relay._resync_pending
+
+    connection = FakeConnection()
+    await _forward_queued(relay, connection)
+    assert [(payload["user"], payload["event"]) for payload in connection.payloads] == [
+        (1, {"type": events.DELETED, "ids": [0]}),
+        (1, {"type": events.DELETED, "ids": [1]}),
+        (None, {"type": events.RESYNC}),
+    ]
+
+    # Relaying resumes once the resync has gone out.
+    events.publish(1, events.DELETED, [9])
+    assert relay._queue.get_nowait() == (1, {"type": events.DELETED, "ids": [9]})
+
+
+async def test_event_lost_with_the_connection_is_replaced_by_a_resync(events):
+    relay = events.PostgresRelay("postgresql+asyncpg://app@db/app")
+    relay.send(1, {"type": events.DELETED, "ids": [1]})
+
+    with pytest.raises(OSError):
+        await relay._forward(FakeConnection(fail=True), asyncio.Event())
+    assert relay._resync_pending
+
+    connection = FakeConnection()
+    await _forward_queued(relay, connection)
+    assert [payload["event"]["type"] for payload in connection.payloads] == [events.RESYNC]
+
+
+async def test_remote_resync_reaches_every_local_stream(events, monkeypatch):
+    from app.db import routing
+
+    written = []
+    monkeypatch.setattr(routing, "mark_write", written.append)
+    relay = events.PostgresRelay("postgresql+asyncpg://app@db/app")
+    alice, bob = events.subscribe(1), events.subscribe(2)
+
+    # A worker ignores its own notifications.
+    relay._on_notify(None, 0, events.RELAY_CHANNEL, relay._payload(None, {"type": events.RESYNC}))
+    assert alice.queue.empty()
+
+    remote = json.dumps({"origin": "other", "user": None, "event": {"type": events.RESYNC}})
+    relay._on_notify(None, 0, events.RELAY_CHANNEL, remote)
+    assert alice.queue.get_nowait() == bob.queue.get_nowait() == {"type": events.RESYNC}
+    # Both may read changes the replica has not seen yet.
+    assert sorted(written) == [1, 2]
@@ -0,0 +1,125 @@
+"""
+Geo queries on SQLite: geohash covers at cell edges, boxes crossing the antimeridian,
+the exact distance check behind radius queries and the widening nearest search.
+"""
+import pytest
+
+from .conftest import login
+
+pytestmark = pytest.mark.anyio
+
+
+def _ticket(hotel: str, latitude: float, longitude: float) -> dict:
+    return {"place": "p", "city": "c", "hotel": hotel, "latitude": latitude, "longitude": longitude}
+
+
+async def _create(client, headers, *tickets) -> None:
+    response = await client.post("/booking/batch", headers=headers, json=list(tickets))
+    assert response.status_code == 200, response.text
+
+
+def _hotels(response) -> list:
+    assert response.status_code == 200, response.text
+    return [ticket["hotel"] for ticket in response.json()]
+
+
+@pytest.mark.parametrize("box", [
+    # Edges on cell boundaries of several precisions.
+    (0.0, 0.0, 45.0, 45.0),
+    (-0.0439453125, -0.087890625, 0.0439453125, 0.087890625),
+    (10.0, 20.0, 10.0, 20.0),
+    # The edges of the world, where the last row and column are clamped.
+    (89.9, 179.9, 90.0, 180.0),
+    (-90.0, -180.0, -89.9, -179.9),
+    (-90.0, -180.0, 90.0, 180.0),
+])
+def test_cover_contains_the_edges_and_corners(box):
+    from app.services.geo_service import MAX_COVER_CELLS, cover_bbox, encode_geohash
+
+    min_lat, min_lon, max_lat, max_lon = box
+    cells = cover_bbox(*box)
+    assert 0 < len(cells) <= MAX_COVER_CELLS
+    steps = [i / 8 for i in range(9)]
+    points = [(min_lat + (max_lat - min_lat) * t, lon) for t in steps for lon in (min_lon, max_lon)]
+    points += [(lat, min_lon + (max_lon - min_lon) * t) for t in steps for lat in (min_lat, max_lat)]
+    for latitude, longitude in points:
+        geohash = encode_geohash(latitude, longitude)
+        assert any(geohash.startswith(cell) for cell in cells), (latitude, longitude)
+
+
+def test_cell_ranges_end_after_the_last_geohash_of_a_cell():
+    from app.services.geo_service import _next_prefix
+
+    assert _next_prefix("u33") == "u34"
+    assert _next_prefix("u3z") == "u4"
+    assert _next_prefix("zz") is None
+
+
+async def test_bbox_includes_tickets_on_its_edges(client):
+    headers = await login(client)
+    await _create(client, headers, _ticket("corner", 45.0, 45.0), _ticket("edge", 0.0, 22.5),
+                  _ticket("outside", 45.0001, 45.0))
+
+    response = await client.get("/booking/geo/bbox", headers=headers,
+                                params={"min_lat": 0, "min_lon": 0, "max_lat": 45, "max_lon": 45})
+    assert sorted(_hotels(response)) == ["corner", "edge"]
+
+
+async def test_bbox_crossing_the_antimeridian(client):
+    from app.services.geo_service import split_bbox
+
+    assert split_bbox(-10, 170, 10, -170) == [(-10, 170, 10, 180.0), (-10, -180.0, 10, -170)]
+
+    headers = await login(client)
+    await _create(client, headers, _ticket("east", 0.0, 179.5), _ticket("west", 0.0, -179.5),
+                  _ticket("dateline", 0.0, 180.0), _ticket("greenwich", 0.0, 0.0))
+
+    response = await client.get("/booking/geo/bbox", headers=headers,
+                                params={"min_lat": -1, "min_lon": 179, "max_lat": 1, "max_lon": -179})
+    assert sorted(_hotels(response)) == ["dateline", "east", "west"]
+
+    response = await client.get("/booking/geo/radius", headers=headers,
+                                params={"latitude": 0, "longitude": 179.9, "radius_km": 100})
+    assert _hotels(response) == ["dateline", "east", "west"]
+
+
+async def test_radius_drops_corner_candidates_outside_the_circle(client):
+    headers = await login(client)
+    # 0.7 degrees north and east is inside the bounding box of a 100 km circle around
+    # (0, 0), but about 110 km away.
+    await _create(client, headers, _ticket("corner", 0.7, 0.7), _ticket("near", 0.5, 0.0),
+                  _ticket("nearer", 0.0, -0.2), _ticket("far", 3.0, 0.0))
+
+    response = await client.get("/booking/geo/radius", headers=headers,
+                                params={"latitude": 0, "longitude": 0, "radius_km": 100})
+    assert _hotels(response) == ["nearer", "near"]
+    distances = [ticket["distance_km"] for ticket in response.json()]
+    assert distances == sorted(distances) and distances[-1] == pytest.approx(55.6, abs=0.1)
+
+
+async def test_nearest_widens_the_radius_until_k_are_found(client, monkeypatch):
+    from app.services import geo_service
+
+    radii = []
+    in_radius = geo_service.tickets_in_radius
+
+    async def recording(db, current_user, latitude, longitude, radius_km):
+        radii.append(radius_km)
+        return await in_radius(db, current_user, latitude, longitude, radius_km)
+
+    monkeypatch.setattr(geo_service, "tickets_in_radius", recording)
+    headers = await login(client)
+    await _create(client, headers, _ticket("0.5 km", 50.0045, 14.0), _ticket("10 km", 50.09, 14.0),
+                  _ticket("500 km", 54.5, 14.0), _ticket("antipode", -50.0, -166.0))
+
+    response = await client.get("/booking/geo/nearest", headers=headers,
+                                params={"latitude": 50, "longitude": 14, "k": 3})
+    assert _hotels(response) == ["0.5 km", "10 km", "500 km"]
+    assert radii == [1.0, 4.0, 16.0, 64.0, 256.0, 1024.0]
+
+    # Fewer tickets than k: the search ends once it covers the globe.
+    radii.clear()
+    response = await client.get("/booking/geo/nearest", headers=headers,
+                                params={"latitude": 50, "longitude": 14, "k": 10})
+    assert _hotels(response) == ["0.5 km", "10 km", "500 km", "antipode"]
+    assert radii[-1] == geo_service.NEAREST_MAX_RADIUS_KM
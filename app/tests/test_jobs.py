@@ -0,0 +1,46 @@
+"""
+Job results are gathered up to JOB_MAX_RESULT_BYTES; a bigger result fails the job
+instead of being held in memory and stored in the jobs table.
+"""
+import dataclasses
+
+import pytest
+from fastapi import HTTPException
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def max_result_bytes(monkeypatch):
+    from app.services import job_service
+
+    monkeypatch.setattr(job_service, "settings", dataclasses.replace(job_service.settings, job_max_result_bytes=10))
+
+
+async def _chunks(chunks, read, closed):
+    try:
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+    finally:
+        closed.append(True)
+
+
+async def test_result_within_the_limit_is_collected(max_result_bytes):
+    from app.services.job_service import _collect
+
+    read, closed = [], []
+    assert await _collect(_chunks([b"abcd", b"efgh"], read, closed), "GET /booking/export") == b"abcdefgh"
+    assert closed == [True]
+
+
+async def test_larger_result_fails_without_reading_the_rest(max_result_bytes):
+    from app.services.job_service import _collect
+
+    read, closed = [], []
+    with pytest.raises(HTTPException) as raised:
+        await _collect(_chunks([b"abcd", b"efgh", b"ijkl", b"mnop"], read, closed), "GET /booking/export")
+    assert raised.value.status_code == 413
+    assert "GET /booking/export" in raised.value.detail
+    assert read == [b"abcd", b"efgh", b"ijkl"]
+    assert closed == [True]
@@ -0,0 +1,41 @@
+"""
+The map cache is keyed on the ticket version stored in the database, so a change made
+by another worker, or outside the API, is never answered from the cache.
+"""
+import pytest
+from sqlalchemy import text
+
+from .conftest import login
+
+pytestmark = pytest.mark.anyio
+
+TICKET = {"place": "Old Town", "city": "Prague", "hotel": "Golden Well", "latitude": 50.08, "longitude": 14.42}
+
+
+async def test_repeat_view_is_cached(client):
+    from app.services import map_service
+
+    headers = await login(client)
+    await client.post("/booking/", json=TICKET, headers=headers)
+
+    first = await client.get("/booking/visualize/map", headers=headers)
+    cached = len(map_service._map_cache)
+    second = await client.get("/booking/visualize/map", headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert first.text == second.text
+    assert len(map_service._map_cache) == cached
+
+
+async def test_change_outside_this_worker_misses_cache(client, database):
+    headers = await login(client)
+    ticket = (await client.post("/booking/", json=TICKET, headers=headers)).json()
+    assert "Golden Well" in (await client.get("/booking/visualize/map", headers=headers)).text
+
+    async with database.begin() as connection:
+        await connection.execute(text("UPDATE tickets SET hotel = 'Black Star' WHERE id = :id"),
+                                 {"id": ticket["id"]})
+
+    html = (await client.get("/booking/visualize/map", headers=headers)).text
+    assert "Black Star" in html
+    assert "Golden Well" not in html
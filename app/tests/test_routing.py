@@ -0,0 +1,74 @@
+"""
+Read routing against a primary and a replica SQLite file: reads go to the replica,
+a user who wrote reads from the primary, and an unreachable replica falls back to
+the primary.
+"""
+import os
+
+import pytest
+from sqlalchemy import text
+
+pytestmark = pytest.mark.anyio
+
+
+def _database(session) -> str:
+    return os.path.basename(session.get_bind().url.database)
+
+
+@pytest.fixture
+async def replica_router(database, tmp_path, monkeypatch):
+    from app.core.cache import LRUCache
+    from app.db import routing
+    from app.db.base import Base
+
+    router = routing.ReplicaRouter([f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"], retry_after=60)
+    async with router.engines[0].begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    monkeypatch.setattr(routing, "replicas", router)
+    monkeypatch.setattr(routing, "_pinned_users", LRUCache(maxsize=100))
+    yield router
+    await router.engines[0].dispose()
+
+
+async def test_reads_go_to_the_replica(replica_router):
+    from app.db import routing
+
+    async with routing.read_session(1) as session:
+        assert _database(session) == "replica.db"
+    assert routing.read_session_factory(1) is replica_router.sessionmakers[0]
+
+
+async def test_writer_reads_own_writes_from_the_primary(replica_router):
+    from app.db import routing
+    from app.db.base import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        await session.execute(text("INSERT INTO users (id, username, email, hashed_password) "
+                                   "VALUES (1, 'alice', 'alice@example.com', 'x')"))
+        await session.commit()
+    routing.mark_write(1)
+
+    async with routing.read_session(1) as session:
+        assert _database(session) == "test.db"
+        assert await session.scalar(text("SELECT username FROM users WHERE id = 1")) == "alice"
+    assert routing.read_session_factory(1) is AsyncSessionLocal
+
+    # Other users keep reading from the replica, which has not seen the write yet.
+    async with routing.read_session(2) as session:
+        assert _database(session) == "replica.db"
+        assert await session.scalar(text("SELECT username FROM users WHERE id = 1")) is None
+
+
+async def test_unreachable_replica_falls_back_to_the_primary(database, tmp_path, monkeypatch):
+    from app.db import routing
+    from app.db.base import AsyncSessionLocal
+
+    router = routing.ReplicaRouter([f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}"], retry_after=60)
+    monkeypatch.setattr(routing, "replicas", router)
+
+    async with routing.read_session(1) as session:
+        assert _database(session) == "test.db"
+    assert router.status() == [{"replica": 0, "healthy": False}]
+    # While marked down the replica is not tried again.
+    assert routing.read_session_factory(1) is AsyncSessionLocal
+    await router.engines[0].dispose()
@@ -0,0 +1,81 @@
+"""
+Ticket search on SQLite's FTS5 tables: prefix and fuzzy matches, the indexes following
+updates and deletes, and no user ever seeing another user's tickets.
+"""
+import pytest
+
+from .conftest import login
+
+pytestmark = pytest.mark.anyio
+
+
+def _ticket(place: str, city: str, hotel: str) -> dict:
+    return {"place": place, "city": city, "hotel": hotel, "latitude": 56.95, "longitude": 24.11}
+
+
+async def _search(client, headers, q: str, mode: str = "prefix") -> list:
+    response = await client.get("/booking/search", headers=headers, params={"q": q, "mode": mode})
+    assert response.status_code == 200, response.text
+    return [ticket["hotel"] for ticket in response.json()]
+
+
+@pytest.fixture
+async def users(client):
+    alice, bob = await login(client), await login(client, "bob")
+    await client.post("/booking/batch", headers=alice, json=[
+        _ticket("Old Town", "Riga", "Neiburgs"),
+        _ticket("Užupis", "Vilnius", "Kempinski"),
+        _ticket("Kalamaja", "Tallinn", "Telegraaf"),
+    ])
+    await client.post("/booking/batch", headers=bob, json=[
+        _ticket("Old Town", "Riga", "Neiburgs Annex"),
+        _ticket("Centrs", "Riga", "Grand Palace"),
+    ])
+    return alice, bob
+
+
+async def test_prefix_search(client, users):
+    alice, _ = users
+    assert await _search(client, alice, "neib") == ["Neiburgs"]
+    assert await _search(client, alice, "RIG") == ["Neiburgs"]
+    # Every word has to match, in any field, without diacritics.
+    assert await _search(client, alice, "old rig") == ["Neiburgs"]
+    assert await _search(client, alice, "old tall") == []
+    assert await _search(client, alice, "uzup") == ["Kempinski"]
+    # Query syntax is taken as text.
+    assert await _search(client, alice, '"neib* OR') == []
+
+
+async def test_fuzzy_search_tolerates_typos(client, users):
+    alice, _ = users
+    assert await _search(client, alice, "neib", "prefix") == ["Neiburgs"]
+    assert (await _search(client, alice, "Nieburgs", "fuzzy"))[0] == "Neiburgs"
+    assert (await _search(client, alice, "telegraf talin", "fuzzy"))[0] == "Telegraaf"
+    assert await _search(client, alice, "Nieburgs", "prefix") == []
+
+
+async def test_users_only_find_their_own_tickets(client, users):
+    alice, bob = users
+    assert await _search(client, alice, "grand") == []
+    # Fuzzy matches may be loose, but only ever among the searcher's tickets.
+    assert set(await _search(client, alice, "grand palace centrs", "fuzzy")) <= {"Neiburgs", "Kempinski", "Telegraaf"}
+    assert await _search(client, alice, "Neiburgs Annex", "fuzzy") == ["Neiburgs"]
+    assert await _search(client, bob, "neib") == ["Neiburgs Annex"]
+    assert await _search(client, bob, "Neiburgs", "fuzzy") == ["Neiburgs Annex"]
+    # Owner ids are indexed, but never matched as search text.
+    assert await _search(client, alice, "1") == []
+    assert await _search(client, bob, "2") == []
+
+
+async def test_index_follows_updates_and_deletes(client, users):
+    alice, _ = users
+    ticket_id = (await client.get("/booking/", headers=alice)).json()[0]["id"]
+
+    await client.put(f"/booking/{ticket_id}", headers=alice, json={"hotel": "Bergs"})
+    assert await _search(client, alice, "neib") == []
+    assert await _search(client, alice, "berg") == ["Bergs"]
+    assert await _search(client, alice, "Bergz", "fuzzy") == ["Bergs"]
+
+    await client.delete(f"/booking/{ticket_id}", headers=alice)
+    assert await _search(client, alice, "berg") == []
+    assert await _search(client, alice, "Bergs", "fuzzy") == []
@@ -0,0 +1,40 @@
+"""
+Cold-start regression checks: heavy, rarely used dependencies stay out of the import
+of app.main, and the import stays within a time budget.
+"""
+import os
+
+import pytest
+
+from app.core.startup_profile import profile_startup
+
+# Loaded on first use only: folium for the map, pyarrow for Parquet files.
+LAZY_MODULES = ("folium", "branca", "jinja2", "requests", "pyarrow")
+
+# Generous, so that slow CI machines pass; override with COLD_START_BUDGET_SECONDS.
+COLD_START_BUDGET_SECONDS = float(os.environ.get("COLD_START_BUDGET_SECONDS", "3.0"))
+
+
+@pytest.fixture(scope="module")
+def profile():
+    environment = {"DATABASE_URL": "sqlite+aiosqlite:///:memory:", "SECRET_KEY": "startup-profile"}
+    missing = {name: value for name, value in environment.items() if name not in os.environ}
+    os.environ.update(missing)
+    try:
+        yield profile_startup()
+    finally:
+        for name in missing:
+            del os.environ[name]
+
+
+def test_first_request_succeeds(profile):
+    assert profile["status"] == 200
+
+
+def test_heavy_dependencies_load_lazily(profile):
+    loaded = {module["module"].split(".")[0] for module in profile["modules"]}
+    assert not loaded & set(LAZY_MODULES)
+
+
+def test_import_within_budget(profile):
+    assert profile["import_seconds"] < COLD_START_BUDGET_SECONDS
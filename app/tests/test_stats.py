@@ -0,0 +1,104 @@
+"""
+The ticket_stats summary kept by triggers matches a fresh GROUP BY over tickets after
+creates, updates moving tickets between cities and hotels, deletes and batch writes.
+"""
+import pytest
+from sqlalchemy import text
+
+from .conftest import login
+
+pytestmark = pytest.mark.anyio
+
+SUMMARY = """SELECT count(*) AS tickets, count(DISTINCT city) AS cities,
+    (SELECT count(*) FROM (SELECT DISTINCT city, hotel FROM tickets {where}) AS hotels) AS hotels,
+    avg(latitude) AS centroid_latitude, avg(longitude) AS centroid_longitude,
+    min(date(tm_created)) AS first_day, max(date(tm_created)) AS last_day
+FROM tickets {where}"""
+
+HOTELS = """SELECT city, hotel, count(*) AS tickets, avg(latitude) AS centroid_latitude,
+    avg(longitude) AS centroid_longitude
+FROM tickets {where} GROUP BY city, hotel"""
+
+
+def _ticket(city: str, hotel: str, latitude: float, longitude: float) -> dict:
+    return {"place": "p", "city": city, "hotel": hotel, "latitude": latitude, "longitude": longitude}
+
+
+async def _expected(database, query: str, customer_id=None) -> list:
+    where = "" if customer_id is None else f"WHERE customer_id = {int(customer_id)}"
+    async with database.connect() as connection:
+        return [dict(row._mapping) for row in await connection.execute(text(query.format(where=where)))]
+
+
+def _approx(rows: list) -> list:
+    return [{key: pytest.approx(value) if isinstance(value, float) else value for key, value in row.items()}
+            for row in rows]
+
+
+async def _assert_matches_tickets(client, database, headers, customer_id) -> None:
+    for scope, owner in (("user", customer_id), ("global", None)):
+        summary = (await client.get("/booking/stats", headers=headers, params={"scope": scope})).json()
+        assert summary == _approx(await _expected(database, SUMMARY, owner))[0]
+
+        hotels = (await client.get("/booking/stats/hotels", headers=headers, params={"scope": scope})).json()
+        expected = await _expected(database, HOTELS, owner)
+        key = lambda row: (row["city"], row["hotel"])
+        assert sorted(hotels, key=key) == _approx(sorted(expected, key=key))
+
+        cities = (await client.get("/booking/stats/cities", headers=headers, params={"scope": scope})).json()
+        per_city = {}
+        for row in expected:
+            per_city[row["city"]] = per_city.get(row["city"], 0) + row["tickets"]
+        assert {city["city"]: city["tickets"] for city in cities} == per_city
+
+    async with database.connect() as connection:
+        assert (await connection.execute(text("SELECT count(*) FROM ticket_stats WHERE tickets <= 0"))).scalar() == 0
+
+
+async def test_summary_follows_every_kind_of_write(client, database):
+    alice, bob = await login(client), await login(client, "bob")
+    created = (await client.post("/booking/batch", headers=alice, json=[
+        _ticket("Riga", "Neiburgs", 56.95, 24.11),
+        _ticket("Riga", "Neiburgs", 56.96, 24.12),
+        _ticket("Riga", "Bergs", 56.94, 24.13),
+        _ticket("Tallinn", "Telegraaf", 59.43, 24.74),
+    ])).json()
+    ids = [result["id"] for result in created]
+    single = (await client.post("/booking/", headers=alice, json=_ticket("Vilnius", "Kempinski", 54.68, 25.28))).json()
+    await client.post("/booking/batch", headers=bob, json=[_ticket("Riga", "Neiburgs", 56.97, 24.1)])
+    async with database.connect() as connection:
+        customer_id = (await connection.execute(text("SELECT id FROM users WHERE username = 'alice'"))).scalar()
+    await _assert_matches_tickets(client, database, alice, customer_id)
+
+    # Moves between hotels and cities, a coordinate change, and a no-op field.
+    await client.put(f"/booking/{ids[0]}", headers=alice, json={"hotel": "Bergs"})
+    await client.put("/booking/batch", headers=alice, json=[
+        {"id": ids[1], "city": "Tallinn", "hotel": "Telegraaf", "latitude": 59.44},
+        {"id": ids[3], "longitude": 24.75},
+        {"id": single["id"], "place": "renamed"},
+    ])
+    await _assert_matches_tickets(client, database, alice, customer_id)
+
+    # Deleting the last ticket of a group removes the group.
+    await client.delete(f"/booking/{single['id']}", headers=alice)
+    await client.delete("/booking/batch", headers=alice, params={"ids": [ids[2], ids[3]]})
+    await _assert_matches_tickets(client, database, alice, customer_id)
+    cities = (await client.get("/booking/stats/cities", headers=alice)).json()
+    assert {city["city"]: city["tickets"] for city in cities} == {"Riga": 1, "Tallinn": 1}
+
+
+async def test_recompute_starts_the_sums_over(client, database):
+    from app.db.checks import recompute_ticket_stats
+
+    headers = await login(client)
+    ids = [result["id"] for result in (await client.post("/booking/batch", headers=headers, json=[
+        _ticket("Riga", "Neiburgs", 56.95 + i / 1000, 24.11) for i in range(20)])).json()]
+    for ticket_id in ids[:10]:
+        await client.put(f"/booking/{ticket_id}", headers=headers, json={"latitude": 0.1, "longitude": 0.3})
+    before = (await client.get("/booking/stats", headers=headers)).json()
+
+    async with database.begin() as connection:
+        assert await connection.run_sync(recompute_ticket_stats) == 1
+    after = (await client.get("/booking/stats", headers=headers)).json()
+    assert after == _approx([before])[0]
+    assert after == _approx(await _expected(database, SUMMARY))[0]
@@ -0,0 +1,68 @@
+"""
+Delta sync: changed tickets and deleted ids after a cursor, read in one statement and
+paged across both in change order.
+"""
+import pytest
+
+from .conftest import login
+
+pytestmark = pytest.mark.anyio
+
+
+def _ticket(hotel: str) -> dict:
+    return {"place": "Old Town", "city": "Riga", "hotel": hotel, "latitude": 56.95, "longitude": 24.1}
+
+
+async def test_changes_interleave_updates_and_deletes(client):
+    headers = await login(client)
+    created = (await client.post("/booking/batch", headers=headers, json=[_ticket(f"h{i}") for i in range(4)])).json()
+    ids = [ticket["id"] for ticket in created]
+    await client.post("/booking/batch", headers=await login(client, "bob"), json=[_ticket("other")])
+
+    changes = (await client.get("/booking/changes", headers=headers)).json()
+    assert [ticket["id"] for ticket in changes["tickets"]] == ids
+    assert changes["tickets"][0]["hotel"] == "h0" and changes["tickets"][0]["tm_created"]
+    assert changes["deleted"] == [] and changes["has_more"] is False
+    since = changes["cursor"]
+
+    await client.delete(f"/booking/{ids[0]}", headers=headers)
+    await client.put(f"/booking/{ids[1]}", headers=headers, json={"hotel": "renamed"})
+    await client.delete(f"/booking/{ids[2]}", headers=headers)
+
+    page = (await client.get(f"/booking/changes?since={since}&limit=2", headers=headers)).json()
+    assert page["deleted"] == [ids[0]]
+    assert [(ticket["id"], ticket["hotel"]) for ticket in page["tickets"]] == [(ids[1], "renamed")]
+    assert page["cursor"] == since + 2 and page["has_more"] is True
+
+    page = (await client.get(f"/booking/changes?since={page['cursor']}&limit=2", headers=headers)).json()
+    assert page == {"tickets": [], "deleted": [ids[2]], "cursor": since + 3, "has_more": False}
+
+
+async def test_cursor_older_than_pruned_tombstones_must_resync(client):
+    from datetime import datetime, timedelta
+
+    from app.db.base import AsyncSessionLocal
+    from app.services.sync_service import prune_tombstones
+
+    headers = await login(client)
+    created = (await client.post("/booking/batch", headers=headers, json=[_ticket(f"h{i}") for i in range(3)])).json()
+    since = (await client.get("/booking/changes", headers=headers)).json()["cursor"]
+    await client.delete(f"/booking/{created[0]['id']}", headers=headers)
+    after_delete = (await client.get(f"/booking/changes?since={since}", headers=headers)).json()["cursor"]
+
+    async with AsyncSessionLocal() as db:
+        await prune_tombstones(db, datetime.utcnow() - timedelta(hours=1))
+    assert (await client.get(f"/booking/changes?since={since}", headers=headers)).json()["deleted"] == [
+        created[0]["id"]]
+
+    async with AsyncSessionLocal() as db:
+        await prune_tombstones(db, datetime.utcnow() + timedelta(seconds=5))
+    response = await client.get(f"/booking/changes?since={since}", headers=headers)
+    assert response.status_code == 410
+
+    # Cursors past the pruned deletion, and full syncs, are still served.
+    await client.delete(f"/booking/{created[1]['id']}", headers=headers)
+    changes = (await client.get(f"/booking/changes?since={after_delete}", headers=headers)).json()
+    assert changes["deleted"] == [created[1]["id"]]
+    changes = (await client.get("/booking/changes", headers=headers)).json()
+    assert [ticket["id"] for ticket in changes["tickets"]] == [created[2]["id"]]
@@ -1,30 +1,623 @@
-import requests
+import abc
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import httpx
 
-class ApiClient:
-    def __init__(self, base_url):
-        self.base_url = base_url
-        self.token = None
+DEFAULT_TIMEOUT = 10.0
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
 
-    def login(self, username, password):
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 5.0
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+# Log in again this many seconds before the access token expires.
+TOKEN_REFRESH_MARGIN = 30.0
+
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 1000
+DEFAULT_CONCURRENCY = 8
+
+
+class ApiError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None, detail: Any = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _token_expiry(token: str) -> Optional[float]:
+    """
+    The exp claim of a JWT, read without verifying the signature.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _chunks(items: List, size: int) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _json(response: httpx.Response) -> Any:
+    return response.json()
+
+
+def _page(response: httpx.Response) -> Tuple[List[Dict], Optional[str]]:
+    return response.json(), response.headers.get("X-Next-Cursor")
+
+
+def _text(response: httpx.Response) -> str:
+    return response.text
+
+
+class _BaseApiClient(abc.ABC):
+    """
+    Request building, retry policy and token handling shared by the sync and async clients.
+
+    Every endpoint method returns the parsed result on ApiClient and an awaitable of it
+    on AsyncApiClient.
+    """
+
+    def __init__(self, base_url: str, timeout: float = DEFAULT_TIMEOUT, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.token: Optional[str] = None
+        self.token_expires_at: Optional[float] = None
+        self._credentials: Optional[Tuple[str, str]] = None
+
+    @staticmethod
+    def _limits(max_connections: int, max_keepalive_connections: int) -> httpx.Limits:
+        return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+
+    def _set_token(self, response: httpx.Response) -> None:
+        result = response.json()
+        if "access_token" not in result:
+            raise ApiError("Invalid credentials", response.status_code, result)
+        self.token = result["access_token"]
+        self.token_expires_at = _token_expiry(self.token)
+
+    def _token_expiring(self) -> bool:
+        return (self._credentials is not None and self.token_expires_at is not None
+                and self.token_expires_at - time.time() < TOKEN_REFRESH_MARGIN)
+
+    def _headers(self, authenticated: bool) -> Dict[str, str]:
+        if authenticated and self.token:
+            return {"Authorization": f"Bearer {self.token}"}
+        return {}
+
+    def _retry_delay(self, method: str, attempt: int, response: Optional[httpx.Response] = None,
+                     error: Optional[httpx.TransportError] = None) -> Optional[float]:
+        """
+        Seconds to wait before retrying, or None when the request must not be retried.
+        Requests that may have reached the server are only retried if they are idempotent,
+        except for 429 and 503, which the server sends before doing any work.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if error is not None:
+            if method not in IDEMPOTENT_METHODS and not isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout,
+                                                                            httpx.PoolTimeout)):
+                return None
+        elif response.status_code not in RETRY_STATUSES:
+            return None
+        elif method not in IDEMPOTENT_METHODS and response.status_code not in (429, 503):
+            return None
+
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    @staticmethod
+    def _check(response: httpx.Response) -> httpx.Response:
+        if response.is_success:
+            return response
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        detail = body.get("detail") if isinstance(body, dict) else response.text
+        raise ApiError(f"Error: {response.status_code} {detail}", response.status_code, detail)
+
+    @abc.abstractmethod
+    def _call(self, method: str, path: str, parse: Callable[[httpx.Response], Any] = _json,
+              authenticated: bool = True, **kwargs):
+        """
+        Send a request with retries and token renewal and parse the response.
+
+        :param method:
+        :param path:
+        :param parse: Turns the successful response into the result.
+        :param authenticated: Whether to send the access token.
+        :param kwargs: Passed on to httpx.
+        :return: The parsed result, or an awaitable of it.
+        """
+
+    # Authentication
+
+    def register(self, username: str, email: str, password: str):
+        """
+        Creates a user account.
+
+        :param username:
+        :param email:
+        :param password:
+        :return: The created user.
+        """
+        return self._call("POST", "/auth/register", authenticated=False,
+                          json={"username": username, "email": email, "password": password})
+
+    # Tickets
+
+    def create_ticket(self, ticket: Dict):
+        return self._call("POST", "/booking/", json=ticket)
+
+    def create_tickets(self, tickets: List[Dict]):
+        """
+        Creates up to MAX_BATCH_SIZE tickets in one request.
+
+        :param tickets:
+        :return: One result per ticket, in input order.
+        """
+        return self._call("POST", "/booking/batch", json=tickets)
+
+    def list_tickets(self, limit: Optional[int] = MAX_PAGE_SIZE, after: Optional[str] = None,
+                     fields: Optional[Iterable[str]] = None):
+        """
+        One page of tickets ordered by creation time.
+
+        :param limit: Page size; None leaves it to the server's default.
+        :param after: Cursor returned with the previous page.
+        :param fields: Only return these ticket fields.
+        :return: (tickets, cursor of the next page or None).
+        """
+        params = {"limit": limit, "after": after, "fields": ",".join(fields) if fields else None}
+        return self._call("GET", "/booking/", parse=_page, params=params)
+
+    def get_ticket(self, ticket_id: int, fields: Optional[Iterable[str]] = None):
+        return self._call("GET", f"/booking/{ticket_id}",
+                          params={"fields": ",".join(fields) if fields else None})
+
+    def update_ticket(self, ticket_id: int, changes: Dict):
+        return self._call("PUT", f"/booking/{ticket_id}", json=changes)
+
+    def update_tickets(self, items: List[Dict]):
+        """
+        Updates up to MAX_BATCH_SIZE tickets in one request; each item carries its id.
+
+        :param items:
+        :return: One result per item, in input order.
+        """
+        return self._call("PUT", "/booking/batch", json=items)
+
+    def delete_ticket(self, ticket_id: int):
+        return self._call("DELETE", f"/booking/{ticket_id}")
+
+    def delete_tickets(self, ticket_ids: List[int]):
+        return self._call("DELETE", "/booking/batch", params={"ids": ticket_ids})
+
+    def filter_tickets(self, fields: Optional[Iterable[str]] = None, **filters):
+        """
+        Tickets matching all given place, city, hotel, latitude and longitude values.
+        """
+        params = {**filters, "fields": ",".join(fields) if fields else None}
+        return self._call("GET", "/booking/filter/filter", params=params)
+
+    def search_tickets(self, query: str, mode: str = "prefix", limit: int = 20, offset: int = 0):
+        return self._call("GET", "/booking/search",
+                          params={"q": query, "mode": mode, "limit": limit, "offset": offset})
+
+    def tickets_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+        return self._call("GET", "/booking/geo/bbox",
+                          params={"min_lat": min_lat, "min_lon": min_lon, "max_lat": max_lat, "max_lon": max_lon})
+
+    def tickets_in_radius(self, latitude: float, longitude: float, radius_km: float):
+        return self._call("GET", "/booking/geo/radius",
+                          params={"latitude": latitude, "longitude": longitude, "radius_km": radius_km})
+
+    def nearest_tickets(self, latitude: float, longitude: float, k: int = 10):
+        return self._call("GET", "/booking/geo/nearest", params={"latitude": latitude, "longitude": longitude, "k": k})
+
+    def stats(self, scope: str = "user"):
+        return self._call("GET", "/booking/stats", params={"scope": scope})
+
+    def city_stats(self, scope: str = "user", limit: int = 100):
+        return self._call("GET", "/booking/stats/cities", params={"scope": scope, "limit": limit})
+
+    def hotel_stats(self, scope: str = "user", city: Optional[str] = None, limit: int = 100):
+        return self._call("GET", "/booking/stats/hotels", params={"scope": scope, "city": city, "limit": limit})
+
+    def timeline(self, scope: str = "user", interval: str = "day", since: Optional[str] = None,
+                 until: Optional[str] = None):
+        return self._call("GET", "/booking/stats/timeline",
+                          params={"scope": scope, "interval": interval, "since": since, "until": until})
+
+    def changes(self, since: int = 0, limit: int = MAX_PAGE_SIZE):
+        """
+        One page of tickets changed and ids deleted since a cursor.
+
+        :param since: The cursor of the previous page or sync; 0 for every ticket.
+        :param limit:
+        :return: tickets, deleted, cursor and has_more.
+        """
+        return self._call("GET", "/booking/changes", params={"since": since, "limit": limit})
+
+    @staticmethod
+    def _merge_changes(page: Dict, changed: Dict[int, Dict], deleted: set) -> None:
+        for ticket in page["tickets"]:
+            changed[ticket["id"]] = ticket
+            deleted.discard(ticket["id"])
+        for ticket_id in page["deleted"]:
+            changed.pop(ticket_id, None)
+            deleted.add(ticket_id)
+
+    def map_html(self, zoom: Optional[int] = None):
+        return self._call("GET", "/booking/visualize/map", parse=_text, params={"zoom": zoom})
+
+    def import_file(self, content: bytes, file_format: str = "csv"):
+        """
+        Uploads a CSV or Parquet file with the columns of the export.
+
+        :param content:
+        :param file_format: 'csv' or 'parquet'.
+        :return: Counts of created, updated and not found tickets.
+        """
+        return self._call("POST", "/booking/import", params={"format": file_format},
+                          files={"file": (f"tickets.{file_format}", content)})
+
+
+class ApiClient(_BaseApiClient):
+    """
+    Blocking client over one pooled, keep-alive connection set. Safe to share between threads.
+    """
+
+    def __init__(self, base_url: str, timeout: float = DEFAULT_TIMEOUT, max_retries: int = MAX_RETRIES,
+                 max_connections: int = MAX_CONNECTIONS,
+                 max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+                 transport: Optional[httpx.BaseTransport] = None, **kwargs):
+        super().__init__(base_url, timeout, max_retries, **kwargs)
+        self._client = httpx.Client(base_url=self.base_url, timeout=timeout, transport=transport,
+                                    limits=self._limits(max_connections, max_keepalive_connections))
+        self._login_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self._client.close()
+
+    def login(self, username: str, password: str) -> None:
         """
-        Authenticates a user and returns an access token.
+        Authenticates a user and keeps the access token, and the credentials to renew it.
 
         :param username:
         :param password:
         :return:
         """
-        url = f"{self.base_url}/auth/token/"
-        data = {"username": username, "password": password}
+        response = self._send("POST", "/auth/token", authenticated=False,
+                              data={"username": username, "password": password})
+        self._set_token(response)
+        self._credentials = (username, password)
+
+    def _relogin(self, stale_token: Optional[str]) -> None:
+        with self._login_lock:
+            if self.token == stale_token:
+                self.login(*self._credentials)
+
+    def _send(self, method: str, path: str, authenticated: bool = True, stream: bool = False,
+              **kwargs) -> httpx.Response:
+        """
+        Send a request, renewing the token and retrying as the policy allows.
+        With stream=True a successful response is returned unread; close it when done.
+        """
+        if authenticated and self._token_expiring():
+            self._relogin(self.token)
+
+        attempt = 0
+        relogged = False
+        params = kwargs.pop("params", None)
+        if params is not None:
+            kwargs["params"] = {key: value for key, value in params.items() if value is not None}
+        while True:
+            token = self.token
+            try:
+                request = self._client.build_request(method, path, headers=self._headers(authenticated), **kwargs)
+                response = self._client.send(request, stream=stream)
+                if not response.is_success:
+                    response.read()
+            except httpx.TransportError as exc:
+                delay = self._retry_delay(method, attempt, error=exc)
+                if delay is None:
+                    raise ApiError(f"Error: {exc}") from exc
+            else:
+                if response.status_code == 401 and authenticated and self._credentials and not relogged:
+                    self._relogin(token)
+                    relogged = True
+                    continue
+                delay = self._retry_delay(method, attempt, response=response)
+                if delay is None:
+                    return self._check(response)
+            time.sleep(delay)
+            attempt += 1
+
+    def _call(self, method: str, path: str, parse: Callable[[httpx.Response], Any] = _json,
+              authenticated: bool = True, **kwargs):
+        return parse(self._send(method, path, authenticated, **kwargs))
+
+    def iter_tickets(self, page_size: int = MAX_PAGE_SIZE,
+                     fields: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        """
+        Every ticket, fetched page by page with the keyset cursor.
+
+        :param page_size:
+        :param fields:
+        :return:
+        """
+        after = None
+        while True:
+            tickets, after = self.list_tickets(page_size, after, fields)
+            yield from tickets
+            if after is None:
+                return
+
+    def sync_changes(self, since: int = 0) -> Tuple[List[Dict], List[int], int]:
+        """
+        Everything that changed since a cursor, page by page until caught up.
+
+        :param since: The cursor returned by the previous sync; 0 for every ticket.
+        :return: The current state of changed tickets, the ids of deleted tickets and the
+            cursor to sync from next time.
+        :raises ApiError: With status 410 if the cursor is too old to learn of every
+            deletion; sync from 0 and replace the local copy.
+        """
+        changed: Dict[int, Dict] = {}
+        deleted: set = set()
+        while True:
+            page = self.changes(since)
+            self._merge_changes(page, changed, deleted)
+            since = page["cursor"]
+            if not page["has_more"]:
+                return list(changed.values()), sorted(deleted), since
+
+    def stream_tickets(self, fields: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        """
+        Every ticket from the NDJSON stream, parsed as it arrives.
+        """
+        params = {"stream": "true", "fields": ",".join(fields) if fields else None}
+        response = self._send("GET", "/booking/", params=params, stream=True)
+        try:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+        finally:
+            response.close()
 
+    def export(self, destination, file_format: str = "csv") -> None:
+        """
+        Writes the export to a binary file object as it streams in.
+        """
+        response = self._send("GET", "/booking/export", params={"format": file_format}, stream=True)
         try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            result = response.json()
-            if 'access_token' in result:
-                self.token = result["access_token"]
+            for chunk in response.iter_bytes():
+                destination.write(chunk)
+        finally:
+            response.close()
+
+    def map_concurrent(self, function: Callable[[Any], Any], items: Iterable,
+                       concurrency: int = DEFAULT_CONCURRENCY) -> List:
+        """
+        Calls function on every item from a thread pool sharing this client's connections.
+
+        :param function: e.g. client.get_ticket.
+        :param items:
+        :param concurrency: At most this many requests in flight.
+        :return: The results in input order; the first failure is raised.
+        """
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(function, items))
+
+    def create_many(self, tickets: List[Dict], batch_size: int = MAX_BATCH_SIZE,
+                    concurrency: int = 1) -> List[Dict]:
+        """
+        Creates any number of tickets through the batch endpoint, batch_size per request.
+        """
+        batches = self.map_concurrent(self.create_tickets, list(_chunks(tickets, batch_size)), concurrency)
+        return [result for batch in batches for result in batch]
+
+    def get_many(self, ticket_ids: Iterable[int], concurrency: int = DEFAULT_CONCURRENCY) -> List[Dict]:
+        return self.map_concurrent(self.get_ticket, ticket_ids, concurrency)
+
+
+class AsyncApiClient(_BaseApiClient):
+    """
+    asyncio client over one pooled, keep-alive connection set.
+    """
+
+    def __init__(self, base_url: str, timeout: float = DEFAULT_TIMEOUT, max_retries: int = MAX_RETRIES,
+                 max_connections: int = MAX_CONNECTIONS,
+                 max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+                 transport: Optional[httpx.AsyncBaseTransport] = None, **kwargs):
+        super().__init__(base_url, timeout, max_retries, **kwargs)
+        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=timeout, transport=transport,
+                                         limits=self._limits(max_connections, max_keepalive_connections))
+        self._login_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def login(self, username: str, password: str) -> None:
+        """
+        Authenticates a user and keeps the access token, and the credentials to renew it.
+
+        :param username:
+        :param password:
+        :return:
+        """
+        response = await self._send("POST", "/auth/token", authenticated=False,
+                                    data={"username": username, "password": password})
+        self._set_token(response)
+        self._credentials = (username, password)
+
+    async def _relogin(self, stale_token: Optional[str]) -> None:
+        async with self._login_lock:
+            if self.token == stale_token:
+                await self.login(*self._credentials)
+
+    async def _send(self, method: str, path: str, authenticated: bool = True, stream: bool = False,
+                    **kwargs) -> httpx.Response:
+        """
+        Send a request, renewing the token and retrying as the policy allows.
+        With stream=True a successful response is returned unread; close it when done.
+        """
+        if authenticated and self._token_expiring():
+            await self._relogin(self.token)
+
+        attempt = 0
+        relogged = False
+        params = kwargs.pop("params", None)
+        if params is not None:
+            kwargs["params"] = {key: value for key, value in params.items() if value is not None}
+        while True:
+            token = self.token
+            try:
+                request = self._client.build_request(method, path, headers=self._headers(authenticated), **kwargs)
+                response = await self._client.send(request, stream=stream)
+                if not response.is_success:
+                    await response.aread()
+            except httpx.TransportError as exc:
+                delay = self._retry_delay(method, attempt, error=exc)
+                if delay is None:
+                    raise ApiError(f"Error: {exc}") from exc
             else:
-                raise Exception("Invalid credentials")
+                if response.status_code == 401 and authenticated and self._credentials and not relogged:
+                    await self._relogin(token)
+                    relogged = True
+                    continue
+                delay = self._retry_delay(method, attempt, response=response)
+                if delay is None:
+                    return self._check(response)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _call(self, method: str, path: str, parse: Callable[[httpx.Response], Any] = _json,
+                    authenticated: bool = True, **kwargs):
+        return parse(await self._send(method, path, authenticated, **kwargs))
+
+    async def iter_tickets(self, page_size: int = MAX_PAGE_SIZE,
+                           fields: Optional[Iterable[str]] = None) -> AsyncIterator[Dict]:
+        """
+        Every ticket, fetched page by page with the keyset cursor.
+
+        :param page_size:
+        :param fields:
+        :return:
+        """
+        after = None
+        while True:
+            tickets, after = await self.list_tickets(page_size, after, fields)
+            for ticket in tickets:
+                yield ticket
+            if after is None:
+                return
+
+    async def sync_changes(self, since: int = 0) -> Tuple[List[Dict], List[int], int]:
+        """
+        Everything that changed since a cursor, page by page until caught up.
+
+        :param since: The cursor returned by the previous sync; 0 for every ticket.
+        :return: The current state of changed tickets, the ids of deleted tickets and the
+            cursor to sync from next time.
+        :raises ApiError: With status 410 if the cursor is too old to learn of every
+            deletion; sync from 0 and replace the local copy.
+        """
+        changed: Dict[int, Dict] = {}
+        deleted: set = set()
+        while True:
+            page = await self.changes(since)
+            self._merge_changes(page, changed, deleted)
+            since = page["cursor"]
+            if not page["has_more"]:
+                return list(changed.values()), sorted(deleted), since
+
+    async def stream_tickets(self, fields: Optional[Iterable[str]] = None) -> AsyncIterator[Dict]:
+        """
+        Every ticket from the NDJSON stream, parsed as it arrives.
+        """
+        params = {"stream": "true", "fields": ",".join(fields) if fields else None}
+        response = await self._send("GET", "/booking/", params=params, stream=True)
+        try:
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+        finally:
+            await response.aclose()
+
+    async def export(self, destination, file_format: str = "csv") -> None:
+        """
+        Writes the export to a binary file object as it streams in.
+        """
+        response = await self._send("GET", "/booking/export", params={"format": file_format}, stream=True)
+        try:
+            async for chunk in response.aiter_bytes():
+                destination.write(chunk)
+        finally:
+            await response.aclose()
+
+    async def gather(self, calls: Iterable[Awaitable], concurrency: int = DEFAULT_CONCURRENCY) -> List:
+        """
+        Awaits the calls with at most concurrency of them in flight.
+
+        :param calls: e.g. client.get_ticket(i) for many i.
+        :param concurrency:
+        :return: The results in input order; the first failure is raised.
+        """
+        slots = asyncio.Semaphore(concurrency)
+
+        async def limited(call):
+            async with slots:
+                return await call
+
+        return await asyncio.gather(*(limited(call) for call in calls))
+
+    async def create_many(self, tickets: List[Dict], batch_size: int = MAX_BATCH_SIZE,
+                          concurrency: int = 1) -> List[Dict]:
+        """
+        Creates any number of tickets through the batch endpoint, batch_size per request.
+        """
+        batches = await self.gather((self.create_tickets(batch) for batch in _chunks(tickets, batch_size)),
+                                    concurrency)
+        return [result for batch in batches for result in batch]
 
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Error: {e}")
+    async def get_many(self, ticket_ids: Iterable[int], concurrency: int = DEFAULT_CONCURRENCY) -> List[Dict]:
+        return await self.gather((self.get_ticket(ticket_id) for ticket_id in ticket_ids), concurrency)
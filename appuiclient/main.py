@@ -1,9 +1,10 @@
 import sys
-import requests
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QLineEdit, QLabel, \
-    QFormLayout, QTableWidgetItem, QTableWidget, QStackedWidget, QHBoxLayout
-from PyQt5.QtCore import Qt
+    QFormLayout, QTableView, QStackedWidget, QHBoxLayout, QAbstractItemView, QHeaderView
+from PyQt5.QtCore import Qt, QThreadPool
 from api_client import ApiClient
+from ticket_model import TicketTableModel
+from workers import run_in_pool
 
 
 class MainWindow(QMainWindow):
@@ -15,16 +16,19 @@ class MainWindow(QMainWindow):
 
         self.stacked_widget = QStackedWidget()
 
+        self.tickets_page = QWidget()
         self.page1 = QWidget()
         self.page2 = QWidget()
         self.page3 = QWidget()
         self.page4 = QWidget()
         self.page5 = QWidget()
 
+        self.init_tickets_page()
         self.init_page1()
         self.init_page2()
         self.init_page3()
 
+        self.stacked_widget.addWidget(self.tickets_page)
         self.stacked_widget.addWidget(self.page1)
         self.stacked_widget.addWidget(self.page2)
         self.stacked_widget.addWidget(self.page3)
@@ -32,6 +36,8 @@ class MainWindow(QMainWindow):
         main_layout = QVBoxLayout()
 
         button_layout = QHBoxLayout()
+        tickets_button = QPushButton("Tickets")
+        tickets_button.clicked.connect(lambda: self.stacked_widget.setCurrentWidget(self.tickets_page))
         button1 = QPushButton("Page 1")
         button1.clicked.connect(lambda: self.stacked_widget.setCurrentWidget(self.page1))
         button2 = QPushButton("Page 2")
@@ -39,6 +45,7 @@ class MainWindow(QMainWindow):
         button3 = QPushButton("Page 3")
         button3.clicked.connect(lambda: self.stacked_widget.setCurrentWidget(self.page3))
 
+        button_layout.addWidget(tickets_button)
         button_layout.addWidget(button1)
         button_layout.addWidget(button2)
         button_layout.addWidget(button3)
@@ -51,6 +58,37 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(central_widget)
         self.init_ui()
 
+    def init_tickets_page(self):
+        layout = QVBoxLayout()
+
+        toolbar = QHBoxLayout()
+        refresh_button = QPushButton("Refresh")
+        self.tickets_status = QLabel()
+        toolbar.addWidget(refresh_button)
+        toolbar.addWidget(self.tickets_status)
+        toolbar.addStretch()
+
+        # The model loads pages on demand from a worker thread; the view only paints the
+        # visible rows, so large accounts neither block nor bloat the UI.
+        self.ticket_model = TicketTableModel(self.api_client, self)
+        self.ticket_model.loading_changed.connect(
+            lambda loading: self.tickets_status.setText("Loading..." if loading else
+                                                        f"{self.ticket_model.rowCount()} tickets loaded"))
+        self.ticket_model.failed.connect(lambda message: self.tickets_status.setText(f"Error: {message}"))
+        refresh_button.clicked.connect(self.ticket_model.refresh)
+
+        self.ticket_table = QTableView()
+        self.ticket_table.setModel(self.ticket_model)
+        self.ticket_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.ticket_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.ticket_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.ticket_table.verticalHeader().setVisible(False)
+        self.ticket_table.horizontalHeader().setStretchLastSection(True)
+
+        layout.addLayout(toolbar)
+        layout.addWidget(self.ticket_table)
+        self.tickets_page.setLayout(layout)
+
     def init_page1(self):
         layout = QVBoxLayout()
         layout.addWidget(QPushButton("Add Booking"))
@@ -114,13 +152,19 @@ class AuthWindow(QMainWindow):
     def handle_login(self):
         username, password = self.username_input.text(), self.password_input.text()
 
-        try:
-            self.api_client.login(username, password)
-            self.main_window = MainWindow(self.api_client)
-            self.main_window.show()
-            self.close()
-        except Exception as e:
-            self.error_label.setText(str(e))
+        self.login_button.setEnabled(False)
+        self.error_label.setText("")
+        run_in_pool(self.api_client.login, username, password,
+                    on_finished=self.login_succeeded, on_failed=self.login_failed)
+
+    def login_succeeded(self, _):
+        self.main_window = MainWindow(self.api_client)
+        self.main_window.show()
+        self.close()
+
+    def login_failed(self, message):
+        self.login_button.setEnabled(True)
+        self.error_label.setText(message)
 
 
 if __name__ == "__main__":
@@ -128,4 +172,7 @@ if __name__ == "__main__":
     api_client = ApiClient("http://127.0.0.1:8000")
     auth_window = AuthWindow(api_client)
     auth_window.show()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    QThreadPool.globalInstance().waitForDone()
+    api_client.close()
+    sys.exit(exit_code)
@@ -0,0 +1,169 @@
+from collections import OrderedDict
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+
+from workers import run_in_pool
+
+PAGE_SIZE = 200
+# Pages whose rows are kept; the least recently displayed page beyond this is dropped
+# and fetched again with its cursor if the view scrolls back to it.
+MAX_CACHED_PAGES = 20
+
+COLUMNS = ("id", "place", "city", "hotel", "latitude", "longitude", "tm_created")
+HEADERS = ("ID", "Place", "City", "Hotel", "Latitude", "Longitude", "Created")
+
+
+class TicketTableModel(QAbstractTableModel):
+    """
+    Table of the user's tickets, loaded a page at a time as the view scrolls.
+
+    The view asks for more rows through canFetchMore/fetchMore when the user nears the
+    end of what is loaded; each page is requested with the keyset cursor on a worker
+    thread, with only the displayed fields, and kept as compact tuples. At most
+    MAX_CACHED_PAGES pages keep their rows, so memory stays bounded however far the user
+    scrolls; the row count and the cursor of every page are kept, so a dropped page is
+    shown empty until it has been fetched again.
+    """
+
+    loading_changed = pyqtSignal(bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, api_client, parent=None):
+        super().__init__(parent)
+        self.api_client = api_client
+        self._reset_state()
+        # Pages requested before a reset are dropped when they arrive.
+        self._generation = 0
+
+    def _reset_state(self):
+        self._pages = OrderedDict()
+        # The cursor that fetches each page; the last one fetches the next new page.
+        self._cursors = [None]
+        self._sizes = []
+        self._row_count = 0
+        self._has_more = True
+        self._loading = False
+        self._reloading = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.TextAlignmentRole):
+            return None
+        row = self._row(index.row())
+        if row is None:
+            return None
+        value = row[index.column()]
+        if role == Qt.DisplayRole:
+            return "" if value is None else str(value)
+        if isinstance(value, (int, float)):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._set_loading(True)
+        generation = self._generation
+        run_in_pool(self.api_client.list_tickets, PAGE_SIZE, self._cursors[-1], COLUMNS,
+                    on_finished=lambda page: self._page_loaded(generation, page),
+                    on_failed=lambda message: self._page_failed(generation, message))
+
+    def refresh(self):
+        """
+        Drops the loaded rows and starts again from the first page.
+        """
+        self.beginResetModel()
+        self._generation += 1
+        was_loading = self._loading
+        self._reset_state()
+        if was_loading:
+            self.loading_changed.emit(False)
+        self.endResetModel()
+        self.fetchMore()
+
+    def ticket_id(self, row):
+        """
+        Id of the ticket in a row, or None while its page is not loaded.
+        """
+        values = self._row(row)
+        return None if values is None else values[0]
+
+    def _row(self, row):
+        number = row // PAGE_SIZE
+        page = self._pages.get(number)
+        if page is None:
+            self._reload(number)
+            return None
+        self._pages.move_to_end(number)
+        offset = row % PAGE_SIZE
+        return page[offset] if offset < len(page) else None
+
+    def _store(self, number, tickets):
+        self._pages[number] = [tuple(ticket.get(name) for name in COLUMNS) for ticket in tickets]
+        self._pages.move_to_end(number)
+        while len(self._pages) > MAX_CACHED_PAGES:
+            self._pages.popitem(last=False)
+
+    def _page_loaded(self, generation, page):
+        if generation != self._generation:
+            return
+        tickets, cursor = page
+        if tickets:
+            first = self._row_count
+            self.beginInsertRows(QModelIndex(), first, first + len(tickets) - 1)
+            self._store(len(self._sizes), tickets)
+            self._sizes.append(len(tickets))
+            self._row_count += len(tickets)
+            self.endInsertRows()
+        if cursor is not None:
+            self._cursors.append(cursor)
+        self._has_more = cursor is not None
+        self._set_loading(False)
+
+    def _reload(self, number):
+        """
+        Fetch a dropped page again with its cursor. Tickets created or deleted since may
+        shift its rows; the page keeps the size it had so the table does not jump.
+        """
+        if number in self._reloading or number >= len(self._sizes):
+            return
+        self._reloading.add(number)
+        generation = self._generation
+        run_in_pool(self.api_client.list_tickets, self._sizes[number], self._cursors[number], COLUMNS,
+                    on_finished=lambda page: self._page_reloaded(generation, number, page[0]),
+                    on_failed=lambda message: self._page_failed(generation, message, number))
+
+    def _page_reloaded(self, generation, number, tickets):
+        if generation != self._generation:
+            return
+        self._reloading.discard(number)
+        self._store(number, tickets)
+        first = number * PAGE_SIZE
+        self.dataChanged.emit(self.index(first, 0), self.index(first + self._sizes[number] - 1, len(COLUMNS) - 1))
+
+    def _page_failed(self, generation, message, number=None):
+        if generation != self._generation:
+            return
+        if number is None:
+            self._set_loading(False)
+        else:
+            self._reloading.discard(number)
+        self.failed.emit(message)
+
+    def _set_loading(self, loading):
+        if loading != self._loading:
+            self._loading = loading
+            self.loading_changed.emit(loading)
@@ -0,0 +1,53 @@
+import logging
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class Worker(QRunnable):
+    """
+    Runs a blocking call, such as an ApiClient request, on a QThreadPool thread.
+    The result or error message is delivered through signals on the UI thread.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        super().__init__()
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            logger.exception("Background call %s failed", getattr(self.function, "__qualname__", self.function))
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+
+def run_in_pool(function, *args, on_finished=None, on_failed=None, **kwargs) -> Worker:
+    """
+    Starts function(*args, **kwargs) on the global thread pool.
+
+    :param function:
+    :param args:
+    :param on_finished: Called with the result on the UI thread.
+    :param on_failed: Called with the error message on the UI thread.
+    :param kwargs:
+    :return:
+    """
+    worker = Worker(function, *args, **kwargs)
+    if on_finished is not None:
+        worker.signals.finished.connect(on_finished)
+    if on_failed is not None:
+        worker.signals.failed.connect(on_failed)
+    QThreadPool.globalInstance().start(worker)
+    return worker
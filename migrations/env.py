@@ -0,0 +1,70 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import DATABASE_URL
+from app.db.base import Base
+from app.models import user  # noqa: F401  registers the models on Base.metadata
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# Objects created by raw DDL in migrations rather than declared on the models.
+UNMANAGED_PREFIXES = ("tickets_fts", "ix_tickets_search_")
+
+
+def include_name(name, type_, parent_names) -> bool:
+    return not (name and name.startswith(UNMANAGED_PREFIXES))
+
+
+def run_migrations_offline() -> None:
+    """
+    Emit the migration SQL without connecting to the database.
+    """
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=DATABASE_URL.startswith("sqlite"),
+        include_name=include_name,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=connection.dialect.name == "sqlite",
+        include_name=include_name,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_migrations_online() -> None:
+    """
+    Run the migrations over an async connection.
+    """
+    engine = create_async_engine(DATABASE_URL)
+
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
@@ -0,0 +1,106 @@
+"""Indexes for the hot booking queries, unique usernames and the ticket geohash column.
+
+Creating the unique username index fails if duplicate usernames exist; resolve them first.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+# A frozen copy of the encoder the application used when this revision was written, so
+# the backfill does not change with later edits to app.services.geo_service.
+_GEOHASH_PRECISION = 9
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+TICKET_INDEXES = {
+    "ix_tickets_customer_id_id": ["customer_id", "id"],
+    "ix_tickets_customer_id_tm_created": ["customer_id", "tm_created"],
+    "ix_tickets_customer_id_place": ["customer_id", "place"],
+    "ix_tickets_customer_id_city": ["customer_id", "city"],
+    "ix_tickets_customer_id_hotel": ["customer_id", "hotel"],
+    "ix_tickets_customer_id_latitude_longitude": ["customer_id", "latitude", "longitude"],
+    "ix_tickets_customer_id_geohash": ["customer_id", "geohash"],
+}
+
+
+def _encode_geohash(latitude, longitude, precision=_GEOHASH_PRECISION):
+    if latitude is None or longitude is None:
+        return None
+
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars = []
+    bits = bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if longitude >= mid:
+                bits, lon_lo = bits * 2 + 1, mid
+            else:
+                bits, lon_hi = bits * 2, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                bits, lat_lo = bits * 2 + 1, mid
+            else:
+                bits, lat_hi = bits * 2, mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = bit_count = 0
+
+    return "".join(chars)
+
+
+def _backfill_geohash() -> None:
+    connection = op.get_bind()
+    tickets = sa.table("tickets", sa.column("id"), sa.column("latitude"), sa.column("longitude"),
+                       sa.column("geohash"))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(tickets.c.id, tickets.c.latitude, tickets.c.longitude)
+            .where(tickets.c.id > last_id)
+            .order_by(tickets.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            tickets.update().where(tickets.c.id == sa.bindparam("b_id")).values(geohash=sa.bindparam("v_geohash")),
+            [{"b_id": row.id, "v_geohash": _encode_geohash(row.latitude, row.longitude)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    with op.batch_alter_table("tickets") as batch_op:
+        batch_op.add_column(sa.Column("geohash", sa.String(length=12), nullable=True))
+
+    _backfill_geohash()
+
+    for name, columns in TICKET_INDEXES.items():
+        op.create_index(name, "tickets", columns)
+
+
+def downgrade() -> None:
+    for name in TICKET_INDEXES:
+        op.drop_index(name, table_name="tickets")
+
+    with op.batch_alter_table("tickets") as batch_op:
+        batch_op.drop_column("geohash")
+
+    op.drop_index("ix_users_username", table_name="users")
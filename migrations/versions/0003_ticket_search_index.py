@@ -0,0 +1,91 @@
+"""Text search index over ticket place, city and hotel.
+
+SQLite gets FTS5 tables kept in sync by triggers, Postgres pg_trgm and tsvector
+expression indexes.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# The searchable document. Kept as literal SQL so that Postgres matches it against
+# the expression indexes below.
+_DOCUMENT = "tickets.place || ' ' || tickets.city || ' ' || tickets.hotel"
+
+SQLITE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+        place, city, hotel, customer_id,
+        content='tickets', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts_trigram USING fts5(
+        place, city, hotel,
+        content='tickets', content_rowid='id',
+        tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_ai AFTER INSERT ON tickets BEGIN
+        INSERT INTO tickets_fts(rowid, place, city, hotel, customer_id)
+        VALUES (new.id, new.place, new.city, new.hotel, new.customer_id);
+        INSERT INTO tickets_fts_trigram(rowid, place, city, hotel)
+        VALUES (new.id, new.place, new.city, new.hotel);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_ad AFTER DELETE ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, place, city, hotel, customer_id)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel, old.customer_id);
+        INSERT INTO tickets_fts_trigram(tickets_fts_trigram, rowid, place, city, hotel)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tickets_fts_au AFTER UPDATE OF place, city, hotel, customer_id ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, place, city, hotel, customer_id)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel, old.customer_id);
+        INSERT INTO tickets_fts_trigram(tickets_fts_trigram, rowid, place, city, hotel)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel);
+        INSERT INTO tickets_fts(rowid, place, city, hotel, customer_id)
+        VALUES (new.id, new.place, new.city, new.hotel, new.customer_id);
+        INSERT INTO tickets_fts_trigram(rowid, place, city, hotel)
+        VALUES (new.id, new.place, new.city, new.hotel);
+    END""",
+    "INSERT INTO tickets_fts(tickets_fts) VALUES ('rebuild')",
+    "INSERT INTO tickets_fts_trigram(tickets_fts_trigram) VALUES ('rebuild')",
+]
+
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_tickets_search_tsv ON tickets USING gin (to_tsvector('simple', {_DOCUMENT}))",
+    f"CREATE INDEX IF NOT EXISTS ix_tickets_search_trgm ON tickets USING gin (({_DOCUMENT}) gin_trgm_ops)",
+]
+
+SQLITE_SEARCH_DROP = [
+    "DROP TRIGGER IF EXISTS tickets_fts_au",
+    "DROP TRIGGER IF EXISTS tickets_fts_ad",
+    "DROP TRIGGER IF EXISTS tickets_fts_ai",
+    "DROP TABLE IF EXISTS tickets_fts_trigram",
+    "DROP TABLE IF EXISTS tickets_fts",
+]
+
+POSTGRES_SEARCH_DROP = [
+    "DROP INDEX IF EXISTS ix_tickets_search_trgm",
+    "DROP INDEX IF EXISTS ix_tickets_search_tsv",
+]
+
+_DDL = {"sqlite": (SQLITE_SEARCH_DDL, SQLITE_SEARCH_DROP),
+        "postgresql": (POSTGRES_SEARCH_DDL, POSTGRES_SEARCH_DROP)}
+
+
+def upgrade() -> None:
+    create, _ = _DDL.get(op.get_bind().dialect.name, ([], []))
+    for statement in create:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    _, drop = _DDL.get(op.get_bind().dialect.name, ([], []))
+    for statement in drop:
+        op.execute(statement)
@@ -0,0 +1,134 @@
+"""Ticket summary table for the stats endpoints, kept current by triggers on tickets.
+
+The summary is backfilled from the existing tickets.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# ticket_stats holds one row per (customer, city, hotel, creation day). Triggers on
+# tickets keep it in step inside the writing transaction, so every write path, batch
+# endpoints included, maintains it, and reads aggregate groups instead of tickets.
+# Tickets without an owner or creation time are not counted. The backfill only runs
+# into an empty summary, so repeating the DDL is harmless.
+_SQLITE_ADD_NEW = """INSERT INTO ticket_stats (customer_id, city, hotel, day, tickets, latitude_sum, longitude_sum)
+        SELECT new.customer_id, new.city, new.hotel, date(new.tm_created), 1, new.latitude, new.longitude
+        WHERE new.customer_id IS NOT NULL AND new.tm_created IS NOT NULL
+        ON CONFLICT (customer_id, city, hotel, day) DO UPDATE SET
+            tickets = tickets + 1,
+            latitude_sum = latitude_sum + excluded.latitude_sum,
+            longitude_sum = longitude_sum + excluded.longitude_sum;"""
+
+_SQLITE_REMOVE_OLD = """UPDATE ticket_stats SET
+            tickets = tickets - 1,
+            latitude_sum = latitude_sum - old.latitude,
+            longitude_sum = longitude_sum - old.longitude
+        WHERE customer_id = old.customer_id AND city = old.city AND hotel = old.hotel
+            AND day = date(old.tm_created);
+        DELETE FROM ticket_stats
+        WHERE customer_id = old.customer_id AND city = old.city AND hotel = old.hotel
+            AND day = date(old.tm_created) AND tickets <= 0;"""
+
+SQLITE_STATS_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_ai AFTER INSERT ON tickets BEGIN
+        {_SQLITE_ADD_NEW}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_ad AFTER DELETE ON tickets BEGIN
+        {_SQLITE_REMOVE_OLD}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_au
+    AFTER UPDATE OF customer_id, city, hotel, latitude, longitude, tm_created ON tickets BEGIN
+        {_SQLITE_REMOVE_OLD}
+        {_SQLITE_ADD_NEW}
+    END""",
+    """INSERT INTO ticket_stats (customer_id, city, hotel, day, tickets, latitude_sum, longitude_sum)
+    SELECT customer_id, city, hotel, date(tm_created), count(*), sum(latitude), sum(longitude)
+    FROM tickets WHERE customer_id IS NOT NULL AND tm_created IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM ticket_stats)
+    GROUP BY customer_id, city, hotel, date(tm_created)""",
+]
+
+SQLITE_STATS_DROP = [
+    "DROP TRIGGER IF EXISTS ticket_stats_au",
+    "DROP TRIGGER IF EXISTS ticket_stats_ad",
+    "DROP TRIGGER IF EXISTS ticket_stats_ai",
+]
+
+POSTGRES_STATS_DDL = [
+    """CREATE OR REPLACE FUNCTION ticket_stats_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE ticket_stats SET
+                tickets = tickets - 1,
+                latitude_sum = latitude_sum - OLD.latitude,
+                longitude_sum = longitude_sum - OLD.longitude
+            WHERE customer_id = OLD.customer_id AND city = OLD.city AND hotel = OLD.hotel
+                AND day = OLD.tm_created::date;
+            DELETE FROM ticket_stats
+            WHERE customer_id = OLD.customer_id AND city = OLD.city AND hotel = OLD.hotel
+                AND day = OLD.tm_created::date AND tickets <= 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.customer_id IS NOT NULL AND NEW.tm_created IS NOT NULL THEN
+            INSERT INTO ticket_stats (customer_id, city, hotel, day, tickets, latitude_sum, longitude_sum)
+            VALUES (NEW.customer_id, NEW.city, NEW.hotel, NEW.tm_created::date, 1, NEW.latitude, NEW.longitude)
+            ON CONFLICT (customer_id, city, hotel, day) DO UPDATE SET
+                tickets = ticket_stats.tickets + 1,
+                latitude_sum = ticket_stats.latitude_sum + EXCLUDED.latitude_sum,
+                longitude_sum = ticket_stats.longitude_sum + EXCLUDED.longitude_sum;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS ticket_stats_maintain ON tickets",
+    """CREATE TRIGGER ticket_stats_maintain
+    AFTER INSERT OR DELETE OR UPDATE OF customer_id, city, hotel, latitude, longitude, tm_created ON tickets
+    FOR EACH ROW EXECUTE FUNCTION ticket_stats_apply()""",
+    """INSERT INTO ticket_stats (customer_id, city, hotel, day, tickets, latitude_sum, longitude_sum)
+    SELECT customer_id, city, hotel, tm_created::date, count(*), sum(latitude), sum(longitude)
+    FROM tickets WHERE customer_id IS NOT NULL AND tm_created IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM ticket_stats)
+    GROUP BY customer_id, city, hotel, tm_created::date""",
+]
+
+POSTGRES_STATS_DROP = [
+    "DROP TRIGGER IF EXISTS ticket_stats_maintain ON tickets",
+    "DROP FUNCTION IF EXISTS ticket_stats_apply()",
+]
+
+_DDL = {"sqlite": (SQLITE_STATS_DDL, SQLITE_STATS_DROP),
+        "postgresql": (POSTGRES_STATS_DDL, POSTGRES_STATS_DROP)}
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ticket_stats",
+        sa.Column("customer_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("city", sa.String(), nullable=False),
+        sa.Column("hotel", sa.String(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("tickets", sa.Integer(), nullable=False),
+        sa.Column("latitude_sum", sa.Float(), nullable=False),
+        sa.Column("longitude_sum", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("customer_id", "city", "hotel", "day"),
+    )
+
+    create, _ = _DDL.get(op.get_bind().dialect.name, ([], []))
+    for statement in create:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    _, drop = _DDL.get(op.get_bind().dialect.name, ([], []))
+    for statement in drop:
+        op.execute(statement)
+
+    op.drop_table("ticket_stats")
@@ -0,0 +1,42 @@
+"""Background job table.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("customer_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("params", sa.JSON(), nullable=False),
+        sa.Column("priority", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("worker", sa.String(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("media_type", sa.String(), nullable=True),
+        sa.Column("result", sa.LargeBinary(), nullable=True),
+        sa.Column("tm_created", sa.DateTime(), nullable=False),
+        sa.Column("tm_started", sa.DateTime(), nullable=True),
+        sa.Column("tm_finished", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_jobs_status_priority_id", "jobs", ["status", "priority", "id"])
+    op.create_index("ix_jobs_customer_id_id", "jobs", ["customer_id", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_jobs_customer_id_id", table_name="jobs")
+    op.drop_index("ix_jobs_status_priority_id", table_name="jobs")
+    op.drop_table("jobs")
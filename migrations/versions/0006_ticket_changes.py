@@ -0,0 +1,148 @@
+"""Change sequence numbers and tombstones for delta sync of tickets, kept by triggers.
+
+Existing tickets are numbered by id.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# Every insert, update and delete of a ticket takes the next number of its customer's
+# counter in ticket_change_counters: inserts and updates store it in tickets.change_seq,
+# deletes in a tombstone. Bumping the counter row locks it until commit, so a customer's
+# numbers become visible in order and a client that has seen everything up to N only
+# ever needs the rows above N. tm_updated could not serve as the cursor: it is unset
+# for tickets never updated and, taken at write time, not in commit order.
+# Existing tickets are numbered by id; repeating the DDL is harmless.
+_SQLITE_NEXT_SEQ = """INSERT INTO ticket_change_counters (customer_id, seq)
+        SELECT {row}.customer_id, 1 WHERE {row}.customer_id IS NOT NULL
+        ON CONFLICT (customer_id) DO UPDATE SET seq = seq + 1;"""
+
+_SQLITE_STAMP_NEW = """UPDATE tickets SET change_seq =
+            (SELECT seq FROM ticket_change_counters WHERE customer_id = new.customer_id)
+        WHERE id = new.id;"""
+
+_BACKFILL = [
+    "UPDATE tickets SET change_seq = id WHERE change_seq IS NULL",
+    """INSERT INTO ticket_change_counters (customer_id, seq)
+    SELECT customer_id, max(id) FROM tickets WHERE customer_id IS NOT NULL GROUP BY customer_id
+    ON CONFLICT (customer_id) DO NOTHING""",
+]
+
+SQLITE_SYNC_DDL = _BACKFILL + [
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_changes_ai AFTER INSERT ON tickets BEGIN
+        {_SQLITE_NEXT_SEQ.format(row="new")}
+        {_SQLITE_STAMP_NEW}
+        DELETE FROM ticket_tombstones WHERE id = new.id;
+    END""",
+    # Leaves change_seq out of the column list, so stamping a row does not fire it again.
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_changes_au
+    AFTER UPDATE OF place, city, hotel, latitude, longitude, tm_created, tm_updated, geohash, customer_id
+    ON tickets BEGIN
+        {_SQLITE_NEXT_SEQ.format(row="new")}
+        {_SQLITE_STAMP_NEW}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_changes_ad AFTER DELETE ON tickets BEGIN
+        {_SQLITE_NEXT_SEQ.format(row="old")}
+        INSERT OR REPLACE INTO ticket_tombstones (id, customer_id, change_seq, tm_deleted)
+        SELECT old.id, old.customer_id, seq, datetime('now')
+        FROM ticket_change_counters WHERE customer_id = old.customer_id;
+    END""",
+]
+
+SQLITE_SYNC_DROP = [
+    "DROP TRIGGER IF EXISTS ticket_changes_ad",
+    "DROP TRIGGER IF EXISTS ticket_changes_au",
+    "DROP TRIGGER IF EXISTS ticket_changes_ai",
+]
+
+POSTGRES_SYNC_DDL = [
+    """CREATE OR REPLACE FUNCTION ticket_changes_apply() RETURNS trigger AS $$
+    DECLARE
+        owner integer;
+        next_seq bigint;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            owner := OLD.customer_id;
+        ELSE
+            owner := NEW.customer_id;
+        END IF;
+        IF owner IS NOT NULL THEN
+            INSERT INTO ticket_change_counters AS counter (customer_id, seq) VALUES (owner, 1)
+            ON CONFLICT (customer_id) DO UPDATE SET seq = counter.seq + 1
+            RETURNING seq INTO next_seq;
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            IF owner IS NOT NULL THEN
+                INSERT INTO ticket_tombstones (id, customer_id, change_seq, tm_deleted)
+                VALUES (OLD.id, owner, next_seq, now() AT TIME ZONE 'utc')
+                ON CONFLICT (id) DO UPDATE SET
+                    customer_id = EXCLUDED.customer_id,
+                    change_seq = EXCLUDED.change_seq,
+                    tm_deleted = EXCLUDED.tm_deleted;
+            END IF;
+            RETURN OLD;
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+            DELETE FROM ticket_tombstones WHERE id = NEW.id;
+        END IF;
+        NEW.change_seq := next_seq;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS ticket_changes_seq ON tickets",
+] + _BACKFILL + [
+    """CREATE TRIGGER ticket_changes_seq BEFORE INSERT OR UPDATE OR DELETE ON tickets
+    FOR EACH ROW EXECUTE FUNCTION ticket_changes_apply()""",
+]
+
+POSTGRES_SYNC_DROP = [
+    "DROP TRIGGER IF EXISTS ticket_changes_seq ON tickets",
+    "DROP FUNCTION IF EXISTS ticket_changes_apply()",
+]
+
+_DDL = {"sqlite": (SQLITE_SYNC_DDL, SQLITE_SYNC_DROP),
+        "postgresql": (POSTGRES_SYNC_DDL, POSTGRES_SYNC_DROP)}
+
+
+def upgrade() -> None:
+    op.add_column("tickets", sa.Column("change_seq", sa.BigInteger(), nullable=True))
+    op.create_index("ix_tickets_customer_id_change_seq", "tickets", ["customer_id", "change_seq"])
+    op.create_table(
+        "ticket_change_counters",
+        sa.Column("customer_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True, autoincrement=False),
+        sa.Column("seq", sa.BigInteger(), nullable=False),
+    )
+    op.create_table(
+        "ticket_tombstones",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("customer_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("change_seq", sa.BigInteger(), nullable=False),
+        sa.Column("tm_deleted", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_ticket_tombstones_customer_id_change_seq", "ticket_tombstones",
+                    ["customer_id", "change_seq"])
+
+    create, _ = _DDL.get(op.get_bind().dialect.name, ([], []))
+    for statement in create:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    _, drop = _DDL.get(op.get_bind().dialect.name, ([], []))
+    for statement in drop:
+        op.execute(statement)
+
+    op.drop_index("ix_ticket_tombstones_customer_id_change_seq", table_name="ticket_tombstones")
+    op.drop_table("ticket_tombstones")
+    op.drop_table("ticket_change_counters")
+    op.drop_index("ix_tickets_customer_id_change_seq", table_name="tickets")
+    op.drop_column("tickets", "change_seq")
@@ -0,0 +1,109 @@
+"""Index the ticket owner together with the searchable text.
+
+SQLite's trigram FTS5 table gains an UNINDEXED customer_id to filter on inside the
+FTS5 scan; the Postgres GIN indexes lead with customer_id through btree_gin.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+_DOCUMENT = "tickets.place || ' ' || tickets.city || ' ' || tickets.hotel"
+
+_SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS tickets_fts_au",
+    "DROP TRIGGER IF EXISTS tickets_fts_ad",
+    "DROP TRIGGER IF EXISTS tickets_fts_ai",
+    "DROP TABLE IF EXISTS tickets_fts_trigram",
+]
+
+_SQLITE_TRIGGERS = [
+    """CREATE TRIGGER tickets_fts_ai AFTER INSERT ON tickets BEGIN
+        INSERT INTO tickets_fts(rowid, place, city, hotel, customer_id)
+        VALUES (new.id, new.place, new.city, new.hotel, new.customer_id);
+        INSERT INTO tickets_fts_trigram(rowid, {columns})
+        VALUES (new.id, {new});
+    END""",
+    """CREATE TRIGGER tickets_fts_ad AFTER DELETE ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, place, city, hotel, customer_id)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel, old.customer_id);
+        INSERT INTO tickets_fts_trigram(tickets_fts_trigram, rowid, {columns})
+        VALUES ('delete', old.id, {old});
+    END""",
+    """CREATE TRIGGER tickets_fts_au AFTER UPDATE OF place, city, hotel, customer_id ON tickets BEGIN
+        INSERT INTO tickets_fts(tickets_fts, rowid, place, city, hotel, customer_id)
+        VALUES ('delete', old.id, old.place, old.city, old.hotel, old.customer_id);
+        INSERT INTO tickets_fts_trigram(tickets_fts_trigram, rowid, {columns})
+        VALUES ('delete', old.id, {old});
+        INSERT INTO tickets_fts(rowid, place, city, hotel, customer_id)
+        VALUES (new.id, new.place, new.city, new.hotel, new.customer_id);
+        INSERT INTO tickets_fts_trigram(rowid, {columns})
+        VALUES (new.id, {new});
+    END""",
+]
+
+
+def _sqlite_ddl(customer_id: bool) -> list:
+    """
+    The trigram table, with or without customer_id, the triggers that keep both FTS5
+    tables in sync, and a rebuild of the trigram table.
+    """
+    columns = ["place", "city", "hotel"] + (["customer_id"] if customer_id else [])
+    values = {"columns": ", ".join(columns),
+              "old": ", ".join(f"old.{name}" for name in columns),
+              "new": ", ".join(f"new.{name}" for name in columns)}
+    trigram = f"""CREATE VIRTUAL TABLE tickets_fts_trigram USING fts5(
+        place, city, hotel,{' customer_id UNINDEXED,' if customer_id else ''}
+        content='tickets', content_rowid='id',
+        tokenize='trigram'
+    )"""
+    return ([trigram] + [trigger.format(**values) for trigger in _SQLITE_TRIGGERS]
+            + ["INSERT INTO tickets_fts_trigram(tickets_fts_trigram) VALUES ('rebuild')"])
+
+
+_POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS ix_tickets_search_trgm",
+    "DROP INDEX IF EXISTS ix_tickets_search_tsv",
+]
+
+
+def _postgres_ddl(customer_id: bool) -> list:
+    """
+    The tsvector and trigram indexes, led by customer_id or not.
+    """
+    leading = "customer_id, " if customer_id else ""
+    return [
+        f"CREATE INDEX ix_tickets_search_tsv ON tickets USING gin ({leading}to_tsvector('simple', {_DOCUMENT}))",
+        f"CREATE INDEX ix_tickets_search_trgm ON tickets USING gin ({leading}({_DOCUMENT}) gin_trgm_ops)",
+    ]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        statements = _SQLITE_DROP + _sqlite_ddl(customer_id=True)
+    elif dialect == "postgresql":
+        statements = ["CREATE EXTENSION IF NOT EXISTS btree_gin"] + _POSTGRES_DROP + _postgres_ddl(customer_id=True)
+    else:
+        statements = []
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        statements = _SQLITE_DROP + _sqlite_ddl(customer_id=False)
+    elif dialect == "postgresql":
+        statements = _POSTGRES_DROP + _postgres_ddl(customer_id=False)
+    else:
+        statements = []
+    for statement in statements:
+        op.execute(statement)
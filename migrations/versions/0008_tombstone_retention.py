@@ -0,0 +1,25 @@
+"""Prune ticket tombstones: remember the newest pruned change per customer.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("ticket_change_counters",
+                  sa.Column("pruned_seq", sa.BigInteger(), nullable=False, server_default="0"))
+    op.create_index("ix_ticket_tombstones_tm_deleted", "ticket_tombstones", ["tm_deleted"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ticket_tombstones_tm_deleted", table_name="ticket_tombstones")
+    op.drop_column("ticket_change_counters", "pruned_seq")